@@ -0,0 +1,203 @@
+# admission.py - Admission control, request deadlines and load shedding for detection
+
+import math
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """Detection is saturated and the wait queue is full (HTTP 429)"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Server is overloaded, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time before an expensive stage (HTTP 504)"""
+
+    def __init__(self, stage):
+        super().__init__(f"Request deadline exceeded before {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """Point in time after which a request's remaining work is abandoned"""
+
+    def __init__(self, seconds, controller=None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.controller = controller
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, stage):
+        """Raise DeadlineExceeded instead of starting stage once the deadline has passed"""
+        if self.expired:
+            if self.controller:
+                self.controller.record_expired(stage)
+            raise DeadlineExceeded(stage)
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=8, max_queue=16, default_deadline_seconds=30, max_deadline_seconds=300,
+                 max_background=None):
+        """
+        Bound the detections running at once and the requests waiting for them
+
+        Up to max_concurrent detections run together; up to max_queue more
+        wait for a slot. Further requests are shed at once with Overloaded
+        instead of piling up uploads in memory. A waiting request gives up
+        when its deadline passes, and callers check the deadline before each
+        expensive stage, so work for clients that have gone is not done.
+
+        Background work (jobs, bulk archives) passes no deadline: it waits
+        for a slot rather than being shed, but only max_background of the
+        slots at once, so the rest stay free for interactive requests. Its
+        waiters do not count against max_queue.
+
+        Args:
+            max_concurrent: Detections running at the same time
+            max_queue: Requests allowed to wait for a slot
+            default_deadline_seconds: Deadline for requests that do not send one
+            max_deadline_seconds: Longest deadline a client may ask for
+            max_background: Slots background work may hold at once (default: all)
+        """
+        self.max_concurrent = max_concurrent
+        self.max_background = max_concurrent if max_background is None else min(max_background, max_concurrent)
+        self.max_queue = max_queue
+        self.default_deadline_seconds = default_deadline_seconds
+        self.max_deadline_seconds = max_deadline_seconds
+
+        self._reset_after_fork()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Requests in flight in the parent do not exist in the child
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._waiting = 0
+        self._background_in_flight = 0
+        self._background_waiting = 0
+        self._admitted = 0
+        self._shed = 0
+        self._expired = Counter()
+        self._queue_wait_total = 0.0
+        self._service_total = 0.0
+        self._served = 0
+
+    def deadline(self, milliseconds=None):
+        """
+        Deadline for a request, from the client's remaining budget in
+        milliseconds (the default when None); ValueError if not positive
+        """
+        if milliseconds is None:
+            seconds = self.default_deadline_seconds
+        else:
+            seconds = float(milliseconds) / 1000
+            if not seconds > 0:
+                raise ValueError("Request deadline must be a positive number of milliseconds")
+        return Deadline(min(seconds, self.max_deadline_seconds), self)
+
+    def check_capacity(self):
+        """
+        Shed the request right away when it would not even get a place in the
+        queue; call before reading the upload body
+        """
+        with self._lock:
+            if self._in_flight >= self.max_concurrent and self._waiting >= self.max_queue:
+                self._shed += 1
+                raise Overloaded(self._retry_after())
+
+    @contextmanager
+    def slot(self, deadline=None):
+        """
+        Hold one of the max_concurrent detection slots
+
+        Raises Overloaded when the queue is full (only for requests with a
+        deadline) and DeadlineExceeded when the deadline passes while waiting.
+        Without a deadline the request is background work (max_background).
+        """
+        background = deadline is None
+        queued_at = time.monotonic()
+        with self._slot_free:
+            if self._full(background):
+                if background:
+                    self._background_waiting += 1
+                elif self._waiting >= self.max_queue:
+                    self._shed += 1
+                    raise Overloaded(self._retry_after())
+                else:
+                    self._waiting += 1
+                try:
+                    while self._full(background):
+                        timeout = None if background else deadline.remaining()
+                        if timeout is not None and timeout <= 0:
+                            self._expired['queue'] += 1
+                            raise DeadlineExceeded('queue')
+                        self._slot_free.wait(timeout)
+                finally:
+                    if background:
+                        self._background_waiting -= 1
+                    else:
+                        self._waiting -= 1
+            self._in_flight += 1
+            self._background_in_flight += background
+            self._admitted += 1
+            started = time.monotonic()
+            self._queue_wait_total += started - queued_at
+
+        try:
+            yield
+        finally:
+            with self._slot_free:
+                self._in_flight -= 1
+                self._background_in_flight -= background
+                self._served += 1
+                self._service_total += time.monotonic() - started
+                #Waiters differ in what they wait for, so wake them all to recheck
+                self._slot_free.notify_all()
+
+    def _full(self, background):
+        """Whether a request of this kind has to wait for a slot (lock held)"""
+        if background and self._background_in_flight >= self.max_background:
+            return True
+        return self._in_flight >= self.max_concurrent
+
+    def record_expired(self, stage):
+        with self._lock:
+            self._expired[stage] += 1
+
+    def _retry_after(self):
+        """Seconds until the queue has likely drained (lock held)"""
+        avg_service = self._service_total / self._served if self._served else 1.0
+        return max(1, math.ceil(avg_service * (self._waiting + 1) / max(self.max_concurrent, 1)))
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "max_background": self.max_background,
+                "default_deadline_ms": round(self.default_deadline_seconds * 1000),
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "background_in_flight": self._background_in_flight,
+                "background_waiting": self._background_waiting,
+                "admitted": self._admitted,
+                "shed": self._shed,
+                "expired": sum(self._expired.values()),
+                "expired_by_stage": dict(self._expired),
+                "avg_queue_wait_ms": round(self._queue_wait_total / self._admitted * 1000, 2) if self._admitted else 0,
+                "avg_service_ms": round(self._service_total / self._served * 1000, 2) if self._served else 0,
+                "retry_after_seconds": self._retry_after()
+            }
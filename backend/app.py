@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, Request
 from flask_cors import CORS
 import cv2
 import numpy as np
@@ -11,36 +11,242 @@ import logging
 import time
 from werkzeug.utils import secure_filename
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from collections import OrderedDict
+import zipfile
+import threading
+import secrets
 from brick_detector import BrickDetector
+from batch_scheduler import BatchScheduler
+from model_registry import ModelRegistry
+from inference_broker import SQLiteBroker, RemoteDetector, InferenceTimeout, InferenceFailed
+from admission import AdmissionController, Overloaded, DeadlineExceeded
+from result_renderer import ResultRenderer, RENDER_FORMATS
+from job_queue import JobQueue
+from upload_store import UploadStore
+from inventory_store import InventoryStore
+from recommendation_engine import RecommendationEngine
+from set_solver import BuildabilitySolver
+from part_catalog import PartCatalog
+from catalog_store import CatalogStore
+from http_cache import ResponseLayer
+from json_provider import FastJSONProvider
+from detections import DetectionArray
+
+class LegoRequest(Request):
+    """Request class allowing a larger body for bulk uploads"""
+    
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'analyze_batch':
+            return app.config['BULK_MAX_CONTENT_LENGTH']
+        return super().max_content_length
+
+class DetectorUnavailable(Exception):
+    """No detector is loaded, so an image could not be analysed (HTTP 503)"""
 
 #Initialize Flask app
 app = Flask(__name__)
+app.request_class = LegoRequest
+app.json = FastJSONProvider(app)  #orjson when installed; NumPy values serialize directly
 CORS(app)  #Enable CORS for all routes
 
 #Configuration
-app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  #16MB max file size
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
+app.config['BATCH_WINDOW_MS'] = float(os.environ.get('BATCH_WINDOW_MS', 5))  #Wait for concurrent requests
+app.config['BATCH_MAX_SIZE'] = int(os.environ.get('BATCH_MAX_SIZE', 8))  #1 disables micro-batching
+app.config['UPLOAD_MAX_BYTES'] = int(os.environ.get('UPLOAD_MAX_BYTES', 5 * 1024 ** 3))  #5GB of unreferenced uploads
+app.config['UPLOAD_MAX_AGE_SECONDS'] = int(os.environ.get('UPLOAD_MAX_AGE_SECONDS', 30 * 24 * 60 * 60))  #30 days
+app.config['DATA_FOLDER'] = os.environ.get('DATA_FOLDER', 'data')  #Local SQLite stores
+app.config['INVENTORY_POOL_SIZE'] = int(os.environ.get('INVENTORY_POOL_SIZE', 8))
+app.config['INVENTORY_MAX_PAGE_SIZE'] = 1000  #Largest allowed ?limit=
+app.config['CATALOG_FOLDER'] = os.environ.get('CATALOG_FOLDER', 'catalog')  #Rebrickable CSV dumps
+app.config['MAX_RECOMMENDATIONS'] = 20
+app.config['CATALOG_CACHE_SIZE'] = int(os.environ.get('CATALOG_CACHE_SIZE', 4096))  #Metadata records kept in memory
+app.config['CATALOG_MAX_BULK_IDS'] = 500  #Per /api/bricks or /api/sets request
+app.config['SOLVER_TIME_BUDGET_MS'] = int(os.environ.get('SOLVER_TIME_BUDGET_MS', 200))
+app.config['SOLVER_MAX_TIME_BUDGET_MS'] = 5000  #Largest allowed ?time_budget_ms=
+app.config['SOLVER_CACHE_SIZE'] = int(os.environ.get('SOLVER_CACHE_SIZE', 256))  #Solutions kept per objective/set_ids
+app.config['SYNC_RETENTION_SECONDS'] = int(os.environ.get('SYNC_RETENTION_SECONDS', 30 * 24 * 60 * 60))  #Older tokens resync fully
+app.config['SYNC_COMPACT_INTERVAL_SECONDS'] = 60 * 60
+app.config['SYNC_MAX_CHANGES'] = 5000  #Bigger deltas fall back to a full resync
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_TTL_SECONDS'] = int(os.environ.get('JOB_TTL_SECONDS', 24 * 60 * 60))  #Keep results for a day
+app.config['JOB_MAX_WAIT_SECONDS'] = 30  #Longest allowed long-poll
+app.config['JOB_AUTOSTART'] = os.environ.get('JOB_AUTOSTART', 'true').lower() == 'true'  #A pre-fork master leaves it to its workers
+app.config['BULK_MAX_IMAGES'] = int(os.environ.get('BULK_MAX_IMAGES', 500))  #Per bulk request
+app.config['BULK_MAX_WORKERS'] = int(os.environ.get('BULK_MAX_WORKERS', 4))  #Images detected in parallel
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  #Smaller bodies are sent as-is
+app.config['CATALOG_MAX_AGE_SECONDS'] = 24 * 60 * 60  #Brick/set metadata rarely changes
+app.config['MODELS_FOLDER'] = os.environ.get('MODELS_FOLDER', 'models')  #One subdirectory per model version
+app.config['ACTIVE_MODEL'] = os.environ.get('ACTIVE_MODEL')  #Default: newest version
+app.config['MODEL_MEMORY_BUDGET_MB'] = int(os.environ.get('MODEL_MEMORY_BUDGET_MB', 1024))  #Resident model versions
+app.config['DETECTOR_MODEL'] = os.environ.get('DETECTOR_MODEL', 'best.onnx')  #best_e2e.onnx from build_e2e_model.py also works
+app.config['CLASSIFIER_MODEL'] = os.environ.get('CLASSIFIER_MODEL', 'classifier.onnx')  #Part classifier, enables cascade mode if present
+app.config['CASCADE_EXIT_CONFIDENCE'] = float(os.environ.get('CASCADE_EXIT_CONFIDENCE', 0.8))  #Confident detector labels skip the classifier
+app.config['CLASSIFIER_THRESHOLD'] = float(os.environ.get('CLASSIFIER_THRESHOLD', 0.5))  #Lower classifier scores keep the detector label
+app.config['DETECTOR_THREADS'] = int(os.environ.get('DETECTOR_THREADS', 0))  #onnxruntime threads per model, 0 = all cores
+app.config['INFERENCE_BROKER'] = os.environ.get('INFERENCE_BROKER')  #Broker SQLite file: detection runs on inference_broker.py workers
+app.config['INFERENCE_TIMEOUT_SECONDS'] = float(os.environ.get('INFERENCE_TIMEOUT_SECONDS', 60))  #Wait for a remote worker
+app.config['ADMISSION_MAX_CONCURRENT'] = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 8))  #Detections running at once
+app.config['ADMISSION_MAX_QUEUE'] = int(os.environ.get('ADMISSION_MAX_QUEUE', 16))  #Requests waiting for a slot, more get 429
+app.config['ADMISSION_MAX_BACKGROUND'] = int(os.environ.get('ADMISSION_MAX_BACKGROUND', 4))  #Slots bulk and job detections may hold at once
+app.config['REQUEST_DEADLINE_MS'] = int(os.environ.get('REQUEST_DEADLINE_MS', 30000))  #Without an X-Request-Deadline-Ms header
+app.config['RENDER_CACHE_MB'] = int(os.environ.get('RENDER_CACHE_MB', 64))  #Rendered previews kept in memory
+app.config['RENDER_MAX_SIZE'] = 4096  #Largest allowed ?max_size= for previews
+app.config['MAX_IMAGE_SIZE'] = 16 * 1024 * 1024  #Per image inside a ZIP archive
+app.config['BULK_MAX_CONTENT_LENGTH'] = 512 * 1024 * 1024  #512MB max bulk request
 
-#Create upload directory if it doesn't exist
+#Create upload and data directories if they don't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['DATA_FOLDER'], exist_ok=True)
+
+#ETags, Cache-Control per endpoint and gzip/brotli compression for every response
+catalog_cache = f"public, max-age={app.config['CATALOG_MAX_AGE_SECONDS']}"
+response_layer = ResponseLayer(
+    app,
+    cache_rules={
+        'get_brick_metadata': catalog_cache,
+        'get_bricks_metadata': catalog_cache,
+        'get_set_metadata': catalog_cache,
+        'get_sets_metadata': catalog_cache,
+        'list_models': 'no-store',
+        'health_check': 'no-store',
+        'get_metrics': 'no-store',
+        'get_analysis_job': 'no-store',
+        'render_analysis': 'private, max-age=86400'  #Previews never change, the analysis can expire
+    },
+    min_size=app.config['COMPRESS_MIN_SIZE']
+)
 
 #Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize ONNX detector once at startup
-try:
-    detector = BrickDetector(
-        model_path='best.onnx',
+#Split deployment: this process only queues images, inference workers run the model
+inference_broker = SQLiteBroker(app.config['INFERENCE_BROKER']) if app.config['INFERENCE_BROKER'] else None
+
+def load_detector(spec):
+    """Load one model version: its detector plus a micro-batching scheduler when the model allows it"""
+    if inference_broker:
+        return RemoteDetector(inference_broker, model_version=spec['version'], timeout=app.config['INFERENCE_TIMEOUT_SECONDS'])
+    
+    model = BrickDetector(
+        model_path=spec['model_path'],
         conf_threshold=0.25,
-        iou_threshold=0.45
+        iou_threshold=0.45,
+        class_file=spec['class_file'],
+        classifier_path=spec['classifier_path'] if os.path.exists(spec['classifier_path']) else None,
+        classifier_class_file=spec['classifier_class_file'],
+        exit_confidence=app.config['CASCADE_EXIT_CONFIDENCE'],
+        classifier_threshold=app.config['CLASSIFIER_THRESHOLD'],
+        intra_op_threads=app.config['DETECTOR_THREADS']
+    )
+    
+    # Batch concurrent requests into one session.run when the model allows it
+    if model.supports_batching and app.config['BATCH_MAX_SIZE'] > 1:
+        logger.info(f"✅ Micro-batching enabled for {spec['version']} (max {app.config['BATCH_MAX_SIZE']}, window {app.config['BATCH_WINDOW_MS']}ms)")
+        return BatchScheduler(
+            model,
+            max_batch_size=app.config['BATCH_MAX_SIZE'],
+            window_ms=app.config['BATCH_WINDOW_MS']
+        )
+    return model
+
+def use_model(model):
+    """Point the detector globals at the newly active model version"""
+    global detector, batch_scheduler
+    batch_scheduler = model.runner if isinstance(model.runner, BatchScheduler) else None
+    detector = batch_scheduler.detector if batch_scheduler else model.runner
+
+# Versioned models, swapped at runtime without dropping in-flight requests
+detector = None
+batch_scheduler = None
+model_registry = ModelRegistry(
+    app.config['MODELS_FOLDER'],
+    load_detector,
+    memory_budget_mb=app.config['MODEL_MEMORY_BUDGET_MB'],
+    on_activate=use_model
+)
+if not model_registry.refresh():
+    #No versioned models installed: serve the single model from backend/ as "default"
+    model_registry.add(
+        'default',
+        app.config['DETECTOR_MODEL'],
+        classifier_path=app.config['CLASSIFIER_MODEL']
     )
-    logger.info("✅ Brick detector initialized successfully")
+
+# Initialize ONNX detector once at startup
+try:
+    model_registry.activate(app.config['ACTIVE_MODEL'] or model_registry.versions()[-1])
+    logger.info(f"✅ Brick detector initialized successfully (model {model_registry.active_version})")
 except Exception as e:
     logger.error(f"❌ Error initializing detector: {e}")
-    logger.warning("⚠️  API will run without detector - place best.onnx in backend/")
-    detector = None
+    logger.warning("⚠️  API will run without detector - place best.onnx in backend/ or a version in models/")
+
+#Admission control: bounded detection concurrency and queue, request deadlines
+admission = AdmissionController(
+    max_concurrent=app.config['ADMISSION_MAX_CONCURRENT'],
+    max_queue=app.config['ADMISSION_MAX_QUEUE'],
+    max_background=app.config['ADMISSION_MAX_BACKGROUND'],
+    default_deadline_seconds=app.config['REQUEST_DEADLINE_MS'] / 1000
+)
+
+#Content-addressed upload storage with background retention
+upload_store = UploadStore(
+    app.config['UPLOAD_FOLDER'],
+    max_bytes=app.config['UPLOAD_MAX_BYTES'],
+    max_age_seconds=app.config['UPLOAD_MAX_AGE_SECONDS']
+)
+
+def hold_upload_path(image_path):
+    """Keep a stored photo from being evicted while a saved analysis can render it"""
+    digest = upload_store.digest(image_path)
+    if digest:
+        upload_store.acquire(digest)
+
+def release_upload_path(image_path):
+    """Drop the reference taken with hold_upload_path()"""
+    digest = upload_store.digest(image_path)
+    if digest:
+        upload_store.release(digest)
+
+#Stored detections per analysis, drawn into previews on request
+result_renderer = ResultRenderer(
+    os.path.join(app.config['DATA_FOLDER'], 'analyses.db'),
+    cache_mb=app.config['RENDER_CACHE_MB'],
+    ttl_seconds=app.config['UPLOAD_MAX_AGE_SECONDS'],
+    on_save=hold_upload_path,
+    on_delete=release_upload_path
+)
+
+#Brick inventory (SQLite, pooled connections)
+inventory_store = InventoryStore(
+    os.path.join(app.config['DATA_FOLDER'], 'inventory.db'),
+    pool_size=app.config['INVENTORY_POOL_SIZE']
+)
+
+#Part number lookup for detected brick names
+part_catalog = PartCatalog(app.config['CATALOG_FOLDER'])
+
+#Brick and set metadata (SQLite with an LRU cache), refreshed when the dumps change
+catalog_store = CatalogStore(
+    os.path.join(app.config['DATA_FOLDER'], 'catalog.db'),
+    cache_size=app.config['CATALOG_CACHE_SIZE']
+)
+catalog_store.load_dumps_if_changed(app.config['CATALOG_FOLDER'])
+
+#Set recommendations (catalog loaded on first use, built-in sets if none installed)
+recommendation_engine = RecommendationEngine(app.config['CATALOG_FOLDER'])
+set_solver = BuildabilitySolver(recommendation_engine, time_budget_ms=app.config['SOLVER_TIME_BUDGET_MS'])
+
+#Last buildable-sets solution per objective and set_ids, reused while the inventory is
+#unchanged and used to warm start the next solve when it changes (LRU, latest version only)
+buildable_solutions = OrderedDict()
+buildable_solving = {}  #Key -> Future of the solve in progress, shared by concurrent requests
+buildable_lock = threading.Lock()  #Held for lookups and inserts only, never during a solve
 
 #HELPER FUNCTIONS
 
@@ -49,12 +255,58 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def file_extension(filename):
+    """Lowercase extension of an (already validated) file name"""
+    return secure_filename(filename).rsplit('.', 1)[1].lower()
+
 def handle_errors(f):
     """Decorator for consistent error handling"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         try:
             return f(*args, **kwargs)
+        except Overloaded as e:
+            logger.warning(f"Request shed: {str(e)}")
+            response = jsonify({
+                "success": False,
+                "error": "Server overloaded",
+                "details": str(e),
+                "code": "OVERLOADED"
+            })
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 429
+        except InferenceTimeout as e:
+            logger.error(f"Inference timed out: {str(e)}")
+            return jsonify({
+                "success": False,
+                "error": "No inference worker answered in time",
+                "details": str(e),
+                "code": "INFERENCE_TIMEOUT"
+            }), 504
+        except InferenceFailed as e:
+            logger.error(f"Inference failed: {str(e)}")
+            return jsonify({
+                "success": False,
+                "error": "Inference workers could not process the image",
+                "details": str(e),
+                "code": "INFERENCE_FAILED"
+            }), 503
+        except DetectorUnavailable as e:
+            logger.error(f"Detection unavailable: {str(e)}")
+            return jsonify({
+                "success": False,
+                "error": "Brick detector not available",
+                "details": str(e),
+                "code": "DETECTOR_NOT_INITIALIZED"
+            }), 503
+        except DeadlineExceeded as e:
+            logger.warning(f"Request abandoned: {str(e)}")
+            return jsonify({
+                "success": False,
+                "error": "Request deadline exceeded",
+                "details": str(e),
+                "code": "DEADLINE_EXCEEDED"
+            }), 504
         except FileNotFoundError as e:
             logger.error(f"File error: {str(e)}")
             return jsonify({
@@ -78,171 +330,100 @@ def handle_errors(f):
             }), 500
     return decorated_function
 
-def process_image_for_bricks(image_path):
+def process_image_for_bricks(image_path, model_version=None, deadline=None, analysis_id=None):
     """
     Process image using ONNX YOLOv8 model for brick detection
+    Uses the active model unless a model_version is pinned
+    Waits for an admission slot; with a deadline the request can be shed
+    (Overloaded) or abandoned (DeadlineExceeded) instead
+    With an analysis_id the raw detections are kept for rendering previews
+    Raises when detection did not run (DetectorUnavailable without a model),
+    so callers never mistake a failure for an image without bricks
     """
-    if detector is None:
-        logger.error("Detector not initialized - model file missing")
-        return []
-    
     try:
-        # Get raw detections from detector
-        raw_results = detector.detect_bricks(image_path)
+        with admission.slot(deadline), model_registry.acquire(model_version) as model:
+            if model is None:
+                raise DetectorUnavailable("Detector not initialized - model file missing")
+            
+            if deadline:
+                deadline.check('detection')
+            # Get raw detections from detector (batched with other requests if enabled)
+            if isinstance(model.runner, RemoteDetector):
+                #Waits for an inference worker no longer than the request may take
+                raw_results = model.runner.detect_bricks(image_path, deadline=deadline)
+            else:
+                raw_results = model.runner.detect_bricks(image_path)
         logger.info(f"Raw detections: {len(raw_results)} objects")
         
+        if analysis_id and isinstance(image_path, str):
+            save_for_rendering(analysis_id, image_path, raw_results)
+        
         # Group by brick type and color for accurate counting
         aggregated_results = aggregate_brick_detections(raw_results)
         
         logger.info(f"Aggregated: {len(aggregated_results)} unique brick types")
         return aggregated_results
         
+    except (Overloaded, DeadlineExceeded, DetectorUnavailable, InferenceTimeout, InferenceFailed):
+        raise
     except Exception as e:
         logger.error(f"Detection error: {str(e)}")
-        return []
+        raise
+
+def save_for_rendering(analysis_id, image_path, raw_detections):
+    """Store every detected box of an analysis; a failure only loses the preview"""
+    try:
+        if not isinstance(raw_detections, DetectionArray):
+            raw_detections = DetectionArray.from_dicts(raw_detections)
+        result_renderer.save(analysis_id, image_path, raw_detections)
+    except Exception as e:
+        logger.warning(f"⚠️  Could not store detections for rendering: {str(e)}")
 
 def aggregate_brick_detections(raw_detections):
     """
     Aggregate multiple detections of the same brick type
     Also map to Lego part numbers
+    
+    Takes the detector's DetectionArray or a list of detection dicts.
+    Detections may carry a 'quantity' (e.g. already aggregated results from
+    several images), otherwise each one counts as a single brick
     """
-    if not raw_detections:
+    if not len(raw_detections):
         return []
     
-    # Group by brick name and color
-    brick_groups = {}
-    
-    for detection in raw_detections:
-        brick_name = detection.get('name', 'Unknown')
-        color = detection.get('color', 'Unknown')
-        
-        # Create a unique key
-        key = f"{brick_name}_{color}"
-        
-        if key in brick_groups:
-            # Increment quantity
-            brick_groups[key]['quantity'] += 1
-            # Update confidence (use highest)
-            brick_groups[key]['confidence'] = max(
-                brick_groups[key]['confidence'], 
-                detection.get('confidence', 0.5)
-            )
-        else:
-            # Map to Lego part numbers
-            brick_id = map_brick_to_lego_id(brick_name)
-            
-            brick_groups[key] = {
-                'id': brick_id,
-                'name': brick_name,
-                'color': color,
-                'quantity': 1,
-                'confidence': detection.get('confidence', 0.5),
-                'bbox': detection.get('bbox', [0, 0, 100, 100])
-            }
+    if not isinstance(raw_detections, DetectionArray):
+        raw_detections = DetectionArray.from_dicts(raw_detections)
     
-    return list(brick_groups.values())
+    # Group by brick name and color, then build dicts once per group
+    return raw_detections.aggregate().to_dicts(part_id=map_brick_to_lego_id)
+
+def request_deadline():
+    """
+    Deadline for this request from the X-Request-Deadline-Ms header (the
+    client's remaining time budget) or REQUEST_DEADLINE_MS
+    Sheds the request first if detection is saturated. Call it before anything
+    reads request.values/form/files, which parses and spools the whole upload
+    """
+    admission.check_capacity()
+    return admission.deadline(request.headers.get('X-Request-Deadline-Ms'))
+
+def requested_model_version():
+    """Model version pinned with ?model_version= (None for the active one)"""
+    return model_registry.resolve(request.values.get('model_version') or None)
 
 def map_brick_to_lego_id(brick_name):
     """
     Map detected brick names to official Lego part numbers
-    This should match your class_names.txt exactly
-    """
-    # Clean the brick name
-    brick_name = brick_name.strip()
-    
-    # Complete Lego part number mapping
-    lego_id_map = {
-        # Basic bricks
-        '2x4 Brick': '3001',
-        '2x2 Brick': '3003',
-        '1x2 Plate': '3023',
-        '1x1 Brick': '3005',
-        '2x6 Brick': '2456',
-        '1x4 Brick': '3010',
-        
-        # More bricks
-        '1x2 Brick': '3004',
-        '1x3 Brick': '3622',
-        '1x6 Brick': '3009',
-        '2x2 Plate': '3022',
-        '2x3 Plate': '3021',
-        '2x4 Plate': '3020',
-        
-        # Special bricks
-        '2x4 Sloped Brick': '3039',
-        '2x2 Corner Brick': '2357',
-        
-        # Default fallbacks
-        'lego_brick': '3001',  # Generic brick
-        'Unknown': '0000',
-        'brick': '3001',
-    }
-    
-    if brick_name in lego_id_map:
-        return lego_id_map[brick_name]
-    
-    # Case-insensitive match
-    brick_name_lower = brick_name.lower()
-    for key, value in lego_id_map.items():
-        if key.lower() == brick_name_lower:
-            return value
-    
-    # Partial match
-    for key, value in lego_id_map.items():
-        if key.lower() in brick_name_lower or brick_name_lower in key.lower():
-            return value
-    
-    return '0000'  # Unknown brick
+    Names from class_names.txt match exactly, others by normalized name,
+    alias or fuzzy match; '0000' if nothing matches
+    """
+    return part_catalog.lookup(brick_name.strip())
 
 def suggest_sets_from_bricks(bricks):
     """
-    Simple set suggestion based on detected bricks
+    Sets the detected bricks get furthest towards (over 40% complete)
     """
-    # Mock data - in production, query a database
-    available_sets = {
-        "10698": {
-            "name": "Classic Creative Brick Box",
-            "required_bricks": ["3001", "3003", "3023", "3005"],
-            "total_pieces": 790,
-            "difficulty": "beginner"
-        },
-        "31134": {
-            "name": "Space Rocket",
-            "required_bricks": ["3001", "3004", "3622", "2456"],
-            "total_pieces": 837,
-            "difficulty": "intermediate"
-        },
-        "10302": {
-            "name": "Optimus Prime",
-            "required_bricks": ["3001", "3003", "3023", "2456", "3039"],
-            "total_pieces": 1508,
-            "difficulty": "advanced"
-        }
-    }
-    
-    suggestions = []
-    brick_ids = [b.get('id') for b in bricks]
-    
-    for set_id, set_info in available_sets.items():
-        required = set_info['required_bricks']
-        available = [bid for bid in brick_ids if bid in required]
-        completion = len(available) / len(required) * 100 if required else 0
-        
-        if completion > 40:  #Only suggest if we have at least 40% of required bricks
-            suggestions.append({
-                "set_id": set_id,
-                "name": set_info['name'],
-                "completion_percentage": round(completion),
-                "missing_pieces": len(required) - len(available),
-                "total_pieces": set_info['total_pieces'],
-                "difficulty": set_info['difficulty'],
-                "image_url": f"https://example.com/sets/{set_id}.jpg",
-                "estimated_build_time": "2-3 hours" if set_info['difficulty'] == 'beginner' else "3-4 hours"
-            })
-    
-    #Sort by completion percentage
-    suggestions.sort(key=lambda x: x['completion_percentage'], reverse=True)
-    return suggestions
+    return recommendation_engine.recommend(bricks, limit=5, min_completion=40)
 
 def get_image_metadata(filepath):
     """Get image metadata"""
@@ -268,11 +449,21 @@ def home():
         "endpoints": {
             "upload": "/api/upload",
             "analyze-photo": "/api/analyze-photo",
+            "analyze-batch": "/api/analyze-batch",
             "health": "/api/health",
             "inventory": "/api/inventory",
+            "inventory-summary": "/api/inventory/summary",
+            "inventory-sync": "/api/inventory/sync",
             "recommendations": "/api/recommendations",
+            "buildable_sets": "/api/buildable-sets",
             "brick": "/api/brick/<brick_id>",
-            "set": "/api/set/<set_id>"
+            "bricks": "/api/bricks?ids=<id,id,...>",
+            "set": "/api/set/<set_id>",
+            "sets": "/api/sets?ids=<id,id,...>",
+            "jobs": "/api/jobs",
+            "render": "/api/analyses/<analysis_id>/render",
+            "models": "/api/models",
+            "metrics": "/api/metrics"
         }
     })
 
@@ -293,6 +484,9 @@ def upload_image():
     Endpoint for uploading images for brick analysis
     Accepts both file uploads and base64 encoded images
     """
+    deadline = request_deadline()  #First: sheds before the body is parsed
+    model_version = requested_model_version()
+    
     #Check if request contains files
     if 'file' in request.files:
         file = request.files['file']
@@ -304,20 +498,22 @@ def upload_image():
             }), 400
         
         if file and allowed_file(file.filename):
-            #Save the file
-            timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-            filename = f"lego_scan_{timestamp}_{secure_filename(file.filename)}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            logger.info(f"File saved: {filepath}")
-            
-            #Process the image
-            results = process_image_for_bricks(filepath)
+            #Save the file (identical images are only stored once), held until processed
+            upload_id = upload_store.put(file.stream, file_extension(file.filename), hold=True)
+            try:
+                filepath = upload_store.path(upload_id)
+                
+                logger.info(f"File saved: {filepath}")
+                
+                #Process the image
+                results = process_image_for_bricks(filepath, model_version, deadline)
+            finally:
+                upload_store.release(upload_id)
             
             return jsonify({
                 "success": True,
-                "filename": filename,
+                "filename": os.path.basename(filepath),
+                "upload_id": upload_id,
                 "bricks_detected": len(results),
                 "results": results,
                 "timestamp": datetime.utcnow().isoformat()
@@ -329,8 +525,8 @@ def upload_image():
                 "details": f"Allowed formats: {', '.join(app.config['ALLOWED_EXTENSIONS'])}"
             }), 415
     
-    # heck for base64 encoded image
-    elif request.json and 'image' in request.json:
+    #Check for base64 encoded image
+    elif request.get_json(silent=True) and 'image' in request.json:
         image_data = request.json['image']
         
         #Remove data URL prefix if present
@@ -338,34 +534,37 @@ def upload_image():
             image_data = image_data.split(',')[1]
         
         try:
-            #Decode base64 image
+            #Decode base64 image and make sure it is a readable image
             image_bytes = base64.b64decode(image_data)
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            #Save the image
-            timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-            filename = f"lego_scan_{timestamp}.jpg"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            image.save(filepath)
-            
-            logger.info(f"Base64 image saved: {filepath}")
-            
-            #Process the image
-            results = process_image_for_bricks(filepath)
-            
-            return jsonify({
-                "success": True,
-                "filename": filename,
-                "bricks_detected": len(results),
-                "results": results,
-                "timestamp": datetime.utcnow().isoformat()
-            })
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                image_format = (image.format or 'jpeg').lower()
         except Exception as e:
             return jsonify({
                 "success": False,
                 "error": "Invalid base64 image",
                 "details": str(e)
             }), 400
+        
+        #Save the original bytes (identical images are only stored once), held until processed
+        upload_id = upload_store.put(image_bytes, 'jpg' if image_format == 'jpeg' else image_format, hold=True)
+        try:
+            filepath = upload_store.path(upload_id)
+            
+            logger.info(f"Base64 image saved: {filepath}")
+            
+            #Process the image (detection errors are handled by handle_errors)
+            results = process_image_for_bricks(filepath, model_version, deadline)
+        finally:
+            upload_store.release(upload_id)
+        
+        return jsonify({
+            "success": True,
+            "filename": os.path.basename(filepath),
+            "upload_id": upload_id,
+            "bricks_detected": len(results),
+            "results": results,
+            "timestamp": datetime.utcnow().isoformat()
+        })
     
     else:
         return jsonify({
@@ -381,124 +580,522 @@ def analyze_photo():
     Returns detailed metadata and statistics
     """
     start_time = time.time()
+    deadline = request_deadline()  #First: sheds before the body is parsed
+    fields, columnar = analysis_options()
+    model_version = requested_model_version()
     
+    #Validate and save the uploaded file
+    upload_id, timestamp, error_response = save_analysis_upload()
+    if error_response:
+        return error_response
+    
+    try:
+        #Without a model, detection raises DetectorUnavailable (503) only if a requested field needs it
+        analysis = run_photo_analysis(
+            upload_store.path(upload_id),
+            new_analysis_id(timestamp),
+            start_time,
+            merge_key=inventory_merge_key(upload_id),
+            fields=fields,
+            columnar=columnar,
+            model_version=model_version,
+            deadline=deadline
+        )
+    finally:
+        upload_store.release(upload_id)
+    
+    return jsonify({"success": True, **analysis})
+
+#Top-level sections of an analysis response, selectable with ?fields=
+ANALYSIS_FIELDS = (
+    'image_metadata', 'detection_summary', 'bricks', 'color_distribution',
+    'suggested_sets', 'timestamp', 'inventory_merge'
+)
+DETECTION_FIELDS = ('detection_summary', 'bricks', 'color_distribution', 'suggested_sets')
+
+def save_analysis_upload():
+    """
+    Validate the 'file' part of an analysis request and save it
+    Returns (upload_id, timestamp, error_response). A saved upload is held
+    (see UploadStore.put) and the caller must release it.
+    """
     #Check if request contains file
     if 'file' not in request.files:
-        return jsonify({
+        return None, None, (jsonify({
             "success": False,
             "error": "No file provided"
-        }), 400
+        }), 400)
     
     file = request.files['file']
     
     #Validate file
     if file.filename == '':
-        return jsonify({
+        return None, None, (jsonify({
             "success": False,
             "error": "No file selected"
-        }), 400
+        }), 400)
     
     if not allowed_file(file.filename):
-        return jsonify({
+        return None, None, (jsonify({
             "success": False,
             "error": f"File type not allowed. Allowed types: {', '.join(app.config['ALLOWED_EXTENSIONS'])}"
-        }), 415
+        }), 415)
     
-    #Secure filename and save
-    filename = secure_filename(file.filename)
+    #Save to the content-addressed upload store
     timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    unique_filename = f"analysis_{timestamp}_{filename}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-    file.save(filepath)
+    upload_id = upload_store.put(file.stream, file_extension(file.filename), hold=True)
+    
+    logger.info(f"Photo analysis saved: {upload_store.path(upload_id)}")
+    return upload_id, timestamp, None
+
+def new_analysis_id(timestamp):
+    """Unique analysis ID (previews are looked up by it)"""
+    return f"ana_{timestamp}_{secrets.token_hex(4)}"
+
+def inventory_merge_key(upload_id):
+    """
+    Idempotency key for merging an analysis into the inventory, or None
+    Merging is requested with merge_inventory=true (query or form). The key is
+    the client's upload_id if given, otherwise the image content hash.
+    """
+    merge = request.values.get('merge_inventory', '').lower() in ('true', '1')
+    if not merge:
+        return None
+    return request.values.get('upload_id') or upload_id
+
+def analysis_options():
+    """
+    Response shape requested for an analysis: (fields, columnar)
+    ?fields=a,b selects top-level sections (None means all of them) and
+    ?format=columnar returns bricks as parallel arrays
+    """
+    fields = request.values.get('fields')
+    if fields:
+        fields = {f.strip() for f in fields.split(',') if f.strip()}
+        unknown = fields - set(ANALYSIS_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(ANALYSIS_FIELDS)}")
+    else:
+        fields = None
+    
+    response_format = request.values.get('format', 'rows')
+    if response_format not in ('rows', 'columnar'):
+        raise ValueError("format must be 'rows' or 'columnar'")
+    return fields, response_format == 'columnar'
+
+def columnar_bricks(bricks):
+    """
+    Bricks as parallel arrays instead of one dict per brick
+    Names and colors are dictionary-encoded (values plus a code per brick)
+    and bboxes are flattened, four numbers per brick
+    """
+    names = {}
+    colors = {}
+    return {
+        "count": len(bricks),
+        "id": [b.get('id') for b in bricks],
+        "name": {
+            "codes": [names.setdefault(b.get('name'), len(names)) for b in bricks],
+            "values": list(names)
+        },
+        "color": {
+            "codes": [colors.setdefault(b.get('color'), len(colors)) for b in bricks],
+            "values": list(colors)
+        },
+        "quantity": [b.get('quantity', 1) for b in bricks],
+        "confidence": [b.get('confidence') for b in bricks],
+        "bbox": np.asarray([b.get('bbox', [0, 0, 0, 0]) for b in bricks]).reshape(-1)
+    }
+
+def run_photo_analysis(filepath, analysis_id, start_time=None, merge_key=None, fields=None, columnar=False,
+                       model_version=None, deadline=None):
+    """
+    Run detection, statistics and set suggestions for a saved photo
+    Shared by /api/analyze-photo and the background job workers
+    With a merge_key, detected bricks are also added to the inventory once.
+    Only the requested fields are computed (all when fields is None).
+    With a deadline, each expensive stage is skipped (DeadlineExceeded) once it has passed.
+    """
+    if start_time is None:
+        start_time = time.time()
+    
+    def wanted(field):
+        return fields is None or field in fields
     
-    logger.info(f"Photo analysis saved: {filepath}")
+    analysis = {"analysis_id": analysis_id}
     
     #Get image metadata
-    image_metadata = get_image_metadata(filepath)
+    if wanted('image_metadata'):
+        analysis['image_metadata'] = get_image_metadata(filepath)
+    
+    #Process for bricks (skipped if no requested field depends on them)
+    needs_detection = merge_key or any(wanted(f) for f in DETECTION_FIELDS)
+    bricks = []
+    detection_time = 0
+    if needs_detection:
+        detection_start = time.time()
+        bricks = process_image_for_bricks(filepath, model_version, deadline, analysis_id=analysis_id)
+        detection_time = (time.time() - detection_start) * 1000  #Convert to ms
+    
+    #Merge into the inventory in one transaction, at most once per key
+    #(detection errors have been raised above, so a failed run never uses up the key)
+    inventory_merge = None
+    if merge_key:
+        if deadline:
+            deadline.check('inventory_merge')
+        inventory_merge = inventory_store.merge_detections(merge_key, bricks)
+    
+    #Calculate statistics
+    if wanted('color_distribution') or wanted('detection_summary'):
+        color_distribution = {}
+        unique_types = set()
+        
+        for brick in bricks:
+            color = brick.get('color', 'Unknown')
+            color_distribution[color] = color_distribution.get(color, 0) + brick.get('quantity', 1)
+            unique_types.add(brick.get('id', ''))
+    
+    if wanted('detection_summary'):
+        analysis['detection_summary'] = {
+            "total_bricks": sum(b.get('quantity', 1) for b in bricks),
+            "unique_types": len(unique_types),
+            "detection_time_ms": round(detection_time, 2),
+            "total_processing_time_ms": round((time.time() - start_time) * 1000, 2)
+        }
+    if wanted('bricks'):
+        analysis['bricks'] = columnar_bricks(bricks) if columnar else bricks
+        if columnar:
+            analysis['format'] = 'columnar'
+    if wanted('color_distribution'):
+        analysis['color_distribution'] = color_distribution
+    
+    #Generate set suggestions based on bricks
+    if wanted('suggested_sets'):
+        if deadline:
+            deadline.check('suggested_sets')
+        analysis['suggested_sets'] = suggest_sets_from_bricks(bricks)[:5]  # Top 5
+    
+    if wanted('timestamp'):
+        analysis['timestamp'] = datetime.utcnow().isoformat()
+    if inventory_merge and wanted('inventory_merge'):
+        analysis['inventory_merge'] = inventory_merge
+    return analysis
+
+def run_analysis_job(payload):
+    """Background job handler for queued photo analyses"""
+    upload_id = payload['upload_id']
+    if detector is None:
+        raise RuntimeError("Brick detector not available")
+    
+    filepath = upload_store.path(upload_id)
+    if filepath is None:
+        raise FileNotFoundError(f"Upload '{upload_id}' no longer stored")
+    
+    fields = payload.get('fields')
+    return run_photo_analysis(
+        filepath,
+        payload['analysis_id'],
+        merge_key=payload.get('merge_key'),
+        fields=set(fields) if fields else None,
+        columnar=payload.get('columnar', False),
+        model_version=payload.get('model_version')
+    )
+
+def release_job_upload(payload):
+    """
+    Drop the reference that kept a job's image from being evicted while queued
+    Called once per job when it finishes, not per attempt, so retries after a
+    lease expiry do not release it twice.
+    """
+    upload_store.release(payload['upload_id'])
+
+job_queue = JobQueue(
+    os.path.join(app.config['DATA_FOLDER'], 'jobs.db'),
+    run_analysis_job,
+    num_workers=app.config['JOB_WORKERS'],
+    ttl_seconds=app.config['JOB_TTL_SECONDS'],
+    dumps=app.json.dumps,
+    on_finish=release_job_upload
+)
+
+#Pick up jobs left queued by a previous run now, not on the next submit or long-poll
+if app.config['JOB_AUTOSTART']:
+    job_queue.start()
+
+@app.route('/api/jobs', methods=['POST'])
+@handle_errors
+def submit_analysis_job():
+    """
+    Queue a photo analysis and return a job ID right away
+    Poll GET /api/jobs/<job_id> for the result
+    """
+    priority = request.form.get('priority', 0, type=int)
+    fields, columnar = analysis_options()
+    model_version = requested_model_version()
+    
+    upload_id, timestamp, error_response = save_analysis_upload()
+    if error_response:
+        return error_response
     
-    #Check if detector is available
     if detector is None:
+        upload_store.release(upload_id)
         return jsonify({
             "success": False,
             "error": "Brick detector not available",
             "code": "DETECTOR_NOT_INITIALIZED"
         }), 503
     
-    #Process for bricks
-    detection_start = time.time()
-    bricks = process_image_for_bricks(filepath)
-    detection_time = (time.time() - detection_start) * 1000  #Convert to ms
+    #The job keeps the upload's reference; release_job_upload drops it when the job finishes
+    try:
+        job_id = job_queue.submit(
+            {
+                "upload_id": upload_id,
+                "analysis_id": new_analysis_id(timestamp),
+                "merge_key": inventory_merge_key(upload_id),
+                "fields": sorted(fields) if fields else None,
+                "columnar": columnar,
+                "model_version": model_version
+            },
+            priority=priority
+        )
+    except Exception:
+        upload_store.release(upload_id)
+        raise
     
-    #Calculate statistics
-    color_distribution = {}
-    unique_types = set()
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "priority": priority,
+        "status_url": f"/api/jobs/{job_id}"
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@handle_errors
+def get_analysis_job(job_id):
+    """
+    Get job status and result
+    Pass ?wait=<seconds> to long-poll until the job finishes
+    """
+    wait = request.args.get('wait', 0, type=float)
+    wait = min(max(wait, 0), app.config['JOB_MAX_WAIT_SECONDS'])
     
-    for brick in bricks:
-        color = brick.get('color', 'Unknown')
-        color_distribution[color] = color_distribution.get(color, 0) + brick.get('quantity', 1)
-        unique_types.add(brick.get('id', ''))
+    job = job_queue.wait(job_id, wait) if wait else job_queue.get(job_id)
     
-    #Generate set suggestions based on bricks
-    suggested_sets = suggest_sets_from_bricks(bricks)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "error": f"Job '{job_id}' not found",
+            "details": "Unknown job ID, or the job expired"
+        }), 404
     
-    total_time = (time.time() - start_time) * 1000
+    return jsonify({"success": True, **job})
+
+def iter_bulk_images():
+    """
+    Yield (filename, image_bytes) for every image in a bulk request
+    Accepts several 'files' parts or one ZIP 'archive' part. ZIP members are
+    read one at a time straight from the upload, never extracted to disk.
+    """
+    count = 0
     
-    return jsonify({
+    def check_count():
+        if count > app.config['BULK_MAX_IMAGES']:
+            raise ValueError(f"Too many images, max {app.config['BULK_MAX_IMAGES']} per request")
+    
+    if 'archive' in request.files:
+        try:
+            archive = zipfile.ZipFile(request.files['archive'].stream)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Invalid ZIP archive: {e}")
+        
+        with archive:
+            for member in archive.infolist():
+                name = member.filename
+                if member.is_dir() or name.startswith('__MACOSX/') or not allowed_file(name):
+                    continue
+                if member.file_size > app.config['MAX_IMAGE_SIZE']:
+                    raise ValueError(f"Image '{name}' exceeds {app.config['MAX_IMAGE_SIZE'] // (1024 * 1024)}MB limit")
+                count += 1
+                check_count()
+                yield name, archive.read(member)
+    else:
+        for file in request.files.getlist('files'):
+            if not allowed_file(file.filename):
+                continue
+            count += 1
+            check_count()
+            yield file.filename, file.read()
+
+def detect_bulk_image(index, filename, image_bytes, model_version=None):
+    """Decode one bulk image in memory and detect bricks in it"""
+    started = time.time()
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    
+    if image is None:
+        return {
+            "type": "image",
+            "index": index,
+            "filename": filename,
+            "success": False,
+            "error": "Could not decode image"
+        }
+    
+    try:
+        results = process_image_for_bricks(image, model_version)
+    except Exception as e:
+        #Reported as a failed image, never as one without bricks
+        return {
+            "type": "image",
+            "index": index,
+            "filename": filename,
+            "success": False,
+            "error": f"Detection failed: {str(e)}"
+        }
+    return {
+        "type": "image",
+        "index": index,
+        "filename": filename,
         "success": True,
-        "analysis_id": f"ana_{timestamp}",
-        "image_metadata": image_metadata,
-        "detection_summary": {
-            "total_bricks": sum(b.get('quantity', 1) for b in bricks),
-            "unique_types": len(unique_types),
-            "detection_time_ms": round(detection_time, 2),
-            "total_processing_time_ms": round(total_time, 2)
-        },
-        "bricks": bricks,
-        "color_distribution": color_distribution,
-        "suggested_sets": suggested_sets[:5],  # Top 5
-        "timestamp": datetime.utcnow().isoformat()
-    })
+        "bricks_detected": len(results),
+        "results": results,
+        "detection_time_ms": round((time.time() - started) * 1000, 2)
+    }
+
+@app.route('/api/analyze-batch', methods=['POST'])
+@handle_errors
+def analyze_batch():
+    """
+    Bulk analysis of many photos in one request
+    Streams one NDJSON line per image as it finishes, then a summary line
+    with the brick count aggregated over the whole batch
+    """
+    if 'archive' not in request.files and not request.files.getlist('files'):
+        return jsonify({
+            "success": False,
+            "error": "No files provided",
+            "details": "Send several 'files' parts or one ZIP 'archive' part"
+        }), 400
+    
+    if detector is None:
+        return jsonify({
+            "success": False,
+            "error": "Brick detector not available",
+            "code": "DETECTOR_NOT_INITIALIZED"
+        }), 503
+    
+    max_workers = app.config['BULK_MAX_WORKERS']
+    model_version = requested_model_version()
+    
+    def generate():
+        start_time = time.time()
+        all_bricks = []
+        processed = 0
+        failed = 0
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = set()
+            images = enumerate(iter_bulk_images())
+            
+            try:
+                while True:
+                    #Only read the next image once there is room, so memory stays bounded
+                    for index, (filename, image_bytes) in images:
+                        pending.add(pool.submit(detect_bulk_image, index, filename, image_bytes, model_version))
+                        if len(pending) >= max_workers * 2:
+                            break
+                    
+                    if not pending:
+                        break
+                    
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        line = future.result()
+                        if line['success']:
+                            processed += 1
+                            all_bricks.extend(line['results'])
+                        else:
+                            failed += 1
+                        yield app.json.dumps(line) + '\n'
+            except Exception as e:
+                #Headers are already sent, so report the failure as the last line
+                if not isinstance(e, ValueError):
+                    logger.error(f"Bulk analysis error: {str(e)}")
+                for future in pending:
+                    future.cancel()
+                yield app.json.dumps({"type": "error", "success": False, "error": str(e)}) + '\n'
+                return
+        
+        bricks = aggregate_brick_detections(all_bricks)
+        yield app.json.dumps({
+            "type": "summary",
+            "success": True,
+            "images_processed": processed,
+            "images_failed": failed,
+            "total_bricks": sum(b['quantity'] for b in bricks),
+            "unique_types": len(set(b['id'] for b in bricks)),
+            "bricks": bricks,
+            "total_processing_time_ms": round((time.time() - start_time) * 1000, 2),
+            "timestamp": datetime.utcnow().isoformat()
+        }) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def encode_inventory_cursor(item):
+    """Opaque pagination cursor pointing after an inventory row"""
+    key = app.json.dumps([item['id'], item['color']])
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+def decode_inventory_cursor(cursor):
+    """Turn a cursor back into the (part_id, color) key it points after"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        part_id, color = app.json.loads(base64.urlsafe_b64decode(padded))
+        return str(part_id), str(color)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
 
 @app.route('/api/inventory', methods=['GET', 'POST', 'PUT', 'DELETE'])
 @handle_errors
 def manage_inventory():
     """Complete inventory management with CRUD operations"""
     
-    #Mock inventory data (in production, use a database)
-    mock_inventory = [
-        {"id": "3001", "name": "2x4 Brick", "color": "Red", "quantity": 15, "last_updated": "2024-01-15T10:30:00Z"},
-        {"id": "3003", "name": "2x2 Brick", "color": "Blue", "quantity": 12, "last_updated": "2024-01-15T10:30:00Z"},
-        {"id": "3023", "name": "1x2 Plate", "color": "Yellow", "quantity": 20, "last_updated": "2024-01-15T10:30:00Z"},
-        {"id": "3005", "name": "1x1 Brick", "color": "Green", "quantity": 8, "last_updated": "2024-01-15T10:30:00Z"},
-        {"id": "2456", "name": "2x6 Brick", "color": "Black", "quantity": 3, "last_updated": "2024-01-15T10:30:00Z"},
-    ]
-    
     if request.method == 'GET':
         #Get inventory with optional filtering
         color_filter = request.args.get('color')
         min_quantity = request.args.get('min_quantity', type=int)
         limit = request.args.get('limit', 50, type=int)
+        limit = min(max(limit, 1), app.config['INVENTORY_MAX_PAGE_SIZE'])
+        cursor = request.args.get('cursor')
         
-        #Apply filters
-        filtered = mock_inventory
-        if color_filter:
-            filtered = [item for item in filtered if item['color'].lower() == color_filter.lower()]
-        if min_quantity:
-            filtered = [item for item in filtered if item['quantity'] >= min_quantity]
+        #Nothing changed since the client's copy: skip the query and the body
+        etag = f"inventory-{inventory_store.version()}"
+        if request.if_none_match.contains_weak(etag):  #Compressed copies carry W/"..."
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
         
-        #Apply limit
-        filtered = filtered[:limit]
+        #Filters and keyset pagination run as indexed queries in the inventory store
+        filtered, has_more, version = inventory_store.page(
+            color=color_filter,
+            min_quantity=min_quantity,
+            limit=limit,
+            after=decode_inventory_cursor(cursor) if cursor else None
+        )
         
-        return jsonify({
+        response = jsonify({
             "success": True,
             "count": len(filtered),
             "inventory": filtered,
-            "summary": {
-                "total_bricks": sum(item['quantity'] for item in filtered),
-                "unique_colors": len(set(item['color'] for item in filtered)),
-                "unique_types": len(set(item['id'] for item in filtered))
-            }
+            "summary": inventory_store.summary(color=color_filter, min_quantity=min_quantity),
+            "version": version,
+            "has_more": has_more,
+            "next_cursor": encode_inventory_cursor(filtered[-1]) if has_more else None
         })
+        response.set_etag(f"inventory-{version}")
+        response.headers['Cache-Control'] = 'no-cache'  #Cache, but revalidate with If-None-Match
+        return response
     
     elif request.method == 'POST':
         #Add bricks to inventory
@@ -524,9 +1121,15 @@ def manage_inventory():
                     "success": False,
                     "error": "Each brick must have id, name, and quantity"
                 }), 400
+            if not isinstance(brick['quantity'], int) or brick['quantity'] < 0:
+                return jsonify({
+                    "success": False,
+                    "error": "Quantity must be a non-negative integer"
+                }), 400
         
-        #In production: Add to database
-        added_count = len(bricks)
+        #All bricks are added in one transaction
+        inventory_store.add_bricks(bricks)
+        added_count = sum(brick['quantity'] for brick in bricks)
         
         return jsonify({
             "success": True,
@@ -546,14 +1149,19 @@ def manage_inventory():
             }), 400
         
         updates = data['updates']
+        if not isinstance(updates, list) or not all('id' in u and 'quantity' in u for u in updates):
+            return jsonify({
+                "success": False,
+                "error": "Updates must be an array of objects with id and quantity"
+            }), 400
         
-        #In production: Update database
-        updated_count = len(updates)
+        #All updates are applied in one transaction
+        results = inventory_store.update_quantities(updates)
         
         return jsonify({
             "success": True,
-            "message": f"Updated {updated_count} brick(s)",
-            "updates": updates
+            "message": f"Updated {len(results)} brick(s)",
+            "updates": results
         })
     
     elif request.method == 'DELETE':
@@ -562,10 +1170,10 @@ def manage_inventory():
         
         if brick_ids:
             #Delete specific bricks
-            deleted_count = len(brick_ids)
+            inventory_store.delete_parts(brick_ids)
             return jsonify({
                 "success": True,
-                "message": f"Deleted {deleted_count} brick type(s) from inventory",
+                "message": f"Deleted {len(brick_ids)} brick type(s) from inventory",
                 "deleted_ids": brick_ids
             })
         else:
@@ -579,105 +1187,164 @@ def manage_inventory():
                     "warning": "This will delete ALL inventory data"
                 }), 400
             
+            inventory_store.clear()
             return jsonify({
                 "success": True,
                 "message": "Inventory cleared successfully"
             })
 
+@app.route('/api/inventory/summary', methods=['GET'])
+@handle_errors
+def get_inventory_summary():
+    """
+    Inventory totals from the incrementally maintained aggregates
+    Optional ?color= and ?part_id= add per-color and per-part totals
+    """
+    response = {
+        "success": True,
+        "summary": inventory_store.summary()
+    }
+    
+    color = request.args.get('color')
+    if color:
+        response['color'] = inventory_store.color_summary(color)
+    
+    part_id = request.args.get('part_id')
+    if part_id:
+        response['part'] = inventory_store.part_summary(part_id)
+    
+    return jsonify(response)
+
+@app.route('/api/inventory/sync', methods=['GET'])
+@handle_errors
+def sync_inventory():
+    """
+    Delta sync for mobile clients
+    Returns rows added, changed or deleted since ?token=, plus a new token.
+    Without a valid token the client must reload the full inventory.
+    """
+    token = request.args.get('token')
+    
+    #Keep the change log bounded; runs at most once per interval
+    inventory_store.compact_changes_if_due(
+        app.config['SYNC_RETENTION_SECONDS'],
+        app.config['SYNC_COMPACT_INTERVAL_SECONDS']
+    )
+    
+    changes = inventory_store.changes_since(token, max_changes=app.config['SYNC_MAX_CHANGES'])
+    
+    if changes['full_resync']:
+        return jsonify({
+            "success": True,
+            "full_resync": True,
+            "sync_token": changes['sync_token'],
+            "details": "Reload GET /api/inventory, then sync from this token"
+        })
+    
+    return jsonify({
+        "success": True,
+        "full_resync": False,
+        "sync_token": changes['sync_token'],
+        "upserted": changes['upserted'],
+        "deleted": changes['deleted'],
+        "count": len(changes['upserted']) + len(changes['deleted'])
+    })
+
 @app.route('/api/recommendations', methods=['GET'])
 @handle_errors
 def get_recommendations():
     """Get Lego set recommendations based on current inventory"""
     
     limit = request.args.get('limit', 5, type=int)
-    limit = min(limit, 20)  #Max 20 recommendations
-    
-    #Mock recommendations (in production, generate based on inventory)
-    mock_recommendations = [
-        {
-            "set_id": "10698",
-            "name": "Classic Creative Brick Box",
-            "completion_percentage": 85,
-            "missing_pieces": 12,
-            "total_pieces": 790,
-            "image_url": "https://example.com/sets/10698.jpg",
-            "estimated_build_time": "2-3 hours",
-            "difficulty": "beginner"
-        },
-        {
-            "set_id": "31134",
-            "name": "Space Rocket",
-            "completion_percentage": 72,
-            "missing_pieces": 23,
-            "total_pieces": 837,
-            "image_url": "https://example.com/sets/31134.jpg",
-            "estimated_build_time": "3-4 hours",
-            "difficulty": "intermediate"
-        },
-        {
-            "set_id": "10302",
-            "name": "Optimus Prime",
-            "completion_percentage": 45,
-            "missing_pieces": 56,
-            "total_pieces": 1508,
-            "image_url": "https://example.com/sets/10302.jpg",
-            "estimated_build_time": "5-6 hours",
-            "difficulty": "advanced"
-        }
-    ]
+    limit = min(max(limit, 1), app.config['MAX_RECOMMENDATIONS'])
+    min_completion = request.args.get('min_completion', 0, type=float)
+    
+    recommendations = recommendation_engine.recommend(
+        inventory_store.all_bricks(),
+        limit=limit,
+        min_completion=min_completion
+    )
     
     return jsonify({
-        "recommendations": mock_recommendations[:limit]
+        "recommendations": recommendations
     })
 
+@app.route('/api/buildable-sets', methods=['GET'])
+@handle_errors
+def get_buildable_sets():
+    """Find a combination of sets that can all be built at once from the inventory"""
+    
+    objective = request.args.get('objective', 'pieces')
+    time_budget_ms = request.args.get('time_budget_ms', app.config['SOLVER_TIME_BUDGET_MS'], type=int)
+    time_budget_ms = min(max(time_budget_ms, 0), app.config['SOLVER_MAX_TIME_BUDGET_MS'])
+    set_ids = request.args.get('set_ids')
+    candidates = [s.strip() for s in set_ids.split(',') if s.strip()] if set_ids else None
+    
+    key = (objective, tuple(candidates) if candidates else None)
+    version = inventory_store.version()
+    
+    while True:
+        with buildable_lock:
+            cached = buildable_solutions.get(key)
+            if cached:
+                buildable_solutions.move_to_end(key)
+                if cached['version'] >= version:
+                    return jsonify({"success": True, "cached": True, **cached['solution']})
+            solving = buildable_solving.get(key)
+            if solving is None:
+                solving = buildable_solving[key] = Future()
+                break
+        
+        #The same question is being solved: wait for that answer instead of solving again
+        solved_version, solution = solving.result()
+        if solved_version >= version:
+            return jsonify({"success": True, "cached": True, **solution})
+    
+    try:
+        solution = set_solver.solve(
+            inventory_store.all_bricks(),
+            objective=objective,
+            candidates=candidates,
+            time_budget_ms=time_budget_ms,
+            previous=cached['solution'] if cached else None
+        )
+    except Exception as e:
+        with buildable_lock:
+            del buildable_solving[key]
+        solving.set_exception(e)
+        raise
+    
+    with buildable_lock:
+        current = buildable_solutions.get(key)
+        if current is None or current['version'] <= version:
+            buildable_solutions[key] = {"version": version, "solution": solution}
+            buildable_solutions.move_to_end(key)
+            while len(buildable_solutions) > app.config['SOLVER_CACHE_SIZE']:
+                buildable_solutions.popitem(last=False)
+        del buildable_solving[key]
+    solving.set_result((version, solution))
+    
+    return jsonify({"success": True, "cached": False, **solution})
+
+def requested_ids():
+    """Comma-separated ?ids= list, deduplicated in request order"""
+    ids = list(dict.fromkeys(i.strip() for i in request.args.get('ids', '').split(',') if i.strip()))
+    if not ids:
+        raise ValueError("Query parameter 'ids' is required, e.g. ?ids=3001,3003")
+    if len(ids) > app.config['CATALOG_MAX_BULK_IDS']:
+        raise ValueError(f"Too many IDs, max {app.config['CATALOG_MAX_BULK_IDS']} per request")
+    return ids
+
 @app.route('/api/brick/<brick_id>', methods=['GET'])
 @handle_errors
 def get_brick_metadata(brick_id):
     """Get detailed metadata for a specific brick"""
     
-    #Mock data - in production, query a database
-    brick_database = {
-        "3001": {
-            "id": "3001",
-            "official_name": "Brick 2x4",
-            "alternate_names": ["2x4 Brick", "Basic Brick"],
-            "colors_available": ["Red", "Blue", "Yellow", "Green", "Black", "White", "Gray"],
-            "first_released": "1958",
-            "weight_g": 2.32,
-            "dimensions_mm": {"length": 31.8, "width": 15.9, "height": 9.6},
-            "sets_contained_in": ["10698", "11011", "10717"],
-            "category": "Basic Bricks",
-            "material": "ABS Plastic",
-            "description": "The classic 2x4 Lego brick, first produced in 1958."
-        },
-        "3003": {
-            "id": "3003",
-            "official_name": "Brick 2x2",
-            "alternate_names": ["2x2 Brick"],
-            "colors_available": ["Red", "Blue", "Yellow", "Green", "Black", "White"],
-            "first_released": "1958",
-            "weight_g": 1.05,
-            "dimensions_mm": {"length": 15.9, "width": 15.9, "height": 9.6},
-            "sets_contained_in": ["10698", "11011"],
-            "category": "Basic Bricks"
-        },
-        "3023": {
-            "id": "3023",
-            "official_name": "Plate 1x2",
-            "alternate_names": ["1x2 Plate"],
-            "colors_available": ["Red", "Blue", "Yellow", "Green", "Black", "White", "Gray"],
-            "first_released": "1963",
-            "weight_g": 0.42,
-            "dimensions_mm": {"length": 15.9, "width": 7.95, "height": 3.2},
-            "sets_contained_in": ["10698", "10717"],
-            "category": "Plates"
-        }
-    }
-    
-    if brick_id in brick_database:
+    brick = catalog_store.get('brick', brick_id)
+    if brick is not None:
         return jsonify({
             "success": True,
-            "brick": brick_database[brick_id]
+            "brick": brick
         })
     else:
         return jsonify({
@@ -685,58 +1352,30 @@ def get_brick_metadata(brick_id):
             "error": f"Brick ID '{brick_id}' not found"
         }), 404
 
+@app.route('/api/bricks', methods=['GET'])
+@handle_errors
+def get_bricks_metadata():
+    """Get metadata for many bricks in one request (?ids=3001,3003)"""
+    
+    ids = requested_ids()
+    found = catalog_store.get_many('brick', ids)
+    
+    return jsonify({
+        "success": True,
+        "bricks": [found[i] for i in ids if i in found],
+        "not_found": [i for i in ids if i not in found]
+    })
+
 @app.route('/api/set/<set_id>', methods=['GET'])
 @handle_errors
 def get_set_metadata(set_id):
     """Get detailed metadata for a Lego set"""
     
-    #Mock data - in production, query a database
-    set_database = {
-        "10698": {
-            "set_id": "10698",
-            "name": "Classic Creative Brick Box",
-            "year": 2023,
-            "pieces": 790,
-            "minifigures": 0,
-            "age_range": "4+",
-            "theme": "Classic",
-            "price_usd": 49.99,
-            "weight_kg": 1.2,
-            "dimensions_cm": {"length": 26.2, "width": 14.1, "height": 7.1},
-            "bricks_included": [
-                {"id": "3001", "quantity": 12, "color": "Red"},
-                {"id": "3001", "quantity": 8, "color": "Blue"},
-                {"id": "3003", "quantity": 10, "color": "Yellow"},
-                {"id": "3023", "quantity": 15, "color": "Green"}
-            ],
-            "build_time_minutes": 120,
-            "difficulty": "Beginner",
-            "description": "A creative brick box with ideas for multiple builds."
-        },
-        "31134": {
-            "set_id": "31134",
-            "name": "Space Rocket",
-            "year": 2023,
-            "pieces": 837,
-            "minifigures": 0,
-            "age_range": "7+",
-            "theme": "Space",
-            "price_usd": 59.99,
-            "bricks_included": [
-                {"id": "3001", "quantity": 15, "color": "White"},
-                {"id": "3004", "quantity": 8, "color": "Blue"},
-                {"id": "3622", "quantity": 6, "color": "Red"}
-            ],
-            "build_time_minutes": 180,
-            "difficulty": "Intermediate",
-            "description": "Build your own space rocket with detailed features."
-        }
-    }
-    
-    if set_id in set_database:
+    lego_set = catalog_store.get('set', set_id)
+    if lego_set is not None:
         return jsonify({
             "success": True,
-            "set": set_database[set_id]
+            "set": lego_set
         })
     else:
         return jsonify({
@@ -744,6 +1383,20 @@ def get_set_metadata(set_id):
             "error": f"Set ID '{set_id}' not found"
         }), 404
 
+@app.route('/api/sets', methods=['GET'])
+@handle_errors
+def get_sets_metadata():
+    """Get metadata for many sets in one request (?ids=10698,31134)"""
+    
+    ids = requested_ids()
+    found = catalog_store.get_many('set', ids)
+    
+    return jsonify({
+        "success": True,
+        "sets": [found[i] for i in ids if i in found],
+        "not_found": [i for i in ids if i not in found]
+    })
+
 @app.route('/api/version', methods=['GET'])
 def get_version():
     """Get API version information"""
@@ -755,13 +1408,103 @@ def get_version():
             "/api/health",
             "/api/upload",
             "/api/analyze-photo",
+            "/api/analyze-batch",
             "/api/inventory",
+            "/api/inventory/summary",
+            "/api/inventory/sync",
             "/api/recommendations",
+            "/api/buildable-sets",
             "/api/brick/{id}",
+            "/api/bricks?ids={ids}",
             "/api/set/{id}",
-            "/api/version"
+            "/api/sets?ids={ids}",
+            "/api/version",
+            "/api/jobs",
+            "/api/jobs/{id}",
+            "/api/analyses/{id}/render",
+            "/api/models",
+            "/api/models/active",
+            "/api/metrics"
         ],
-        "detector_status": "initialized" if detector else "not_available"
+        "detector_status": "initialized" if detector else "not_available",
+        "models": model_registry.get_stats()
+    })
+
+@app.route('/api/analyses/<analysis_id>/render', methods=['GET'])
+@handle_errors
+def render_analysis(analysis_id):
+    """
+    Photo of an analysis with every detected brick outlined
+    Rendered on first request for each max_size/format/quality and cached
+    """
+    max_size = request.args.get('max_size', 1024, type=int)
+    if not 16 <= max_size <= app.config['RENDER_MAX_SIZE']:
+        raise ValueError(f"max_size must be between 16 and {app.config['RENDER_MAX_SIZE']}")
+    image_format = request.args.get('format', 'jpeg').lower()
+    if image_format == 'jpg':
+        image_format = 'jpeg'
+    if image_format not in RENDER_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(RENDER_FORMATS)}")
+    quality = request.args.get('quality', 80, type=int)
+    if not 1 <= quality <= 100:
+        raise ValueError("quality must be between 1 and 100")
+    
+    #A render never changes, so a cached copy is answered without drawing anything
+    etag = f"{analysis_id}-{max_size}-{image_format}-{quality}"
+    if request.if_none_match.contains(etag) and result_renderer.exists(analysis_id):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
+    data, mimetype = result_renderer.render(analysis_id, max_size, image_format, quality)
+    response = Response(data, mimetype=mimetype)
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/models', methods=['GET'])
+def list_models():
+    """Installed model versions, the active one and resident memory use"""
+    model_registry.refresh()
+    return jsonify({"success": True, **model_registry.get_stats()})
+
+@app.route('/api/models/active', methods=['PUT'])
+@handle_errors
+def activate_model():
+    """
+    Hot-swap the default model version
+    The new version is loaded first; requests already running finish on the old one
+    """
+    data = request.get_json(silent=True) or {}
+    version = data.get('version')
+    if not version:
+        raise ValueError("'version' is required")
+    
+    model_registry.refresh()
+    previous = model_registry.activate(version)
+    logger.info(f"🔁 Active model switched from {previous} to {version}")
+    return jsonify({
+        "success": True,
+        "active": version,
+        "previous": previous
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Get runtime metrics for the detection pipeline"""
+    return jsonify({
+        "timestamp": datetime.utcnow().isoformat(),
+        "detector_status": "initialized" if detector else "not_available",
+        "detector": detector.get_stats() if detector else {"enabled": False},
+        "batching": batch_scheduler.get_stats() if batch_scheduler else {"enabled": False},
+        "admission": admission.get_stats(),
+        "broker": inference_broker.get_stats() if inference_broker else {"enabled": False},
+        "jobs": job_queue.get_stats(),
+        "uploads": upload_store.get_stats(),
+        "renders": result_renderer.get_stats(),
+        "recommendations": recommendation_engine.get_stats(),
+        "parts": part_catalog.get_stats(),
+        "catalog": catalog_store.get_stats(),
+        "http": response_layer.get_stats()
     })
 
 #ERROR HANDLERS
@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""
+Count bricks in every image under a folder, for back-office recounts
+
+Walks the folder tree, detects bricks with a pool of processes (the model is
+loaded once and shared with forked workers) or threads, and appends results
+as each image finishes:
+
+    jsonl  one line per image: path, bricks (part, color, quantity), timing
+    csv    one row per image and part/color (a row with an empty part for
+           images without bricks)
+    npz    columnar shards (<output>/part-00000.npz, ...) with every box:
+           image index, bbox, confidence, class and color codes
+
+A checkpoint (<output>.checkpoint) records finished images together with the
+output position after them. Running the same command again skips those
+images and drops anything written after the last checkpointed image, so an
+interrupted run resumes without duplicate or missing results. Images that
+failed are skipped too unless --retry-failed is given; a retried image is
+written again after its earlier error record. The run ends with brick counts
+per part and color over all images.
+
+Usage:
+    python -m batch_detect photos/ --output counts.jsonl [--workers 4] [--pool process|thread]
+    python -m batch_detect photos/ --output counts.csv
+    python -m batch_detect photos/ --output counts_npz --format npz
+    python -m batch_detect photos/ --output counts.jsonl --retry-failed
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from detections import DetectionArray
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+CSV_FIELDS = ['path', 'part_id', 'name', 'color', 'quantity', 'confidence', 'time_ms', 'error']
+SHARD_NAME = re.compile(r'part-(\d{5,})\.npz(\.tmp)?$')  #Only these files in an npz output folder are ours
+
+_detector = None  #Set before the pool starts; forked workers inherit the loaded model
+
+
+def find_images(root):
+    """Image paths under root, relative to it, in a stable order"""
+    images = []
+    for folder, subfolders, files in os.walk(root):
+        subfolders.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(os.path.relpath(os.path.join(folder, name), root))
+    return images
+
+
+def _init_worker(detector_options):
+    """Load the model in workers that were not forked from the parent"""
+    global _detector
+    from brick_detector import BrickDetector
+    _detector = BrickDetector(**detector_options)
+
+
+def detect_image(root, path):
+    """Detect one image: (path, DetectionArray or None, error, seconds)"""
+    started = time.perf_counter()
+    try:
+        detections = _detector.detect_bricks(os.path.join(root, path))
+        error = None
+    except Exception as e:
+        detections, error = None, str(e)
+    return path, detections, error, time.perf_counter() - started
+
+
+class Checkpoint:
+    def __init__(self, path):
+        """Finished images, one 'position<TAB>status<TAB>path' line each, appended as output is written"""
+        self.path = path
+        self._file = None
+
+    def load(self):
+        """(finished paths, paths whose last attempt failed, output position after the last one)"""
+        done, failed, position = set(), set(), 0
+        if not os.path.exists(self.path):
+            return done, failed, position
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break  #Cut off mid-write
+                offset, status, path = line.rstrip('\n').split('\t', 2)
+                #The latest attempt wins, so a retried image moves between the sets
+                if status == 'failed':
+                    failed.add(path)
+                    done.discard(path)
+                else:
+                    done.add(path)
+                    failed.discard(path)
+                position = int(offset)
+        return done, failed, position
+
+    def open(self):
+        """Create the checkpoint before any output, so a run stopped early still resumes"""
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def record(self, paths, position, failed=()):
+        self._file.write(''.join(
+            f"{position}\t{'failed' if path in failed else 'ok'}\t{path}\n" for path in paths
+        ))
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+
+class JsonlWriter:
+    def __init__(self, path, position, part_id):
+        self.file = open(path, 'a+', encoding='utf-8')
+        self.file.truncate(position)  #Drop results written after the last checkpoint
+        self.file.seek(position)
+        self.part_id = part_id
+
+    def add(self, path, detections, error, seconds):
+        """Write one image; returns (paths now stored, position to checkpoint)"""
+        record = {"path": path, "time_ms": round(seconds * 1000, 2)}
+        if error is None:
+            bricks = detections.aggregate().to_dicts(part_id=self.part_id)
+            record["detections"] = len(detections)
+            record["bricks"] = [
+                {"id": b['id'], "name": b['name'], "color": b['color'],
+                 "quantity": int(b['quantity']), "confidence": round(float(b['confidence']), 4)}
+                for b in bricks
+            ]
+        else:
+            record["error"] = error
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        return [path], self.file.tell()
+
+    def close(self):
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+    @staticmethod
+    def read_counts(path):
+        counts = Counter()
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                for brick in json.loads(line).get('bricks', []):
+                    counts[(brick['id'], brick['name'], brick['color'])] += brick['quantity']
+        return counts
+
+
+class CsvWriter:
+    def __init__(self, path, position, part_id):
+        self.file = open(path, 'a+', encoding='utf-8', newline='')
+        self.file.truncate(position)
+        self.file.seek(position)
+        self.writer = csv.writer(self.file)
+        if position == 0:
+            self.writer.writerow(CSV_FIELDS)
+        self.part_id = part_id
+
+    def add(self, path, detections, error, seconds):
+        time_ms = round(seconds * 1000, 2)
+        if error is not None:
+            rows = [[path, '', '', '', 0, '', time_ms, error]]
+        else:
+            rows = [
+                [path, b['id'], b['name'], b['color'], int(b['quantity']),
+                 round(float(b['confidence']), 4), time_ms, '']
+                for b in detections.aggregate().to_dicts(part_id=self.part_id)
+            ] or [[path, '', '', '', 0, '', time_ms, '']]
+        self.writer.writerows(rows)
+        self.file.flush()
+        return [path], self.file.tell()
+
+    def close(self):
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+    @staticmethod
+    def read_counts(path):
+        counts = Counter()
+        with open(path, encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                if row['part_id']:
+                    counts[(row['part_id'], row['name'], row['color'])] += int(row['quantity'])
+        return counts
+
+
+class NpzWriter:
+    def __init__(self, folder, position, part_id, shard_size=500):
+        """Columnar shards; position is the number of complete shards"""
+        os.makedirs(folder, exist_ok=True)
+        for name in os.listdir(folder):
+            #Shards beyond the checkpoint (or half written) are redone; other files are left alone
+            match = SHARD_NAME.match(name)
+            if match and (match.group(2) or int(match.group(1)) >= position):
+                os.remove(os.path.join(folder, name))
+        self.folder = folder
+        self.shards = position
+        self.shard_size = shard_size
+        self.pending = []
+
+    def add(self, path, detections, error, seconds):
+        self.pending.append((path, detections, error, seconds))
+        if len(self.pending) < self.shard_size:
+            return [], self.shards
+        return self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return [], self.shards
+        paths = [p for p, _, _, _ in self.pending]
+        results = [d if d is not None else DetectionArray(np.zeros((0, 4)), [], [], []) for _, d, _, _ in self.pending]
+        class_names = sorted({name for d in results for name in d.class_names})
+        color_names = sorted({name for d in results for name in d.color_names})
+        class_index = {name: i for i, name in enumerate(class_names)}
+        color_index = {name: i for i, name in enumerate(color_names)}
+
+        # Codes are per image; map them onto the shard's shared name tables
+        def recode(codes, names, index):
+            table = np.array([index[name] for name in names], dtype=np.int32)
+            return table[codes] if len(codes) else codes
+
+        arrays = {
+            "paths": np.array(paths, dtype=str),
+            "errors": np.array([e or '' for _, _, e, _ in self.pending], dtype=str),
+            "time_ms": np.array([s * 1000 for _, _, _, s in self.pending], dtype=np.float32),
+            "image_index": np.repeat(np.arange(len(results), dtype=np.int32), [len(d) for d in results]),
+            "bbox": np.concatenate([d.bbox for d in results]),
+            "confidence": np.concatenate([d.confidence for d in results]),
+            "class_code": np.concatenate([recode(d.class_code, d.class_names, class_index) for d in results]),
+            "color_code": np.concatenate([recode(d.color_code, d.color_names, color_index) for d in results]),
+            "class_names": np.array(class_names, dtype=str),
+            "color_names": np.array(color_names, dtype=str)
+        }
+        shard_path = os.path.join(self.folder, f"part-{self.shards:05d}.npz")
+        with open(shard_path + '.tmp', 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(shard_path + '.tmp', shard_path)
+
+        self.shards += 1
+        self.pending = []
+        return paths, self.shards
+
+    def close(self):
+        return self._flush()
+
+    @staticmethod
+    def read_counts(folder, part_id):
+        counts = Counter()
+        for name in sorted(os.listdir(folder)):
+            match = SHARD_NAME.match(name)
+            if not match or match.group(2):
+                continue
+            with np.load(os.path.join(folder, name), allow_pickle=False) as shard:
+                detections = DetectionArray(
+                    shard['bbox'], shard['confidence'], shard['class_code'], shard['color_code'],
+                    class_names=shard['class_names'].tolist(), color_names=shard['color_names'].tolist()
+                )
+            for brick in detections.aggregate().to_dicts(part_id=part_id):
+                counts[(brick['id'], brick['name'], brick['color'])] += int(brick['quantity'])
+        return counts
+
+
+class Progress:
+    def __init__(self, total, done, stream=sys.stderr):
+        """Progress bar with images/sec and ETA (a line every few seconds when not a terminal)"""
+        self.total = total
+        self.done = done
+        self.new = 0
+        self.failed = 0
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.last_shown = 0.0
+        self.interactive = stream.isatty()
+
+    def update(self, failed=False):
+        self.done += 1
+        self.new += 1
+        self.failed += failed
+        now = time.perf_counter()
+        if now - self.last_shown >= (0.2 if self.interactive else 5) or self.done == self.total:
+            self.last_shown = now
+            self.show(now)
+
+    def show(self, now):
+        rate = self.new / (now - self.started) if now > self.started else 0
+        remaining = (self.total - self.done) / rate if rate else 0
+        filled = int(30 * self.done / self.total) if self.total else 30
+        line = (f"[{'#' * filled}{'.' * (30 - filled)}] {self.done}/{self.total} "
+                f"{rate:6.1f} img/s  ETA {int(remaining // 60)}:{int(remaining % 60):02d}"
+                f"{f'  {self.failed} failed' if self.failed else ''}")
+        self.stream.write(('\r' + line) if self.interactive else (line + '\n'))
+        if self.interactive and self.done == self.total:
+            self.stream.write('\n')
+        self.stream.flush()
+
+
+def output_format(output, requested=None):
+    if requested:
+        return requested
+    extension = os.path.splitext(output)[1].lower()
+    return {'.jsonl': 'jsonl', '.csv': 'csv', '.npz': 'npz', '': 'npz'}.get(extension, 'jsonl')
+
+
+def run_batch(root, output, detector, output_format_name='jsonl', workers=1, pool='process',
+              part_id=None, restart=False, shard_size=500, progress=True, detector_options=None,
+              retry_failed=False):
+    """
+    Detect all images under root into output, resuming from its checkpoint
+
+    Args:
+        root: Folder to walk
+        output: Output file (jsonl/csv) or folder of shards (npz)
+        detector: Loaded BrickDetector (shared with forked workers)
+        output_format_name: 'jsonl', 'csv' or 'npz'
+        workers: Parallel detections
+        pool: 'process' or 'thread'
+        part_id: Function mapping a detected name to a part number
+        restart: Discard earlier results and start over
+        shard_size: Images per npz shard
+        progress: Show the progress bar
+        detector_options: BrickDetector arguments for workers that cannot fork
+        retry_failed: Detect images that failed in earlier runs again
+
+    Returns:
+        Summary dict: images, skipped, processed, failed, earlier_failures (skipped
+        images that failed before) and counts per (part, name, color)
+    """
+    global _detector
+    checkpoint = Checkpoint(output.rstrip('/\\') + '.checkpoint')
+    if restart:
+        for path in (output, checkpoint.path):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+    elif os.path.exists(output) and not os.path.exists(checkpoint.path):
+        raise FileExistsError(f"{output} exists without a checkpoint; use --restart to overwrite it")
+
+    done, failed_before, position = checkpoint.load()
+    if not retry_failed:
+        done |= failed_before
+    checkpoint.open()
+    images = find_images(root)
+    todo = [path for path in images if path not in done]
+    writer = {'jsonl': JsonlWriter, 'csv': CsvWriter}.get(output_format_name)
+    if writer:
+        writer = writer(output, position, part_id)
+    else:
+        writer = NpzWriter(output, position, part_id, shard_size=shard_size)
+
+    _detector = detector
+    bar = Progress(len(images), len(images) - len(todo)) if progress else None
+    failed = 0
+    failures = set()  #Failed in this run and not yet checkpointed
+    try:
+        for path, detections, error, seconds in detect_all(root, todo, workers, pool, detector_options):
+            if error is not None:
+                failed += 1
+                failures.add(path)
+            stored, position = writer.add(path, detections, error, seconds)
+            if stored:
+                checkpoint.record(stored, position, failures)
+                failures.difference_update(stored)
+            if bar:
+                bar.update(failed=error is not None)
+    finally:
+        if isinstance(writer, NpzWriter):
+            stored, position = writer.close()
+            if stored:
+                checkpoint.record(stored, position, failures)
+        else:
+            writer.close()
+        checkpoint.close()
+
+    if isinstance(writer, NpzWriter):
+        counts = NpzWriter.read_counts(output, part_id)
+    else:
+        counts = writer.read_counts(output)
+    return {
+        "images": len(images),
+        "skipped": len(images) - len(todo),
+        "processed": len(todo),
+        "failed": failed,
+        "earlier_failures": 0 if retry_failed else len(failed_before.intersection(images)),
+        "counts": counts
+    }
+
+
+def detect_all(root, paths, workers, pool, detector_options=None):
+    """Yield detection results as they finish, keeping a bounded number in flight"""
+    if workers <= 1 or not paths:
+        for path in paths:
+            yield detect_image(root, path)
+        return
+
+    if pool == 'thread':
+        executor = ThreadPoolExecutor(max_workers=workers)
+    elif 'fork' in multiprocessing.get_all_start_methods():
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(detector_options,))
+
+    remaining = iter(paths)
+    pending = set()
+    with executor:
+        try:
+            while True:
+                while len(pending) < workers * 2:
+                    path = next(remaining, None)
+                    if path is None:
+                        break
+                    pending.add(executor.submit(detect_image, root, path))
+                if not pending:
+                    return
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def print_report(summary, limit=None, stream=sys.stdout):
+    counts = summary['counts']
+    print(f"\n✅ {summary['images']} images: {summary['processed']} detected, "
+          f"{summary['skipped']} already done, {summary['failed']} failed", file=stream)
+    if summary.get('earlier_failures'):
+        print(f"   {summary['earlier_failures']} images failed in an earlier run; "
+              f"use --retry-failed to detect them again", file=stream)
+    print(f"   {sum(counts.values())} bricks, {len(counts)} part/color combinations\n", file=stream)
+    print(f"{'part':<10} {'name':<28} {'color':<12} {'quantity':>8}", file=stream)
+    for (part, name, color), quantity in counts.most_common(limit):
+        print(f"{part:<10} {name[:28]:<28} {color:<12} {quantity:>8}", file=stream)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m batch_detect',
+        description="Detect bricks in every image under a folder, resumably"
+    )
+    parser.add_argument('folder', help="Folder of images (searched recursively)")
+    parser.add_argument('--output', '-o', required=True, help="Results file (.jsonl/.csv) or npz shard folder")
+    parser.add_argument('--format', choices=['jsonl', 'csv', 'npz'], help="Default: from the output extension")
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--pool', choices=['process', 'thread'], default='process')
+    parser.add_argument('--threads', type=int, default=1, help="onnxruntime threads per detection")
+    parser.add_argument('--model', default=os.environ.get('DETECTOR_MODEL', 'best.onnx'))
+    parser.add_argument('--class-file', default='class_names.txt')
+    parser.add_argument('--classifier', help="Part classifier for cascade mode")
+    parser.add_argument('--catalog', default=os.environ.get('CATALOG_FOLDER', 'catalog'),
+                        help="Rebrickable dumps used to map names to part numbers")
+    parser.add_argument('--shard-size', type=int, default=500, help="Images per npz shard")
+    parser.add_argument('--restart', action='store_true', help="Discard earlier results instead of resuming")
+    parser.add_argument('--retry-failed', action='store_true', help="Detect images that failed in earlier runs again")
+    parser.add_argument('--top', type=int, help="Only report the most common part/color combinations")
+    parser.add_argument('--quiet', action='store_true', help="No progress bar")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.folder):
+        parser.error(f"{args.folder} is not a folder")
+
+    from brick_detector import BrickDetector
+    from part_catalog import PartCatalog
+
+    detector_options = {
+        "model_path": args.model,
+        "class_file": args.class_file,
+        "classifier_path": args.classifier,
+        "intra_op_threads": args.threads
+    }
+    detector = BrickDetector(**detector_options)
+    catalog = PartCatalog(args.catalog)
+
+    try:
+        summary = run_batch(
+            args.folder, args.output, detector,
+            output_format_name=output_format(args.output, args.format),
+            workers=args.workers,
+            pool=args.pool,
+            part_id=lambda name: catalog.lookup(name.strip()),
+            restart=args.restart,
+            shard_size=args.shard_size,
+            progress=not args.quiet,
+            detector_options=detector_options,
+            retry_failed=args.retry_failed
+        )
+    except KeyboardInterrupt:
+        print("\n⚠️  Interrupted; run the same command again to resume", file=sys.stderr)
+        sys.exit(130)
+    except FileExistsError as e:
+        parser.error(str(e))
+    print_report(summary, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# batch_scheduler.py - Dynamic micro-batching for concurrent detection requests
+
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+import numpy as np
+
+# Live schedulers; weak so an evicted model's scheduler (and its session) can be freed
+_schedulers = weakref.WeakSet()
+
+
+def _reset_schedulers_after_fork():
+    # Threads do not survive fork, so children start their own workers
+    for scheduler in list(_schedulers):
+        scheduler._reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_schedulers_after_fork)
+
+
+class BatchScheduler:
+    def __init__(self, detector, max_batch_size=8, window_ms=5):
+        """
+        Gather preprocessed images from concurrent requests into one session.run
+
+        Each request thread prepares its own image, then waits while a single
+        worker thread collects tensors for up to window_ms (or max_batch_size
+        images), runs them through the model together and routes each slice of
+        the output back to the waiting request, which post-processes it itself.
+
+        Args:
+            detector: BrickDetector instance
+            max_batch_size: Largest batch handed to the model
+            window_ms: How long to wait for more requests after the first one
+        """
+        self.detector = detector
+        # Models exported with a fixed batch dimension can only take one image
+        self.max_batch_size = max_batch_size if detector.supports_batching else 1
+        self.window = window_ms / 1000.0
+
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        _schedulers.add(self)
+
+        # Metrics
+        self._images = 0
+        self._batches = 0
+        self._batch_sizes = {}
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._inference_time = 0.0
+        self._single_time = 0.0
+        self._single_batches = 0
+
+    def detect_bricks(self, image_path):
+        """Drop-in replacement for BrickDetector.detect_bricks"""
+        context = self.detector.prepare(image_path)
+        # NMS, color and classifier work run here, in parallel across requests
+        return self.detector.finish(self.submit(context).result(), context)
+
+    def submit(self, context):
+        """Queue a prepared image; returns a Future resolving to its raw model output"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((context, future, time.perf_counter()))
+        return future
+
+    def close(self):
+        """Stop the worker thread once queued requests are done"""
+        _schedulers.discard(self)
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                self._queue.put(None)
+            self._worker = None
+
+    def _ensure_worker(self):
+        """Start the worker thread on first use"""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name='batch-scheduler', daemon=True
+                )
+                self._worker.start()
+
+    def _reset_after_fork(self):
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def _collect(self):
+        """
+        Block for the first request, then gather more until the window closes
+        Returns None when close() was called.
+        """
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except Empty:
+                break
+            if item is None:
+                self._queue.put(None)  #Stop after this batch
+                break
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+
+            try:
+                tensor = np.concatenate([context['tensor'] for context, _, _ in batch], axis=0)
+                outputs = self.detector.session.run(
+                    None, {self.detector.input_name: tensor}
+                )
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            inference_time = time.perf_counter() - started
+            self._record(batch, started, inference_time)
+            self.detector.record_detection(inference_time, len(batch))
+
+            # Only slice here; post-processing on this thread would serialize it
+            for i, (_, future, _) in enumerate(batch):
+                future.set_result(outputs[0][i:i + 1])
+
+    def _record(self, batch, started, inference_time):
+        with self._lock:
+            size = len(batch)
+            self._images += size
+            self._batches += 1
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+            self._inference_time += inference_time
+            if size == 1:
+                self._single_time += inference_time
+                self._single_batches += 1
+
+            for _, _, queued_at in batch:
+                wait = started - queued_at
+                self._queue_wait_total += wait
+                self._queue_wait_max = max(self._queue_wait_max, wait)
+
+    def get_stats(self):
+        """Queue wait, batch size distribution and throughput metrics"""
+        with self._lock:
+            images = self._images
+            batches = self._batches
+            batched_rate = images / self._inference_time if self._inference_time else 0
+            single_rate = self._single_batches / self._single_time if self._single_time else 0
+
+            return {
+                "max_batch_size": self.max_batch_size,
+                "window_ms": self.window * 1000,
+                "queue_depth": self._queue.qsize(),
+                "images_processed": images,
+                "batches_run": batches,
+                "session_runs_saved": images - batches,
+                "avg_batch_size": round(images / batches, 2) if batches else 0,
+                "batch_size_distribution": {
+                    str(size): count for size, count in sorted(self._batch_sizes.items())
+                },
+                "avg_queue_wait_ms": round(self._queue_wait_total / images * 1000, 3) if images else 0,
+                "max_queue_wait_ms": round(self._queue_wait_max * 1000, 3),
+                "inference_images_per_second": round(batched_rate, 2),
+                # Compared against batches that ran a single image on their own
+                "throughput_gain": round(batched_rate / single_rate, 2) if single_rate else None
+            }
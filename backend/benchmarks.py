@@ -0,0 +1,668 @@
+#!/usr/bin/env python3
+"""
+Performance benchmarks for the backend
+
+Usage:
+    python benchmarks.py inventory [--rows 100000]
+    python benchmarks.py recommendations [--sets 20000] [--owned 2000]
+    python benchmarks.py solver [--sets 5000] [--owned-sets 400]
+    python benchmarks.py parts [--parts 50000]
+    python benchmarks.py catalog [--parts 50000]
+    python benchmarks.py http
+    python benchmarks.py json [--detections 1000]
+    python benchmarks.py payload [--detections 1000]
+    python benchmarks.py detections [--detections 5000]
+    python benchmarks.py e2e [--model best.onnx] [--e2e-model best_e2e.onnx]
+    python benchmarks.py broker [--model best.onnx] [--images 200] [--max-workers 4]
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+COLORS = [
+    'Red', 'Blue', 'Yellow', 'Green', 'Black', 'White', 'Gray', 'Orange',
+    'Purple', 'Tan', 'Brown', 'Pink', 'Lime', 'Dark Blue', 'Dark Red', 'Dark Gray',
+    'Light Gray', 'Azure', 'Olive', 'Sand Green'
+]
+
+
+def timed(fn, repeat=20):
+    """Median wall time of fn() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def report(label, ms):
+    print(f"   {label:<48} {ms:10.3f} ms")
+
+
+def synthetic_inventory(rows):
+    """Inventory rows spread over parts and colors like a large collection"""
+    return [
+        {
+            "id": str(3000 + i // len(COLORS)),
+            "name": f"Part {3000 + i // len(COLORS)}",
+            "color": COLORS[i % len(COLORS)],
+            "quantity": (i * 7919) % 200 + 1
+        }
+        for i in range(rows)
+    ]
+
+
+def bench_inventory(args):
+    from inventory_store import InventoryStore
+
+    print(f"🧱 Inventory store with {args.rows:,} rows")
+    bricks = synthetic_inventory(args.rows)
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        store = InventoryStore(os.path.join(temp_dir, 'inventory.db'))
+
+        start = time.perf_counter()
+        store.add_bricks(bricks)
+        report("bulk upsert (one transaction)", (time.perf_counter() - start) * 1000)
+        report("rebuild summary aggregates", timed(store.rebuild_summaries, repeat=3))
+
+        queries = [
+            ("GET limit=50", {}),
+            ("GET color=Red", {"color": "Red"}),
+            ("GET min_quantity=190", {"min_quantity": 190}),
+            ("GET color=Red&min_quantity=150", {"color": "Red", "min_quantity": 150}),
+        ]
+        for label, filters in queries:
+            report(f"{label} (SQLite)", timed(lambda: store.list_bricks(**filters)))
+            report(f"{label} summary (SQLite)", timed(lambda: store.summary(**filters)))
+
+        # Deep pages: keyset seek vs OFFSET, at ~99% of the inventory
+        deep_row = store.list_bricks(limit=args.rows)[args.rows - 100]
+        after = (deep_row['id'], deep_row['color'])
+        report("deep page keyset (after 99.9k rows)", timed(lambda: store.page(limit=50, after=after)))
+        red_rows = store.list_bricks(color='Red', limit=args.rows)
+        red_after = (red_rows[-10]['id'], 'Red')
+        report("deep page keyset color=Red", timed(lambda: store.page(color='Red', limit=50, after=red_after)))
+
+        def offset_page():
+            with store._connection() as conn:
+                return conn.execute(
+                    'SELECT * FROM inventory ORDER BY part_id, color LIMIT 50 OFFSET ?', (args.rows - 100,)
+                ).fetchall()
+        report("deep page OFFSET baseline", timed(offset_page))
+        report("conditional GET version check (304 path)", timed(store.version))
+
+        # Old approach: filter an in-memory list with comprehensions
+        def list_filter():
+            filtered = [b for b in bricks if b['color'].lower() == 'red']
+            filtered = [b for b in filtered if b['quantity'] >= 150]
+            return filtered[:50]
+        report("GET color=Red&min_quantity=150 (list baseline)", timed(list_filter))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def write_synthetic_catalog(folder, sets, parts_per_set=60, part_pool=5000):
+    """Rebrickable-style CSV dump with sets drawing on a shared pool of parts"""
+    rng = random.Random(42)
+
+    def write(name, header, rows):
+        with open(os.path.join(folder, name + '.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    write('colors', ['id', 'name', 'rgb', 'is_trans'],
+          [[i, color, '000000', 'f'] for i, color in enumerate(COLORS)])
+    write('sets', ['set_num', 'name', 'year', 'theme_id', 'num_parts', 'img_url'],
+          [[f"{i}-1", f"Set {i}", 2000 + i % 25, 1, parts_per_set * 4, ''] for i in range(sets)])
+    write('inventories', ['id', 'version', 'set_num'], [[i, 1, f"{i}-1"] for i in range(sets)])
+    write('inventory_parts', ['inventory_id', 'part_num', 'color_id', 'quantity', 'is_spare', 'img_url'], (
+        [i, 3000 + int(rng.paretovariate(1.2)) % part_pool, rng.randrange(len(COLORS)), rng.randint(1, 8), 'f', '']
+        for i in range(sets) for _ in range(parts_per_set)
+    ))
+
+
+def bench_recommendations(args):
+    from recommendation_engine import RecommendationEngine
+
+    print(f"🏗️  Recommendations over {args.sets:,} sets, {args.owned:,} owned part/colors")
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        write_synthetic_catalog(temp_dir, args.sets)
+        engine = RecommendationEngine(temp_dir)
+
+        start = time.perf_counter()
+        engine._ensure_loaded()
+        report("load CSV catalog and build index", (time.perf_counter() - start) * 1000)
+        stats = engine.get_stats()
+        print(f"   {stats['entries']:,} entries, {stats['part_colors']:,} part/colors")
+
+        bricks = synthetic_inventory(args.owned)
+        report("recommend top 20 (inverted index)", timed(lambda: engine.recommend(bricks, limit=20)))
+        report("recommend top 20, min_completion=40", timed(lambda: engine.recommend(bricks, limit=20, min_completion=40)))
+        small = bricks[:50]
+        report("recommend top 5 for one photo (50 bricks)", timed(lambda: engine.recommend(small)))
+
+        # Old approach: per-set list scans over part IDs, ignoring quantity and color
+        required = {}
+        for set_idx, key in zip(engine.entry_set.tolist(), engine.entry_key.tolist()):
+            required.setdefault(set_idx, []).append(key)
+        part_ids = [engine.key_index.get((b['id'], b['color'].lower())) for b in bricks]
+
+        def list_scan():
+            scores = []
+            for set_idx, keys in required.items():
+                available = [k for k in part_ids if k in keys]
+                scores.append((len(available) / len(keys), set_idx))
+            return sorted(scores, reverse=True)[:20]
+        report("recommend top 20 (per-set list scan baseline)", timed(list_scan, repeat=1))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_solver(args):
+    from recommendation_engine import RecommendationEngine
+    from set_solver import BuildabilitySolver
+
+    print(f"🧩 Buildability solver over {args.sets:,} sets, inventory from {args.owned_sets} of them")
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        write_synthetic_catalog(temp_dir, args.sets, parts_per_set=30)
+        engine = RecommendationEngine(temp_dir)
+        solver = BuildabilitySolver(engine)
+        engine._ensure_loaded()
+
+        # Inventory holding exactly the bricks of a random sample of sets
+        rng = random.Random(7)
+        owned = {}
+        keys_by_index = {k: key for key, k in engine.key_index.items()}
+        for set_idx in rng.sample(range(len(engine.sets)), args.owned_sets):
+            keys, quantities = engine.set_entries(set_idx)
+            for k, q in zip(keys.tolist(), quantities.tolist()):
+                owned[k] = owned.get(k, 0) + q
+        bricks = [
+            {"id": keys_by_index[k][0], "color": keys_by_index[k][1], "quantity": q}
+            for k, q in owned.items()
+        ]
+
+        for objective in ('sets', 'pieces'):
+            for budget in (0, 200, 1000):
+                result = solver.solve(bricks, objective=objective, time_budget_ms=budget)
+                value = result['sets_built'] if objective == 'sets' else result['pieces_used']
+                report(
+                    f"{objective}, budget {budget}ms: {value:,} (bound {result['upper_bound']:,})",
+                    result['solve_time_ms']
+                )
+
+        # Small inventory change: cold solve vs warm start from the last solution
+        previous = solver.solve(bricks, objective='sets', time_budget_ms=1000)
+        changed = [dict(b, quantity=max(b['quantity'] - 1, 0)) if i % 50 == 0 else b for i, b in enumerate(bricks)]
+        cold = solver.solve(changed, objective='sets', time_budget_ms=1000)
+        warm = solver.solve(changed, objective='sets', time_budget_ms=1000, previous=previous)
+        report(f"re-solve after change, cold: {cold['sets_built']} sets", cold['solve_time_ms'])
+        report(f"re-solve after change, warm start: {warm['sets_built']} sets", warm['solve_time_ms'])
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def per_call(fn, names):
+    """Mean time per call in nanoseconds over a list of inputs"""
+    start = time.perf_counter()
+    for name in names:
+        fn(name)
+    return (time.perf_counter() - start) / len(names) * 1e9
+
+
+def bench_parts(args):
+    from part_catalog import PartCatalog, BUILTIN_PARTS
+
+    print(f"🔤 Part name lookup over {args.parts:,} parts")
+    temp_dir = tempfile.mkdtemp()
+    kinds = ['Brick', 'Plate', 'Tile', 'Slope 45', 'Brick Round', 'Plate Modified']
+
+    try:
+        with open(os.path.join(temp_dir, 'parts.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['part_num', 'name', 'part_cat_id', 'part_material'])
+            for i in range(args.parts):
+                writer.writerow([f"p{i}", f"{kinds[i % len(kinds)]} {i % 16 + 1} x {i // 16 % 16 + 1} variant {i}", 1, 'Plastic'])
+
+        start = time.perf_counter()
+        catalog = PartCatalog(temp_dir)
+        report("load parts file and build hash index", (time.perf_counter() - start) * 1000)
+
+        class_names = list(BUILTIN_PARTS) * 10_000
+        print(f"   {'memoized class name lookup':<48} {per_call(catalog.lookup, class_names):10.1f} ns")
+        spellings = [f"{kinds[i % len(kinds)].lower()} {i % 16 + 1}x{i // 16 % 16 + 1} VARIANT {i}" for i in range(20_000)]
+        print(f"   {'first lookup, normalized hash hit':<48} {per_call(catalog.lookup, spellings) / 1000:10.1f} us")
+        typos = [f"{kinds[i % len(kinds)]} {i % 16 + 1}x{i // 16 % 16 + 1} varant {i}" for i in range(200)]
+        report("first lookup, fuzzy trigram match (incl. index build)", timed(lambda: catalog.lookup(typos[0]), repeat=1))
+        print(f"   {'first lookup, fuzzy trigram match':<48} {per_call(catalog.lookup, typos[1:]) / 1e6:10.3f} ms")
+        print(f"   {'repeated fuzzy lookup (memoized)':<48} {per_call(catalog.lookup, typos * 100):10.1f} ns")
+
+        # Old approach: dict rebuilt per call, then case-insensitive and substring scans
+        def legacy_lookup(name):
+            mapping = dict(BUILTIN_PARTS, lego_brick='3001', Unknown='0000', brick='3001')
+            if name in mapping:
+                return mapping[name]
+            lower = name.lower()
+            for key, value in mapping.items():
+                if key.lower() == lower:
+                    return value
+            for key, value in mapping.items():
+                if key.lower() in lower or lower in key.lower():
+                    return value
+            return '0000'
+        print(f"   {'class name lookup (17-entry dict baseline)':<48} {per_call(legacy_lookup, class_names):10.1f} ns")
+        print(f"   {'unmatched name (17-entry dict baseline)':<48} {per_call(legacy_lookup, spellings) / 1000:10.1f} us")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_catalog(args):
+    from catalog_store import CatalogStore
+
+    print(f"📚 Metadata catalog with {args.parts:,} bricks, results screen of 30 parts")
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        store = CatalogStore(os.path.join(temp_dir, 'catalog.db'))
+        start = time.perf_counter()
+        store.put_many('brick', [{"id": f"p{i}", "official_name": f"Part {i}", "category": "Bricks"} for i in range(args.parts)])
+        report("bulk load (one transaction)", (time.perf_counter() - start) * 1000)
+
+        rng = random.Random(3)
+
+        def screen_ids():
+            return [f"p{rng.randrange(args.parts)}" for _ in range(30)]
+
+        def cold(fn):
+            def run():
+                store._cache.clear()
+                fn(screen_ids())
+            return run
+
+        report("30 single lookups, cold cache", timed(cold(lambda ids: [store.get('brick', i) for i in ids])))
+        report("1 bulk lookup of 30, cold cache", timed(cold(lambda ids: store.get_many('brick', ids))))
+        ids = screen_ids()
+        report("1 bulk lookup of 30, warm cache", timed(lambda: store.get_many('brick', ids)))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def synthetic_analysis(detections):
+    """Response body shaped like /api/analyze-photo"""
+    bricks = [
+        {
+            "id": str(3000 + i % 40),
+            "name": f"{i % 4 + 1}x{i % 3 + 2} Brick",
+            "color": COLORS[i % len(COLORS)],
+            "quantity": 1,
+            "confidence": round(0.5 + (i * 37 % 50) / 100, 4),
+            "bbox": [i % 640, i * 7 % 480, i % 640 + 40, i * 7 % 480 + 30]
+        }
+        for i in range(detections)
+    ]
+    return {
+        "success": True,
+        "analysis_id": "ana_20240115_103000",
+        "image_metadata": {"dimensions": {"width": 1920, "height": 1080}, "format": "JPEG", "size_kb": 1245.5},
+        "detection_summary": {"total_bricks": detections, "unique_types": 40, "detection_time_ms": 1250.5},
+        "bricks": bricks,
+        "color_distribution": {color: detections // len(COLORS) for color in COLORS},
+        "suggested_sets": [],
+        "timestamp": "2024-01-15T10:30:00Z"
+    }
+
+
+def bench_http(args):
+    from catalog_store import SEED_BRICKS
+    from http_cache import compress, brotli
+
+    print("🗜️  Response compression (bytes on the wire, server CPU per response)")
+    bodies = [
+        ("/api/brick/3001", SEED_BRICKS[0]),
+        ("/api/bricks?ids= (30 parts)", {"success": True, "bricks": SEED_BRICKS * 10}),
+        ("/api/analyze-photo (50 detections)", synthetic_analysis(50)),
+        ("/api/analyze-photo (1000 detections)", synthetic_analysis(1000)),
+        ("/api/inventory?limit=1000", {"success": True, "inventory": synthetic_inventory(1000)}),
+    ]
+    encodings = ['gzip'] + (['br'] if brotli else [])
+    if not brotli:
+        print("   (brotli not installed, gzip only)")
+
+    for label, body in bodies:
+        data = json.dumps(body).encode()
+        print(f"   {label}")
+        print(f"      {'identity':<10} {len(data):>9,} bytes")
+        for encoding in encodings:
+            size = len(compress(data, encoding))
+            ms = timed(lambda: compress(data, encoding), repeat=20)
+            print(f"      {encoding:<10} {size:>9,} bytes  {len(data) / size:5.1f}x  {ms:7.3f} ms CPU")
+        etag_ms = timed(lambda: hashlib.blake2b(data, digest_size=16).hexdigest())
+        print(f"      {'ETag hash':<10} {etag_ms:27.3f} ms CPU")
+
+
+def bench_json(args):
+    import numpy as np
+    from flask import Flask
+    from flask.json.provider import DefaultJSONProvider
+    from json_provider import FastJSONProvider, orjson
+
+    print(f"🧾 Serializing a {args.detections:,}-detection response"
+          f" ({'orjson' if orjson else 'stdlib json, orjson not installed'})")
+    rng = np.random.default_rng(0)
+    boxes = (rng.random((args.detections, 4)) * 640).astype(np.float32)
+    scores = rng.random(args.detections).astype(np.float32)
+    class_ids = rng.integers(0, 14, args.detections)
+
+    def converted():
+        # Previous detector output: every value converted to a Python type
+        return [
+            {"id": f"brick_{i}", "name": "2x4 Brick", "color": "Red", "quantity": 1,
+             "confidence": float(score), "class_id": int(class_id), "bbox": box.tolist()}
+            for i, (box, score, class_id) in enumerate(zip(boxes, scores, class_ids))
+        ]
+
+    def native():
+        # NumPy values left in place for the JSON provider
+        corners = boxes.astype(np.int32)
+        return [
+            {"id": f"brick_{i}", "name": "2x4 Brick", "color": "Red", "quantity": 1,
+             "confidence": scores[i], "class_id": class_id, "bbox": corners[i]}
+            for i, class_id in enumerate(class_ids.tolist())
+        ]
+
+    app = Flask(__name__)
+    stdlib = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+    converted_results, native_results = converted(), native()
+    with app.app_context():
+        report("before: convert fields", timed(converted))
+        report("before: jsonify (stdlib, sorted keys)", timed(lambda: stdlib.response({"results": converted_results})))
+        report("after: build with NumPy values", timed(native))
+        report("after: jsonify (FastJSONProvider)", timed(lambda: fast.response({"results": native_results})))
+
+
+def bench_payload(args):
+    from http_cache import compress
+    from json_provider import default
+
+    # app creates its data folders on import, keep them out of the tree
+    os.environ.setdefault('UPLOAD_FOLDER', tempfile.mkdtemp())
+    os.environ.setdefault('DATA_FOLDER', tempfile.mkdtemp())
+    from app import columnar_bricks
+
+    print(f"📦 Analysis payload size for {args.detections:,} detections")
+    full = synthetic_analysis(args.detections)
+    bricks_only = {"success": True, "analysis_id": full['analysis_id'], "bricks": full['bricks']}
+    columnar = {**bricks_only, "format": "columnar", "bricks": columnar_bricks(full['bricks'])}
+
+    baseline = None
+    for label, body in (("full response (rows)", full),
+                        ("fields=bricks (rows)", bricks_only),
+                        ("fields=bricks&format=columnar", columnar)):
+        data = json.dumps(body, default=default).encode()
+        baseline = baseline or len(data)
+        gzipped = len(compress(data, 'gzip'))
+        print(f"   {label:<32} {len(data):>9,} bytes  {baseline / len(data):4.1f}x smaller"
+              f"  gzip {gzipped:>7,} bytes")
+    report("columnar encode", timed(lambda: columnar_bricks(full['bricks'])))
+
+
+def bench_detections(args):
+    import numpy as np
+    from detections import COLOR_NAMES, DetectionArray
+    from part_catalog import BUILTIN_PARTS, PartCatalog
+
+    print(f"🧱 Formatting and aggregating a {args.detections:,}-detection scene")
+    rng = np.random.default_rng(0)
+    class_names = tuple(BUILTIN_PARTS)
+    xywh = rng.integers(0, 600, (args.detections, 4)).astype(np.int32)
+    scores = rng.random(args.detections).astype(np.float32)
+    class_ids = rng.integers(0, len(class_names), args.detections)
+    color_codes = rng.integers(0, len(COLOR_NAMES), args.detections).astype(np.int32)
+    catalog = PartCatalog()
+
+    def dicts_pipeline():
+        # Previous path: a dict per detection, then string-keyed regrouping
+        counts = {}
+        results = []
+        for i, class_id in enumerate(class_ids.tolist()):
+            name = class_names[class_id]
+            counts[name] = counts.get(name, 0) + 1
+            results.append({"id": f"{name}_{counts[name]}", "name": name, "color": COLOR_NAMES[color_codes[i]],
+                            "quantity": 1, "confidence": scores[i], "bbox": xywh[i]})
+        groups = {}
+        for detection in results:
+            key = f"{detection['name']}_{detection['color']}"
+            if key in groups:
+                groups[key]['quantity'] += detection['quantity']
+                groups[key]['confidence'] = max(groups[key]['confidence'], detection['confidence'])
+            else:
+                groups[key] = {**detection, "id": catalog.lookup(detection['name'])}
+        return results, list(groups.values())
+
+    def array_pipeline():
+        detections = DetectionArray(xywh, scores, class_ids, color_codes, class_names=class_names)
+        return detections, detections.aggregate().to_dicts(part_id=catalog.lookup)
+
+    for label, pipeline in (("before: list of dicts", dicts_pipeline), ("after: DetectionArray", array_pipeline)):
+        tracemalloc.start()
+        detections, groups = pipeline()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report(f"{label} ({len(groups)} groups, peak {peak / 1024:,.0f} KB)", timed(pipeline))
+    held = DetectionArray(xywh, scores, class_ids, color_codes, class_names=class_names)
+    print(f"   detections held as arrays: {held.nbytes() / 1024:,.0f} KB")
+
+
+def synthetic_yolo_model(num_classes=6, anchors=8400, boxes=50, size=640):
+    """YOLOv8-shaped stand-in returning fixed predictions, for timing the Python around it"""
+    import numpy as np
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+    predictions = np.zeros((1, 4 + num_classes, anchors), dtype=np.float32)
+    predictions[0, :2] = rng.random((2, anchors)) * size
+    predictions[0, 2:4] = 10 + rng.random((2, anchors)) * 30
+    predictions[0, 4:] = rng.random((num_classes, anchors)) * 0.2
+    hits = rng.choice(anchors, boxes, replace=False)
+    predictions[0, 4 + rng.integers(0, num_classes, boxes), hits] = 0.5 + rng.random(boxes) * 0.5
+
+    graph = helper.make_graph(
+        [
+            helper.make_node('ReduceMean', ['images'], ['mean'], keepdims=0),
+            helper.make_node('Mul', ['mean', 'zero'], ['nothing']),
+            helper.make_node('Add', ['predictions', 'nothing'], ['output0']),
+        ],
+        'synthetic_yolo',
+        [helper.make_tensor_value_info('images', TensorProto.FLOAT, [1, 3, size, size])],
+        [helper.make_tensor_value_info('output0', TensorProto.FLOAT, list(predictions.shape))],
+        initializer=[numpy_helper.from_array(predictions, 'predictions'),
+                     numpy_helper.from_array(np.array(0, dtype=np.float32), 'zero')]
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)])
+    model.ir_version = 8
+    return model
+
+
+def bench_e2e(args):
+    import numpy as np
+    from brick_detector import BrickDetector
+    from build_e2e_model import build_end_to_end, onnx
+
+    if onnx is None:
+        print("⚠️  The e2e benchmark builds models and needs the onnx package: pip install onnx")
+        return
+
+    folder = tempfile.mkdtemp()
+    try:
+        model_path = args.model
+        if not os.path.exists(model_path):
+            # Without the trained model only the Python around session.run is compared
+            print(f"⚠️  {model_path} not found, using a synthetic YOLOv8-shaped model")
+            model_path = os.path.join(folder, 'synthetic.onnx')
+            onnx.save(synthetic_yolo_model(), model_path)
+        e2e_path = args.e2e_model
+        if not os.path.exists(e2e_path):
+            e2e_path = os.path.join(folder, 'e2e.onnx')
+            onnx.save(build_end_to_end(onnx.load(model_path)), e2e_path)
+
+        plain = BrickDetector(model_path)
+        e2e = BrickDetector(e2e_path)
+        image = (np.random.default_rng(0).random((1080, 1920, 3)) * 255).astype(np.uint8)
+
+        print(f"\n⚡ Detection latency for a 1920x1080 image ({len(plain.detect_bricks(image))} detections)")
+        for label, detector in (("before: Python pre/post-processing", plain), ("after: end-to-end graph", e2e)):
+            context = detector.prepare(image)
+            outputs = detector.session.run(None, detector._feed(context['tensor']))
+            predictions = outputs if detector.end_to_end else outputs[0]
+            print(f"   {label}")
+            report("  prepare (letterbox, normalize)", timed(lambda: detector.prepare(image)))
+            report("  session.run", timed(lambda: detector.session.run(None, detector._feed(context['tensor']))))
+            report("  finish (NMS, scale, format)", timed(lambda: detector.finish(predictions, context)))
+            report("  total", timed(lambda: detector.detect_bricks(image)))
+    finally:
+        shutil.rmtree(folder)
+
+
+def bench_broker(args):
+    import cv2
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+    from brick_detector import BrickDetector
+    from inference_broker import SQLiteBroker, RemoteDetector
+
+    folder = tempfile.mkdtemp()
+    workers = []
+    try:
+        model_path = args.model
+        if not os.path.exists(model_path):
+            import onnx
+            print(f"⚠️  {model_path} not found, using a synthetic YOLOv8-shaped model")
+            model_path = os.path.join(folder, 'synthetic.onnx')
+            onnx.save(synthetic_yolo_model(), model_path)
+
+        # A photo-like scan (bricks on a plain table), so the JPEG has a realistic size
+        rng = np.random.default_rng(0)
+        image = np.full((960, 1280, 3), 200, dtype=np.uint8)
+        for _ in range(60):
+            x, y = rng.integers(0, 1200), rng.integers(0, 900)
+            cv2.rectangle(image, (int(x), int(y)), (int(x) + 60, int(y) + 40), rng.integers(0, 255, 3).tolist(), -1)
+        image = cv2.add(image, rng.integers(0, 12, image.shape, dtype=np.uint8))
+        image_path = os.path.join(folder, 'scan.jpg')
+        cv2.imwrite(image_path, image)
+        print(f"\n⚡ {args.images} scans of 1280x960 ({os.path.getsize(image_path) // 1024}KB JPEG, "
+              f"{image.nbytes // 1024}KB decoded), {os.cpu_count()} CPUs")
+
+        local = BrickDetector(model_path, intra_op_threads=1)
+        started = time.perf_counter()
+        for _ in range(args.images):
+            local.detect_bricks(image_path)
+        baseline = args.images / (time.perf_counter() - started)
+        print(f"   in-process, 1 thread:  {baseline:8.1f} images/s")
+
+        broker_path = os.path.join(folder, 'broker.db')
+        broker = SQLiteBroker(broker_path)
+        remote = RemoteDetector(broker, model_version='default')
+        backend = os.path.dirname(os.path.abspath(__file__))
+        for count in range(1, args.max_workers + 1):
+            while len(workers) < count:
+                worker = subprocess.Popen(
+                    [sys.executable, 'inference_broker.py', 'worker', '--broker', broker_path,
+                     '--model', model_path, '--version', 'default', '--threads', '1'],
+                    cwd=backend, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+                )
+                while not worker.stdout.readline().startswith('✅ Worker'):
+                    pass
+                workers.append(worker)
+
+            # Enough front-end threads to keep every worker busy
+            with ThreadPoolExecutor(max_workers=4 * count) as pool:
+                started = time.perf_counter()
+                list(pool.map(lambda _: remote.detect_bricks(image_path), range(args.images)))
+                throughput = args.images / (time.perf_counter() - started)
+            print(f"   broker, {count} worker{'s' if count > 1 else ' '}:    {throughput:8.1f} images/s "
+                  f"({throughput / baseline:.2f}x in-process)")
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+        shutil.rmtree(folder)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend performance benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    inventory = subparsers.add_parser('inventory', help="Inventory store queries")
+    inventory.add_argument('--rows', type=int, default=100_000)
+    inventory.set_defaults(func=bench_inventory)
+
+    recommendations = subparsers.add_parser('recommendations', help="Set recommendation engine")
+    recommendations.add_argument('--sets', type=int, default=20_000)
+    recommendations.add_argument('--owned', type=int, default=2000)
+    recommendations.set_defaults(func=bench_recommendations)
+
+    solver = subparsers.add_parser('solver', help="Buildability solver")
+    solver.add_argument('--sets', type=int, default=5000)
+    solver.add_argument('--owned-sets', type=int, default=400)
+    solver.set_defaults(func=bench_solver)
+
+    parts = subparsers.add_parser('parts', help="Part name lookup")
+    parts.add_argument('--parts', type=int, default=50_000)
+    parts.set_defaults(func=bench_parts)
+
+    catalog = subparsers.add_parser('catalog', help="Brick and set metadata store")
+    catalog.add_argument('--parts', type=int, default=50_000)
+    catalog.set_defaults(func=bench_catalog)
+
+    http = subparsers.add_parser('http', help="ETag and compression costs")
+    http.set_defaults(func=bench_http)
+
+    json_parser = subparsers.add_parser('json', help="JSON response serialization")
+    json_parser.add_argument('--detections', type=int, default=1000)
+    json_parser.set_defaults(func=bench_json)
+
+    payload = subparsers.add_parser('payload', help="Field selection and columnar response size")
+    payload.add_argument('--detections', type=int, default=1000)
+    payload.set_defaults(func=bench_payload)
+
+    detections = subparsers.add_parser('detections', help="Detection formatting and aggregation")
+    detections.add_argument('--detections', type=int, default=5000)
+    detections.set_defaults(func=bench_detections)
+
+    e2e = subparsers.add_parser('e2e', help="Python vs in-graph pre/post-processing latency")
+    e2e.add_argument('--model', default='best.onnx')
+    e2e.add_argument('--e2e-model', default='best_e2e.onnx')
+    e2e.set_defaults(func=bench_e2e)
+
+    broker = subparsers.add_parser('broker', help="Inference throughput across broker worker processes")
+    broker.add_argument('--model', default='best.onnx')
+    broker.add_argument('--images', type=int, default=200)
+    broker.add_argument('--max-workers', type=int, default=4)
+    broker.set_defaults(func=bench_broker)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
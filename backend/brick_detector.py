@@ -4,43 +4,138 @@ import cv2
 import numpy as np
 import onnxruntime
 import os
+import threading
+import time
+
+from detections import COLOR_CODES, DetectionArray
+
+# Detector classes that only say "this is a brick", never skipped by the cascade
+GENERIC_CLASSES = {'lego_brick', 'brick'}
 
 class BrickDetector:
-    def __init__(self, model_path='best.onnx', conf_threshold=0.25, iou_threshold=0.45):
+    classifier = None  # Set in cascade mode
+    end_to_end = False  # Model built by build_e2e_model.py
+    
+    def __init__(self, model_path='best.onnx', conf_threshold=0.25, iou_threshold=0.45,
+                 classifier_path=None, classifier_class_file='classifier_classes.txt',
+                 exit_confidence=0.8, classifier_threshold=0.5, class_file='class_names.txt',
+                 intra_op_threads=0):
         """
         Initialize the ONNX-based brick detector
         
+        With a classifier_path the detector runs in cascade mode: the detection
+        model only has to find bricks, and a separate part classifier labels
+        the crops. All crops of an image go through the classifier in one
+        batched session.run. Boxes the detector already labelled with a
+        specific class at exit_confidence or more skip the classifier.
+        
         Args:
             model_path: Path to ONNX model file
             conf_threshold: Confidence threshold for detections
             iou_threshold: IoU threshold for NMS
+            classifier_path: Optional ONNX part classifier for cascade mode
+            classifier_class_file: Part names, one per classifier output
+            exit_confidence: Detector score above which a specific class is kept
+            classifier_threshold: Lowest classifier probability used as a label
+            class_file: Detector class names, one per line
+            intra_op_threads: onnxruntime threads per session.run (0: one per core)
         """
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model file not found: {model_path}")
         
         # Load ONNX model
         print(f"🔄 Loading ONNX model from: {model_path}")
+        self.session_options = onnxruntime.SessionOptions()
+        self.session_options.intra_op_num_threads = intra_op_threads
         self.session = onnxruntime.InferenceSession(
             model_path,
+            self.session_options,
             providers=['CPUExecutionProvider']
         )
         
         # Get model input details
-        self.input_name = self.session.get_inputs()[0].name
-        self.input_shape = self.session.get_inputs()[0].shape
-        self.input_size = self.input_shape[2] if len(self.input_shape) > 2 else 640
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_shape = model_input.shape
+        
+        # End-to-end models take the decoded uint8 image and do letterboxing,
+        # normalization and NMS in the graph (see build_e2e_model.py)
+        self.end_to_end = model_input.type == 'tensor(uint8)' and len(self.input_shape) == 3
+        if self.end_to_end:
+            self.input_size = None
+            self.threshold_inputs = {i.name for i in self.session.get_inputs()[1:]}
+            self.supports_batching = False  # Images keep their own size
+        else:
+            self.input_size = self.input_shape[2] if len(self.input_shape) > 2 else 640
+            # A symbolic batch dimension means several images can share one session.run
+            batch_dim = self.input_shape[0] if self.input_shape else 1
+            self.supports_batching = not isinstance(batch_dim, int) or batch_dim <= 0
         
         # Detection thresholds
         self.conf_threshold = conf_threshold
         self.iou_threshold = iou_threshold
         
         # Load class names
-        self.class_names = self._load_class_names()
+        self.class_names = self._load_class_names(class_file)
+        
+        self._reset_stats()
+        if classifier_path:
+            self._load_classifier(classifier_path, classifier_class_file)
+            self.exit_confidence = exit_confidence
+            self.classifier_threshold = classifier_threshold
         
         print(f"✅ Model loaded successfully")
-        print(f"   Input size: {self.input_size}x{self.input_size}")
+        if self.end_to_end:
+            print(f"   End-to-end model: preprocessing and NMS run inside the graph")
+        else:
+            print(f"   Input size: {self.input_size}x{self.input_size}")
         print(f"   Classes: {self.class_names}")
         print(f"   Confidence threshold: {self.conf_threshold}")
+        if self.classifier is not None:
+            print(f"   Cascade classifier: {len(self.part_names)} parts, {self.classifier_size}x{self.classifier_size} crops")
+    
+    def _load_classifier(self, classifier_path, class_file):
+        """
+        Load the part classifier used in cascade mode
+        Its part names must match its outputs one to one, otherwise the
+        labels would point past the names, so a missing or mismatched class
+        file refuses cascade mode instead of falling back to a default
+        """
+        if not os.path.exists(classifier_path):
+            raise FileNotFoundError(f"Classifier file not found: {classifier_path}")
+        if not os.path.exists(class_file):
+            raise FileNotFoundError(f"Classifier class file not found: {class_file}")
+        
+        print(f"🔄 Loading part classifier from: {classifier_path}")
+        self.classifier = onnxruntime.InferenceSession(
+            classifier_path,
+            self.session_options,
+            providers=['CPUExecutionProvider']
+        )
+        classifier_input = self.classifier.get_inputs()[0]
+        self.classifier_input_name = classifier_input.name
+        size = classifier_input.shape[2] if len(classifier_input.shape) > 2 else 224
+        self.classifier_size = size if isinstance(size, int) and size > 0 else 224
+        batch_dim = classifier_input.shape[0] if classifier_input.shape else 1
+        self.classifier_batching = not isinstance(batch_dim, int) or batch_dim <= 0
+        self.part_names = tuple(self._load_class_names(class_file))
+        
+        outputs = self.classifier.get_outputs()[0].shape
+        num_outputs = outputs[-1] if outputs else None
+        if isinstance(num_outputs, int) and num_outputs != len(self.part_names):
+            raise ValueError(
+                f"Classifier has {num_outputs} outputs but {class_file} lists {len(self.part_names)} parts"
+            )
+    
+    def _reset_stats(self):
+        self._stats_lock = threading.Lock()
+        self._images = 0
+        self._detection_time = 0.0
+        self._classifier_runs = 0
+        self._classifier_time = 0.0
+        self._crops_classified = 0
+        self._crops_skipped = 0
+        self._crops_relabelled = 0
     
     def _load_class_names(self, class_file='class_names.txt'):
         """Load class names from file"""
@@ -54,32 +149,88 @@ class BrickDetector:
         Detect and classify Lego bricks in an image
         
         Args:
-            image_path: Path to input image
+            image_path: Path to input image (or an already decoded BGR array)
             
         Returns:
-            List of detection dictionaries
+            DetectionArray (indexing or to_dicts() gives API dictionaries)
         """
-        # Read image
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Could not read image: {image_path}")
-        
-        original_shape = image.shape[:2]  # (height, width)
-        
-        # Preprocess
-        preprocessed, ratio, padding = self._preprocess_image(image)
+        # Read and preprocess
+        context = self.prepare(image_path)
         
         # Run inference
-        outputs = self.session.run(None, {self.input_name: preprocessed})
+        started = time.perf_counter()
+        outputs = self.session.run(None, self._feed(context['tensor']))
+        self.record_detection(time.perf_counter() - started)
         
-        # Post-process
-        detections = self._post_process(outputs[0], ratio, padding, original_shape)
+        # Post-process and format results
+        return self.finish(outputs if self.end_to_end else outputs[0], context)
+    
+    def _feed(self, tensor):
+        """Session inputs; end-to-end models also take the thresholds"""
+        feed = {self.input_name: tensor}
+        if self.end_to_end:
+            thresholds = {
+                'conf_threshold': np.array([self.conf_threshold], dtype=np.float32),
+                'iou_threshold': np.array([self.iou_threshold], dtype=np.float32)
+            }
+            feed.update((name, value) for name, value in thresholds.items() if name in self.threshold_inputs)
+        return feed
+    
+    def prepare(self, image_path):
+        """
+        Read and preprocess an image, returning everything finish() needs
         
-        # Format results
-        results = self._format_results(detections, image)
+        The returned context holds the model input tensor (batch size 1) so
+        callers can run several prepared images through one session.run.
+        """
+        image = self._load_image(image_path)
+        if self.end_to_end:
+            # The graph letterboxes and normalizes the raw image itself
+            return {
+                'image': image,
+                'tensor': np.ascontiguousarray(image),
+                'original_shape': image.shape[:2]
+            }
+        preprocessed, ratio, padding = self._preprocess_image(image)
         
+        return {
+            'image': image,
+            'tensor': preprocessed,
+            'ratio': ratio,
+            'padding': padding,
+            'original_shape': image.shape[:2]  # (height, width)
+        }
+    
+    def finish(self, predictions, context):
+        """
+        Turn raw model output for one image into API-formatted detections
+        
+        Args:
+            predictions: Model output for this image, shape [1, 4+classes, anchors]
+                (end-to-end models: their (boxes, scores, class_ids) outputs)
+            context: Dictionary returned by prepare()
+        """
+        if self.end_to_end:
+            detections = tuple(predictions)  # boxes, scores, class_ids
+        else:
+            detections = self._post_process(
+                predictions, context['ratio'], context['padding'], context['original_shape']
+            )
+        results = self._format_results(detections, context['image'])
+        if self.classifier is not None:
+            results = self._classify(results, context['image'])
         return results
     
+    def _load_image(self, image_path):
+        """Read an image from disk, or pass through an already decoded array"""
+        if isinstance(image_path, np.ndarray):
+            return image_path
+        
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"Could not read image: {image_path}")
+        return image
+    
     def _preprocess_image(self, img):
         """
         Preprocess image for YOLO inference
@@ -128,6 +279,9 @@ class BrickDetector:
         - Apply confidence threshold
         - Apply NMS
         - Scale boxes to original image size
+        
+        Returns (boxes, scores, class_ids) arrays, kept as NumPy values: the
+        app's JSON provider serializes them without per-field conversion
         """
         # Remove batch dimension and transpose
         # YOLOv8 output: [batch, 84, 8400] -> [8400, 84]
@@ -145,7 +299,7 @@ class BrickDetector:
         class_ids = class_ids[mask]
         
         if len(boxes) == 0:
-            return []
+            return boxes, scores, class_ids
         
         # Convert from xywh to xyxy format
         boxes = self._xywh2xyxy(boxes)
@@ -154,7 +308,7 @@ class BrickDetector:
         indices = self._non_max_suppression(boxes, scores)
         
         if len(indices) == 0:
-            return []
+            return boxes[:0], scores[:0], class_ids[:0]
         
         boxes = boxes[indices]
         scores = scores[indices]
@@ -163,17 +317,7 @@ class BrickDetector:
         # Scale boxes back to original image
         boxes = self._scale_boxes(boxes, scale, padding, original_shape)
         
-        # Combine into detection list
-        detections = []
-        for box, score, class_id in zip(boxes, scores, class_ids):
-            detections.append({
-                'bbox': box.tolist(),
-                'confidence': float(score),
-                'class_id': int(class_id),
-                'class_name': self.class_names[class_id] if class_id < len(self.class_names) else 'unknown'
-            })
-        
-        return detections
+        return boxes, scores, class_ids
     
     def _xywh2xyxy(self, boxes):
         """Convert [x_center, y_center, w, h] to [x1, y1, x2, y2]"""
@@ -216,35 +360,129 @@ class BrickDetector:
     
     def _format_results(self, detections, image):
         """
-        Format detections for API response
-        Compatible with existing API format
+        Format detections for the API as a DetectionArray
+        Class and color stay integer codes; dicts are only built when the
+        results are serialized
         """
-        results = []
-        brick_counts = {}
+        boxes, scores, class_ids = detections
         
-        for det in detections:
-            bbox = det['bbox']
-            class_name = det['class_name']
-            
-            # Count bricks by class
-            brick_counts[class_name] = brick_counts.get(class_name, 0) + 1
+        # Integer boxes as [x1, y1, x2, y2] for the ROI and [x, y, w, h] for the API
+        corners = boxes.astype(np.int32)
+        xywh = corners.copy()
+        xywh[:, 2:] -= corners[:, :2]
+        
+        # Out-of-range class IDs map to a trailing 'unknown' class
+        class_names = tuple(self.class_names) + ('unknown',)
+        class_codes = np.minimum(class_ids, len(self.class_names))
+        
+        # Extract color from each ROI
+        color_codes = np.empty(len(corners), dtype=np.int32)
+        for i, (x1, y1, x2, y2) in enumerate(corners.tolist()):
+            color_codes[i] = COLOR_CODES[self._detect_color(image[y1:y2, x1:x2])]
+        
+        return DetectionArray(xywh, scores, class_codes, color_codes, class_names=class_names)
+    
+    def record_detection(self, seconds, images=1):
+        """Count detection model time (also called by the batch scheduler)"""
+        with self._stats_lock:
+            self._images += images
+            self._detection_time += seconds
+    
+    def _classify(self, detections, image):
+        """
+        Cascade stage: label crops with the part classifier
+        
+        Crops the detector could not label confidently are resized into one
+        [N, 3, size, size] tensor and classified with a single session.run.
+        Labels below classifier_threshold keep the detector's class.
+        """
+        started = time.perf_counter()
+        num_classes = len(detections.class_names)
+        class_names = detections.class_names + self.part_names
+        
+        generic = np.array([name in GENERIC_CLASSES for name in detections.class_names])
+        if len(self.class_names) == 1:
+            generic[:] = True
+        confident = ~generic[detections.class_code] & (detections.confidence >= self.exit_confidence)
+        large_enough = (detections.bbox[:, 2] >= 2) & (detections.bbox[:, 3] >= 2)
+        pending = np.flatnonzero(~confident & large_enough)
+        
+        class_code = detections.class_code.copy()
+        confidence = detections.confidence.copy()
+        relabelled = 0
+        
+        if len(pending):
+            size = self.classifier_size
+            crops = np.empty((len(pending), size, size, 3), dtype=np.uint8)
+            for n, (x, y, w, h) in enumerate(detections.bbox[pending].tolist()):
+                crops[n] = cv2.resize(image[y:y + h, x:x + w], (size, size), interpolation=cv2.INTER_LINEAR)
             
-            # Extract color from ROI
-            x1, y1, x2, y2 = map(int, bbox)
-            roi = image[y1:y2, x1:x2]
-            color = self._detect_color(roi)
+            # Same normalization as the detector: RGB, [0, 1], NCHW
+            tensor = crops[..., ::-1].astype(np.float32).transpose(0, 3, 1, 2) / 255.0
+            probabilities = self._run_classifier(np.ascontiguousarray(tensor))
             
-            # Format as API expects
-            results.append({
-                "id": f"{class_name}_{brick_counts[class_name]}",
-                "name": class_name,
-                "color": color,
-                "quantity": 1,
-                "confidence": det['confidence'],
-                "bbox": [x1, y1, int(x2-x1), int(y2-y1)]  # [x, y, w, h]
-            })
-        
-        return results
+            best = probabilities.argmax(axis=1)
+            best_probability = probabilities[np.arange(len(best)), best]
+            accepted = best_probability >= self.classifier_threshold
+            targets = pending[accepted]
+            class_code[targets] = num_classes + best[accepted]
+            # P(part) = P(brick) * P(part | brick)
+            confidence[targets] = confidence[targets] * best_probability[accepted]
+            relabelled = int(accepted.sum())
+        
+        with self._stats_lock:
+            if len(pending):
+                self._classifier_runs += 1
+                self._classifier_time += time.perf_counter() - started
+            self._crops_classified += len(pending)
+            self._crops_skipped += len(detections) - len(pending)
+            self._crops_relabelled += relabelled
+        
+        return DetectionArray(
+            detections.bbox, confidence, class_code, detections.color_code,
+            detections.quantity, class_names, detections.color_names
+        )
+    
+    def _run_classifier(self, tensor):
+        """Class probabilities for a batch of crops"""
+        if self.classifier_batching:
+            logits = self.classifier.run(None, {self.classifier_input_name: tensor})[0]
+        else:
+            # Fixed batch dimension: one crop per call
+            logits = np.concatenate([
+                self.classifier.run(None, {self.classifier_input_name: tensor[i:i + 1]})[0]
+                for i in range(len(tensor))
+            ])
+        logits = logits.reshape(len(tensor), -1)
+        if logits.shape[1] != len(self.part_names):  #Symbolic output sizes are only known now
+            raise ValueError(f"Classifier returned {logits.shape[1]} classes for {len(self.part_names)} part names")
+        
+        # Models exported without a softmax return logits
+        if np.any(logits < 0) or not np.allclose(logits.sum(axis=1), 1, atol=1e-3):
+            exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+            return exp / exp.sum(axis=1, keepdims=True)
+        return logits
+    
+    def get_stats(self):
+        """Detection and cascade classifier cost, reported separately"""
+        with self._stats_lock:
+            stats = {
+                "mode": "cascade" if self.classifier is not None else "single",
+                "images": self._images,
+                "avg_detection_ms": round(self._detection_time / self._images * 1000, 2) if self._images else 0
+            }
+            if self.classifier is not None:
+                runs = self._classifier_runs
+                stats["classifier"] = {
+                    "parts": len(self.part_names),
+                    "runs": runs,
+                    "crops_classified": self._crops_classified,
+                    "crops_skipped": self._crops_skipped,
+                    "crops_relabelled": self._crops_relabelled,
+                    "avg_batch_size": round(self._crops_classified / runs, 2) if runs else 0,
+                    "avg_classifier_ms": round(self._classifier_time / runs * 1000, 2) if runs else 0
+                }
+            return stats
     
     def _detect_color(self, roi):
         """
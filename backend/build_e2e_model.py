@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Wrap the YOLOv8 detector in an end-to-end ONNX graph
+
+The wrapped model takes the decoded image as uint8 [height, width, 3] (BGR,
+as cv2 reads it) and does everything BrickDetector otherwise does in Python
+around session.run: letterbox resize and padding, BGR to RGB, scaling to
+[0, 1], HWC to NCHW, confidence filtering, NonMaxSuppression and scaling
+boxes back to the original image. Outputs are the final detections:
+
+    boxes      float32 [n, 4]  x1, y1, x2, y2 in original image pixels
+    scores     float32 [n]
+    class_ids  int64   [n]
+
+conf_threshold and iou_threshold are graph inputs with the build values as
+defaults, so the detector can still override them per session.
+
+Needs the onnx package at build time only (pip install onnx); serving needs
+onnxruntime alone.
+
+Usage:
+    python build_e2e_model.py [--model best.onnx] [--output best_e2e.onnx]
+"""
+
+import argparse
+
+import numpy as np
+
+try:
+    import onnx
+    from onnx import TensorProto, compose, helper, numpy_helper, version_converter
+except ImportError:  #Optional: only needed to build the model
+    onnx = None
+
+MIN_OPSET = 13  #Unsqueeze/Squeeze/Slice take their axes as inputs from here on
+PAD_VALUE = 114  #Letterbox gray, as in BrickDetector._preprocess_image
+
+
+def _const(name, value, dtype=None):
+    return numpy_helper.from_array(np.asarray(value, dtype=dtype), name)
+
+
+def build_end_to_end(model, conf_threshold=0.25, iou_threshold=0.45, max_detections=300):
+    """
+    Return a new ModelProto wrapping a YOLOv8 detection model
+
+    Args:
+        model: ModelProto with input [1, 3, size, size] and output
+            [1, 4 + classes, anchors]
+        conf_threshold: Default minimum score
+        iou_threshold: Default NMS IoU threshold
+        max_detections: Most boxes returned per image
+    """
+    if onnx is None:
+        raise ImportError("Building the end-to-end model needs the onnx package: pip install onnx")
+
+    opset = next(o.version for o in model.opset_import if o.domain in ('', 'ai.onnx'))
+    if opset < MIN_OPSET:
+        model = version_converter.convert_version(model, MIN_OPSET)
+
+    initializer_names = {init.name for init in model.graph.initializer}
+    detector_input = next(i for i in model.graph.input if i.name not in initializer_names)
+    input_size = detector_input.type.tensor_type.shape.dim[2].dim_value or 640
+
+    detector = compose.add_prefix(model, 'detector/')
+    detector_input_name = 'detector/' + detector_input.name
+    detector_output_name = detector.graph.output[0].name
+
+    initializers = [
+        _const('size', float(input_size), np.float32),
+        _const('size_int', [input_size, input_size], np.int64),
+        _const('idx_0', 0, np.int64),
+        _const('idx_1', 1, np.int64),
+        _const('axes_0', [0], np.int64),
+        _const('axes_1', [1], np.int64),
+        _const('zero', 0.0, np.float32),
+        _const('two_int', 2, np.int64),
+        _const('half', 0.5, np.float32),
+        _const('inv_255', 1 / 255.0, np.float32),
+        _const('channels', [3], np.int64),
+        _const('batch_of_one', [1], np.int64),
+        _const('no_pad', [0], np.int64),
+        _const('pad_value', PAD_VALUE, np.uint8),
+        _const('rgb', [2, 1, 0], np.int64),
+        _const('starts_0', [0], np.int64),
+        _const('starts_2', [2], np.int64),
+        _const('starts_4', [4], np.int64),
+        _const('ends_2', [2], np.int64),
+        _const('ends_4', [4], np.int64),
+        _const('ends_max', [np.iinfo(np.int64).max], np.int64),
+        _const('max_detections', [max_detections], np.int64),
+        _const('conf_threshold', [conf_threshold], np.float32),
+        _const('iou_threshold', [iou_threshold], np.float32),
+    ]
+
+    node = helper.make_node
+    preprocess = [
+        # scale = min(size / h, size / w); new size truncated like int() in Python
+        node('Shape', ['image'], ['image_shape']),
+        node('Slice', ['image_shape', 'starts_0', 'ends_2'], ['hw']),
+        node('Cast', ['hw'], ['hw_f'], to=TensorProto.FLOAT),
+        node('Div', ['size', 'hw_f'], ['hw_scales']),
+        node('Gather', ['hw_scales', 'idx_0'], ['scale_h']),
+        node('Gather', ['hw_scales', 'idx_1'], ['scale_w']),
+        node('Min', ['scale_h', 'scale_w'], ['scale']),
+        node('Mul', ['hw_f', 'scale'], ['new_hw_f']),
+        node('Floor', ['new_hw_f'], ['new_hw_floor']),
+        node('Cast', ['new_hw_floor'], ['new_hw'], to=TensorProto.INT64),
+        # 4-D NHWC input takes onnxruntime's fast bilinear path for uint8
+        node('Unsqueeze', ['image', 'axes_0'], ['image_nhwc']),
+        node('Concat', ['batch_of_one', 'new_hw', 'channels'], ['resize_sizes'], axis=0),
+        node('Resize', ['image_nhwc', '', '', 'resize_sizes'], ['resized_nhwc'], mode='linear'),
+        node('Squeeze', ['resized_nhwc', 'axes_0'], ['resized']),
+
+        # Center the image on a gray square
+        node('Sub', ['size_int', 'new_hw'], ['pad_total']),
+        node('Div', ['pad_total', 'two_int'], ['pad_before']),
+        node('Sub', ['pad_total', 'pad_before'], ['pad_after']),
+        node('Concat', ['pad_before', 'no_pad', 'pad_after', 'no_pad'], ['pads'], axis=0),
+        node('Pad', ['resized', 'pads', 'pad_value'], ['padded'], mode='constant'),
+
+        # HWC -> CHW, BGR -> RGB (whole planes), [0, 1], add the batch dimension
+        node('Transpose', ['padded'], ['chw_bgr'], perm=[2, 0, 1]),
+        node('Gather', ['chw_bgr', 'rgb'], ['chw'], axis=0),
+        node('Cast', ['chw'], ['chw_f'], to=TensorProto.FLOAT),
+        node('Mul', ['chw_f', 'inv_255'], ['normalized']),
+        node('Unsqueeze', ['normalized', 'axes_0'], [detector_input_name]),
+    ]
+
+    postprocess = [
+        # [1, 4 + classes, anchors]: boxes as [1, anchors, 4], best class score per anchor
+        node('Slice', [detector_output_name, 'starts_0', 'ends_4', 'axes_1'], ['raw_boxes']),
+        node('Transpose', ['raw_boxes'], ['boxes_cxcywh'], perm=[0, 2, 1]),
+        node('Slice', [detector_output_name, 'starts_4', 'ends_max', 'axes_1'], ['class_scores']),
+        node('ArgMax', ['class_scores'], ['best_class'], axis=1, keepdims=1),
+        node('GatherElements', ['class_scores', 'best_class'], ['best_score'], axis=1),
+
+        # Class-agnostic NMS, like cv2.dnn.NMSBoxes over all boxes
+        node('NonMaxSuppression',
+             ['boxes_cxcywh', 'best_score', 'max_detections', 'iou_threshold', 'conf_threshold'],
+             ['selected'], center_point_box=1),
+        node('Gather', ['selected', 'starts_2'], ['selected_col'], axis=1),
+        node('Squeeze', ['selected_col', 'axes_1'], ['keep']),
+
+        node('Squeeze', ['boxes_cxcywh', 'axes_0'], ['all_boxes']),
+        node('Gather', ['all_boxes', 'keep'], ['kept_boxes'], axis=0),
+        node('Reshape', ['best_score', 'flat_shape'], ['all_scores']),
+        node('Gather', ['all_scores', 'keep'], ['scores'], axis=0),
+        node('Reshape', ['best_class', 'flat_shape'], ['all_classes']),
+        node('Gather', ['all_classes', 'keep'], ['class_ids'], axis=0),
+
+        # xywh -> xyxy, then undo the letterbox and clip to the image
+        node('Slice', ['kept_boxes', 'starts_0', 'ends_2', 'axes_1'], ['centers']),
+        node('Slice', ['kept_boxes', 'starts_2', 'ends_4', 'axes_1'], ['sizes']),
+        node('Mul', ['sizes', 'half'], ['half_sizes']),
+        node('Sub', ['centers', 'half_sizes'], ['top_left']),
+        node('Add', ['centers', 'half_sizes'], ['bottom_right']),
+        node('Concat', ['top_left', 'bottom_right'], ['xyxy'], axis=1),
+        node('Gather', ['pad_before', 'rgb_wh'], ['pad_wh']),
+        node('Concat', ['pad_wh', 'pad_wh'], ['offsets_int'], axis=0),
+        node('Cast', ['offsets_int'], ['offsets'], to=TensorProto.FLOAT),
+        node('Sub', ['xyxy', 'offsets'], ['unpadded']),
+        node('Div', ['unpadded', 'scale'], ['scaled']),
+        node('Gather', ['hw_f', 'rgb_wh'], ['wh_f']),
+        node('Concat', ['wh_f', 'wh_f'], ['limits'], axis=0),
+        node('Max', ['scaled', 'zero'], ['clipped_low']),
+        node('Min', ['clipped_low', 'limits'], ['boxes']),
+    ]
+    initializers += [
+        _const('flat_shape', [-1], np.int64),
+        _const('rgb_wh', [1, 0], np.int64),  #(h, w) -> (w, h)
+    ]
+
+    graph = helper.make_graph(
+        preprocess + list(detector.graph.node) + postprocess,
+        'lego_brick_detector_e2e',
+        inputs=[
+            helper.make_tensor_value_info('image', TensorProto.UINT8, ['height', 'width', 3]),
+            helper.make_tensor_value_info('conf_threshold', TensorProto.FLOAT, [1]),
+            helper.make_tensor_value_info('iou_threshold', TensorProto.FLOAT, [1]),
+        ],
+        outputs=[
+            helper.make_tensor_value_info('boxes', TensorProto.FLOAT, ['detections', 4]),
+            helper.make_tensor_value_info('scores', TensorProto.FLOAT, ['detections']),
+            helper.make_tensor_value_info('class_ids', TensorProto.INT64, ['detections']),
+        ],
+        initializer=initializers + list(detector.graph.initializer),
+    )
+    wrapped = helper.make_model(graph, opset_imports=list(detector.opset_import), producer_name='build_e2e_model')
+    wrapped.ir_version = max(model.ir_version, 7)
+    wrapped.metadata_props.extend(model.metadata_props)
+    onnx.checker.check_model(wrapped)
+    return wrapped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the end-to-end detector model")
+    parser.add_argument('--model', default='best.onnx', help="YOLOv8 ONNX export")
+    parser.add_argument('--output', default='best_e2e.onnx')
+    parser.add_argument('--conf', type=float, default=0.25, help="Default confidence threshold")
+    parser.add_argument('--iou', type=float, default=0.45, help="Default NMS IoU threshold")
+    parser.add_argument('--max-detections', type=int, default=300)
+    args = parser.parse_args()
+
+    if onnx is None:
+        parser.error("the onnx package is required: pip install onnx")
+
+    model = onnx.load(args.model)
+    wrapped = build_end_to_end(model, args.conf, args.iou, args.max_detections)
+    onnx.save(wrapped, args.output)
+    print(f"✅ Wrote {args.output} (input: uint8 HWC image, outputs: boxes, scores, class_ids)")
+
+
+if __name__ == "__main__":
+    main()
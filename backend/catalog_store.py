@@ -0,0 +1,312 @@
+# catalog_store.py - Brick and set metadata catalog
+
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from recommendation_engine import open_csv
+
+# Records served before any dump is loaded; dump fields are merged into them
+SEED_BRICKS = [
+    {
+        "id": "3001",
+        "official_name": "Brick 2x4",
+        "alternate_names": ["2x4 Brick", "Basic Brick"],
+        "colors_available": ["Red", "Blue", "Yellow", "Green", "Black", "White", "Gray"],
+        "first_released": "1958",
+        "weight_g": 2.32,
+        "dimensions_mm": {"length": 31.8, "width": 15.9, "height": 9.6},
+        "sets_contained_in": ["10698", "11011", "10717"],
+        "category": "Basic Bricks",
+        "material": "ABS Plastic",
+        "description": "The classic 2x4 Lego brick, first produced in 1958."
+    },
+    {
+        "id": "3003",
+        "official_name": "Brick 2x2",
+        "alternate_names": ["2x2 Brick"],
+        "colors_available": ["Red", "Blue", "Yellow", "Green", "Black", "White"],
+        "first_released": "1958",
+        "weight_g": 1.05,
+        "dimensions_mm": {"length": 15.9, "width": 15.9, "height": 9.6},
+        "sets_contained_in": ["10698", "11011"],
+        "category": "Basic Bricks"
+    },
+    {
+        "id": "3023",
+        "official_name": "Plate 1x2",
+        "alternate_names": ["1x2 Plate"],
+        "colors_available": ["Red", "Blue", "Yellow", "Green", "Black", "White", "Gray"],
+        "first_released": "1963",
+        "weight_g": 0.42,
+        "dimensions_mm": {"length": 15.9, "width": 7.95, "height": 3.2},
+        "sets_contained_in": ["10698", "10717"],
+        "category": "Plates"
+    }
+]
+
+SEED_SETS = [
+    {
+        "set_id": "10698",
+        "name": "Classic Creative Brick Box",
+        "year": 2023,
+        "pieces": 790,
+        "minifigures": 0,
+        "age_range": "4+",
+        "theme": "Classic",
+        "price_usd": 49.99,
+        "weight_kg": 1.2,
+        "dimensions_cm": {"length": 26.2, "width": 14.1, "height": 7.1},
+        "bricks_included": [
+            {"id": "3001", "quantity": 12, "color": "Red"},
+            {"id": "3001", "quantity": 8, "color": "Blue"},
+            {"id": "3003", "quantity": 10, "color": "Yellow"},
+            {"id": "3023", "quantity": 15, "color": "Green"}
+        ],
+        "build_time_minutes": 120,
+        "difficulty": "Beginner",
+        "description": "A creative brick box with ideas for multiple builds."
+    },
+    {
+        "set_id": "31134",
+        "name": "Space Rocket",
+        "year": 2023,
+        "pieces": 837,
+        "minifigures": 0,
+        "age_range": "7+",
+        "theme": "Space",
+        "price_usd": 59.99,
+        "bricks_included": [
+            {"id": "3001", "quantity": 15, "color": "White"},
+            {"id": "3004", "quantity": 8, "color": "Blue"},
+            {"id": "3622", "quantity": 6, "color": "Red"}
+        ],
+        "build_time_minutes": 180,
+        "difficulty": "Intermediate",
+        "description": "Build your own space rocket with detailed features."
+    }
+]
+
+# Record kind -> (table, ID field)
+KINDS = {
+    "brick": ("bricks", "id"),
+    "set": ("sets", "set_id")
+}
+
+MAX_SQL_VARIABLES = 500  #IDs per IN (...) query
+
+
+class CatalogStore:
+    def __init__(self, db_path, cache_size=4096):
+        """
+        Brick and set metadata keyed by part number and set number
+
+        Records are stored as JSON documents in SQLite (primary key lookups)
+        and the most recently used ones are kept in an in-process LRU cache.
+        Bulk lookups fetch every uncached ID with one query. The catalog is
+        seeded with a few built-in records and filled from Rebrickable CSV
+        dumps with load_dumps().
+
+        Args:
+            db_path: SQLite database file
+            cache_size: Records kept in memory
+        """
+        self.db_path = db_path
+        self.cache_size = cache_size
+
+        self._reset_after_fork()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+        self._create_schema()
+
+    def _reset_after_fork(self):
+        # SQLite connections must not be shared across fork
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self._connect()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS bricks (id TEXT PRIMARY KEY, record TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS sets (id TEXT PRIMARY KEY, record TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        ''')
+        for kind, records in (('brick', SEED_BRICKS), ('set', SEED_SETS)):
+            table, id_field = KINDS[kind]
+            conn.executemany(
+                f'INSERT OR IGNORE INTO {table} (id, record) VALUES (?, ?)',
+                [(r[id_field], json.dumps(r)) for r in records]
+            )
+
+    def get(self, kind, record_id):
+        """One brick or set record, or None if unknown"""
+        return self.get_many(kind, [record_id]).get(record_id)
+
+    def get_many(self, kind, record_ids):
+        """
+        Records for many IDs as {id: record}; unknown IDs are left out
+        Cached records are served from memory, the rest with one query per
+        MAX_SQL_VARIABLES IDs.
+        """
+        table, _ = KINDS[kind]
+        found = {}
+        missing = []
+
+        with self._lock:
+            for record_id in dict.fromkeys(record_ids):
+                record = self._cache.get((kind, record_id))
+                if record is not None:
+                    self._cache.move_to_end((kind, record_id))
+                    found[record_id] = record
+                    self._hits += 1
+                else:
+                    missing.append(record_id)
+                    self._misses += 1
+
+        loaded = {}
+        conn = self._connect()
+        for i in range(0, len(missing), MAX_SQL_VARIABLES):
+            chunk = missing[i:i + MAX_SQL_VARIABLES]
+            rows = conn.execute(
+                f'SELECT id, record FROM {table} WHERE id IN ({",".join("?" * len(chunk))})', chunk
+            ).fetchall()
+            loaded.update((record_id, json.loads(record)) for record_id, record in rows)
+
+        if loaded:
+            with self._lock:
+                for record_id, record in loaded.items():
+                    self._cache[(kind, record_id)] = record
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            found.update(loaded)
+        return found
+
+    def put_many(self, kind, records):
+        """Insert records, merging their fields into existing ones"""
+        table, id_field = KINDS[kind]
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                f'''INSERT INTO {table} (id, record) VALUES (?, ?)
+                    ON CONFLICT(id) DO UPDATE SET record = json_patch(record, excluded.record)''',
+                [(str(r[id_field]), json.dumps(r)) for r in records]
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        with self._lock:
+            self._cache.clear()
+        return len(records)
+
+    def load_dumps(self, folder):
+        """
+        Load parts.csv and sets.csv (plus part_categories.csv and themes.csv
+        for readable names) from a Rebrickable dump folder
+        Returns the number of (bricks, sets) loaded.
+        """
+        def read(name):
+            if not (os.path.exists(os.path.join(folder, name + '.csv')) or
+                    os.path.exists(os.path.join(folder, name + '.csv.gz'))):
+                return []
+            handle, reader = open_csv(folder, name)
+            with handle:
+                return list(reader)
+
+        categories = {row['id']: row['name'] for row in read('part_categories')}
+        themes = {row['id']: row['name'] for row in read('themes')}
+
+        bricks = [
+            {
+                "id": row['part_num'],
+                "official_name": row['name'],
+                "category": categories.get(row.get('part_cat_id'), row.get('part_cat_id')),
+                "material": row.get('part_material')
+            }
+            for row in read('parts')
+        ]
+        sets = [
+            {
+                "set_id": row['set_num'],
+                "name": row['name'],
+                "year": int(row['year']) if row.get('year') else None,
+                "pieces": int(row['num_parts']) if row.get('num_parts') else None,
+                "theme": themes.get(row.get('theme_id'), row.get('theme_id')),
+                "image_url": row.get('img_url') or None
+            }
+            for row in read('sets')
+        ]
+        # Missing fields would erase existing values in the JSON merge
+        bricks = [{k: v for k, v in r.items() if v is not None} for r in bricks]
+        sets = [{k: v for k, v in r.items() if v is not None} for r in sets]
+        return self.put_many('brick', bricks), self.put_many('set', sets)
+
+    def load_dumps_if_changed(self, folder):
+        """Load the dumps when they changed since the last load (compared by size and mtime)"""
+        signature = []
+        for name in ('parts', 'sets', 'part_categories', 'themes'):
+            for path in (os.path.join(folder, name + '.csv'), os.path.join(folder, name + '.csv.gz')):
+                if os.path.exists(path):
+                    stat = os.stat(path)
+                    signature.append(f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}")
+        if not signature:
+            return None
+
+        signature = ';'.join(signature)
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'dump_signature'").fetchone()
+        if row and row[0] == signature:
+            return None
+
+        loaded = self.load_dumps(folder)
+        conn.execute(
+            "INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('dump_signature', ?)", (signature,)
+        )
+        return loaded
+
+    def get_stats(self):
+        """Record counts and cache effectiveness"""
+        conn = self._connect()
+        bricks = conn.execute('SELECT COUNT(*) FROM bricks').fetchone()[0]
+        sets = conn.execute('SELECT COUNT(*) FROM sets').fetchone()[0]
+
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "bricks": bricks,
+                "sets": sets,
+                "cached": len(self._cache),
+                "cache_size": self.cache_size,
+                "cache_hits": self._hits,
+                "cache_misses": self._misses,
+                "cache_hit_rate": round(self._hits / lookups, 3) if lookups else 0
+            }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Catalog store maintenance")
+    parser.add_argument('command', choices=['load'])
+    parser.add_argument('--db', default=os.path.join(os.environ.get('DATA_FOLDER', 'data'), 'catalog.db'))
+    parser.add_argument('--folder', default=os.environ.get('CATALOG_FOLDER', 'catalog'))
+    args = parser.parse_args()
+
+    store = CatalogStore(args.db)
+    bricks, sets = store.load_dumps(args.folder)
+    print(f"✅ Loaded {bricks} bricks and {sets} sets: {store.get_stats()}")
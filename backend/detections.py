@@ -0,0 +1,190 @@
+# detections.py - Compact array-backed detection results
+
+import io
+
+import numpy as np
+
+# Colors reported by BrickDetector._detect_color, in code order
+COLOR_NAMES = ('Unknown', 'Black', 'White', 'Gray', 'Red', 'Orange', 'Yellow', 'Green', 'Blue', 'Purple')
+COLOR_CODES = {name: code for code, name in enumerate(COLOR_NAMES)}
+
+DEFAULT_CONFIDENCE = 0.5
+DEFAULT_BBOX = (0, 0, 100, 100)
+
+
+class DetectionArray:
+    def __init__(self, bbox, confidence, class_code, color_code, quantity=None,
+                 class_names=('lego_brick',), color_names=COLOR_NAMES):
+        """
+        Detections as parallel NumPy arrays instead of one dict per object
+
+        Class and color are integer codes into the shared class_names and
+        color_names tuples, so a scene with thousands of bricks holds a few
+        arrays rather than thousands of dicts and strings. Grouping by
+        (class, color) is a single np.unique over combined codes, and dicts
+        are only built by to_dicts() when the result is serialized.
+
+        Indexing and iteration return one detection as a dict, so code that
+        reads a few results (tests, scripts) works as with the old lists.
+        Indexing builds only the requested row; iteration builds the dicts
+        once and reuses them.
+
+        Args:
+            bbox: [n, 4] integer boxes as [x, y, w, h]
+            confidence: [n] detection scores
+            class_code: [n] indices into class_names
+            color_code: [n] indices into color_names
+            quantity: [n] brick counts (default 1 each)
+            class_names: Class name per code
+            color_names: Color name per code
+        """
+        self.bbox = np.asarray(bbox, dtype=np.int32).reshape(-1, 4)
+        self.confidence = np.asarray(confidence, dtype=np.float32)
+        self.class_code = np.asarray(class_code, dtype=np.int32)
+        self.color_code = np.asarray(color_code, dtype=np.int32)
+        if quantity is None:
+            quantity = np.ones(len(self.class_code), dtype=np.int32)
+        self.quantity = np.asarray(quantity, dtype=np.int32)
+        self.class_names = tuple(class_names)
+        self.color_names = tuple(color_names)
+        self._dicts = None
+
+    @classmethod
+    def from_dicts(cls, detections):
+        """Build from API-style dicts (name, color, quantity, confidence, bbox)"""
+        class_codes = {}
+        color_codes = {}
+        n = len(detections)
+        bbox = np.empty((n, 4), dtype=np.int32)
+        confidence = np.empty(n, dtype=np.float32)
+        class_code = np.empty(n, dtype=np.int32)
+        color_code = np.empty(n, dtype=np.int32)
+        quantity = np.empty(n, dtype=np.int32)
+
+        for i, detection in enumerate(detections):
+            class_code[i] = class_codes.setdefault(detection.get('name', 'Unknown'), len(class_codes))
+            color_code[i] = color_codes.setdefault(detection.get('color', 'Unknown'), len(color_codes))
+            quantity[i] = detection.get('quantity', 1)
+            confidence[i] = detection.get('confidence', DEFAULT_CONFIDENCE)
+            bbox[i] = detection.get('bbox', DEFAULT_BBOX)
+
+        return cls(bbox, confidence, class_code, color_code, quantity,
+                   class_names=class_codes, color_names=color_codes)
+
+    def __len__(self):
+        return len(self.class_code)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._cached_dicts()[i]
+        if self._dicts is not None:
+            return self._dicts[i]
+        n = len(self)
+        if not -n <= i < n:
+            raise IndexError("detection index out of range")
+        i %= n
+        # The id numbers detections per class, so count the earlier ones of this class
+        class_code = self.class_code[i]
+        number = int(np.count_nonzero(self.class_code[:i + 1] == class_code))
+        name = self.class_names[class_code]
+        return self._row(i, name, f"{name}_{number}")
+
+    def __iter__(self):
+        return iter(self._cached_dicts())
+
+    def _cached_dicts(self):
+        if self._dicts is None:
+            self._dicts = self.to_dicts()
+        return self._dicts
+
+    def aggregate(self):
+        """
+        One entry per (class, color): quantities summed, highest confidence,
+        bbox of the first detection; groups keep first-seen order
+        """
+        if not len(self):
+            return self
+
+        keys = self.class_code.astype(np.int64) * len(self.color_names) + self.color_code
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        # np.unique numbers groups by key; renumber them by first appearance
+        order = np.argsort(first, kind='stable')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        group = rank[inverse]
+
+        quantity = np.bincount(group, weights=self.quantity, minlength=len(order))
+        by_group = np.argsort(group, kind='stable')
+        starts = np.searchsorted(group[by_group], np.arange(len(order)))
+        confidence = np.maximum.reduceat(self.confidence[by_group], starts)
+
+        representative = first[order]
+        return DetectionArray(
+            self.bbox[representative], confidence,
+            self.class_code[representative], self.color_code[representative],
+            quantity, self.class_names, self.color_names
+        )
+
+    def to_dicts(self, part_id=None):
+        """
+        API dicts, one per entry
+
+        Args:
+            part_id: Optional function mapping a class name to a part number
+                (called once per class). Without it, ids are '<name>_<n>'
+                numbered per class, as the detector reports them.
+        """
+        names = self.class_names
+        colors = self.color_names
+        ids = [part_id(name) for name in names] if part_id else None
+        counts = {}
+        results = []
+
+        for i, (class_code, color_code) in enumerate(zip(self.class_code.tolist(), self.color_code.tolist())):
+            name = names[class_code]
+            if ids:
+                detection_id = ids[class_code]
+            else:
+                counts[name] = counts.get(name, 0) + 1
+                detection_id = f"{name}_{counts[name]}"
+            results.append(self._row(i, name, detection_id, colors[color_code]))
+        return results
+
+    def _row(self, i, name, detection_id, color=None):
+        return {
+            "id": detection_id,
+            "name": name,
+            "color": color if color is not None else self.color_names[self.color_code[i]],
+            "quantity": int(self.quantity[i]),
+            "confidence": self.confidence[i],
+            "bbox": self.bbox[i]  # [x, y, w, h]
+        }
+
+    def nbytes(self):
+        """Memory held by the arrays"""
+        return sum(a.nbytes for a in (self.bbox, self.confidence, self.class_code, self.color_code, self.quantity))
+
+    def to_bytes(self):
+        """Compact binary form (an .npz archive) for sending between processes"""
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            bbox=self.bbox, confidence=self.confidence, class_code=self.class_code,
+            color_code=self.color_code, quantity=self.quantity,
+            class_names=np.array(self.class_names, dtype=str),
+            color_names=np.array(self.color_names, dtype=str)
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Inverse of to_bytes()"""
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            return cls(
+                arrays['bbox'], arrays['confidence'], arrays['class_code'], arrays['color_code'],
+                quantity=arrays['quantity'],
+                class_names=arrays['class_names'].tolist(),
+                color_names=arrays['color_names'].tolist()
+            )
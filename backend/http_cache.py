@@ -0,0 +1,139 @@
+# http_cache.py - ETags, Cache-Control and compression for API responses
+
+import gzip
+import hashlib
+import threading
+import time
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  #Optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+
+def compress(data, encoding, gzip_level=6, brotli_quality=5):
+    """Encode bytes with 'gzip' or 'br'"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+class ResponseLayer:
+    def __init__(self, app=None, cache_rules=None, default_cache_control='no-cache',
+                 min_size=1024, gzip_level=6, brotli_quality=5):
+        """
+        after_request layer adding validators, cache rules and compression
+
+        Successful GET responses get a strong ETag (hash of the body) and a
+        Cache-Control header chosen by endpoint name. A matching If-None-Match
+        returns 304 before anything is compressed. Bodies of at least
+        min_size bytes are compressed with brotli (when installed) or gzip,
+        whichever the client prefers in Accept-Encoding. Streamed responses
+        and ones whose view already set an ETag keep their own validators.
+
+        Args:
+            app: Flask app (or call init_app later)
+            cache_rules: {endpoint name: Cache-Control value}
+            default_cache_control: For GET endpoints without a rule
+            min_size: Smallest body worth compressing, in bytes
+            gzip_level: gzip compression level (1-9)
+            brotli_quality: brotli quality (0-11)
+        """
+        self.cache_rules = cache_rules or {}
+        self.default_cache_control = default_cache_control
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ['br', 'gzip'] if brotli else ['gzip']
+
+        self._lock = threading.Lock()
+        self._not_modified = 0
+        self._compressed = {encoding: [0, 0, 0, 0.0] for encoding in self.encodings}  #responses, in, out, seconds
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.process)
+
+    def process(self, response):
+        if response.is_streamed or response.direct_passthrough:
+            return response
+
+        encoding = self._negotiate(response)
+        if request.method in ('GET', 'HEAD') and response.status_code == 200:
+            if 'Cache-Control' not in response.headers:
+                response.headers['Cache-Control'] = self.cache_rules.get(request.endpoint, self.default_cache_control)
+            if 'ETag' not in response.headers:
+                # Each encoding is a different representation, so it gets its own tag
+                digest = hashlib.blake2b(response.get_data(), digest_size=16).hexdigest()
+                response.set_etag(f"{digest}-{encoding}" if encoding else digest)
+
+            if request.if_none_match.contains_weak(response.get_etag()[0]):
+                with self._lock:
+                    self._not_modified += 1
+                return self._not_modified_response(response)
+
+        if encoding:
+            self._compress(response, encoding)
+        return response
+
+    def _negotiate(self, response):
+        """Encoding to use for this response, or None"""
+        if not response.mimetype or not response.mimetype.startswith(COMPRESSIBLE_TYPES):
+            return None
+        response.vary.add('Accept-Encoding')
+        if 'Content-Encoding' in response.headers or response.content_length is None:
+            return None
+        if response.content_length < self.min_size:
+            return None
+        return request.accept_encodings.best_match(self.encodings)
+
+    def _compress(self, response, encoding):
+        data = response.get_data()
+        started = time.perf_counter()
+        compressed = compress(data, encoding, self.gzip_level, self.brotli_quality)
+        elapsed = time.perf_counter() - started
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak and not etag.endswith(f"-{encoding}"):
+            # A view's own strong tag no longer identifies these exact bytes
+            response.set_etag(etag, weak=True)
+
+        with self._lock:
+            stats = self._compressed[encoding]
+            stats[0] += 1
+            stats[1] += len(data)
+            stats[2] += len(compressed)
+            stats[3] += elapsed
+
+    def _not_modified_response(self, response):
+        response.status_code = 304
+        response.set_data(b'')
+        for header in ('Content-Type', 'Content-Length'):
+            response.headers.pop(header, None)
+        return response
+
+    def get_stats(self):
+        """304s served and compression ratio and CPU time per encoding"""
+        with self._lock:
+            return {
+                "not_modified": self._not_modified,
+                "min_size": self.min_size,
+                "encodings": {
+                    encoding: {
+                        "responses": count,
+                        "bytes_in": bytes_in,
+                        "bytes_out": bytes_out,
+                        "ratio": round(bytes_in / bytes_out, 2) if bytes_out else 0,
+                        "avg_cpu_ms": round(seconds / count * 1000, 3) if count else 0
+                    }
+                    for encoding, (count, bytes_in, bytes_out, seconds) in self._compressed.items()
+                }
+            }
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Split deployment: API front-ends queue detections, inference nodes run them
+
+Front-ends submit the encoded image (the uploaded JPEG/PNG bytes) to a
+broker and wait for the result; inference workers lease jobs, decode and
+run BrickDetector, and publish the detections back. Workers can be added or
+removed at any time. A leased job that is not completed within
+lease_seconds (the worker died or hung) is handed to another worker, up to
+max_attempts times.
+
+The broker is pluggable: anything implementing the Broker methods works.
+SQLiteBroker keeps the queue in one SQLite file, so front-ends and workers
+on one machine (or sharing a local disk) need no extra service.
+
+Usage:
+    # Front-end: app.py with INFERENCE_BROKER=data/broker.db
+    python inference_broker.py worker --broker data/broker.db --model-dir models/v3
+    python inference_broker.py worker --broker data/broker.db --model best.onnx --version default
+
+Workers only take jobs for the version they serve, which must match the
+front-end's version name: --model-dir serves a models/ folder under its
+name, as ModelRegistry does; --model needs an explicit --version.
+"""
+
+import argparse
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+from detections import DetectionArray
+from model_registry import MODEL_FILES, version_spec
+
+ORPHAN_TTL_SECONDS = 60 * 60  #Results nobody collected (the front-end timed out) are dropped
+
+
+class InferenceTimeout(TimeoutError):
+    """No inference worker finished the job in time (HTTP 504)"""
+
+
+class InferenceFailed(RuntimeError):
+    """The job failed on the workers, after its retries (HTTP 503)"""
+
+
+class Broker(ABC):
+    """Interface shared by broker implementations; incomplete ones cannot be instantiated"""
+
+    @abstractmethod
+    def submit(self, image_bytes, model_version=None):
+        """Queue an encoded image; returns the job ID"""
+
+    @abstractmethod
+    def wait(self, job_id, timeout):
+        """Block until the job finishes; returns its DetectionArray"""
+
+    @abstractmethod
+    def lease(self, worker_id, model_version=None, timeout=1.0):
+        """Take the next job for this worker: (job_id, image_bytes, model_version) or None"""
+
+    @abstractmethod
+    def complete(self, job_id, worker_id, detections):
+        """Publish a leased job's detections"""
+
+    @abstractmethod
+    def fail(self, job_id, worker_id, error):
+        """Mark a leased job as failed"""
+
+    @abstractmethod
+    def get_stats(self):
+        """Queue depth and wait metrics"""
+
+
+class SQLiteBroker(Broker):
+    def __init__(self, db_path, lease_seconds=30, max_attempts=3, poll_interval=0.02):
+        """
+        Broker backed by a single SQLite file, shared between processes
+
+        Args:
+            db_path: SQLite database file
+            lease_seconds: How long a worker may hold a job before it is retried
+            max_attempts: Leases per job before it fails
+            poll_interval: Longest sleep between checks while waiting
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+
+        self._reset_after_fork()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+        self._create_schema()
+
+    def _reset_after_fork(self):
+        # SQLite connections must not be shared across fork
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')  #Jobs are transient, a lost commit is resubmitted
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        self._connect().executescript('''
+            CREATE TABLE IF NOT EXISTS inference_jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                model_version TEXT,
+                image BLOB,
+                result BLOB,
+                error TEXT,
+                worker_id TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                leased_at REAL,
+                lease_until REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_inference_jobs_lease ON inference_jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_inference_jobs_finished ON inference_jobs (finished_at);
+        ''')
+
+    def submit(self, image_bytes, model_version=None):
+        job_id = f"inf_{uuid.uuid4().hex}"
+        self._connect().execute(
+            'INSERT INTO inference_jobs (job_id, status, model_version, image, created_at) VALUES (?, ?, ?, ?, ?)',
+            (job_id, 'queued', model_version, sqlite3.Binary(image_bytes), time.time())
+        )
+        with self._lock:
+            self._submitted += 1
+        return job_id
+
+    def wait(self, job_id, timeout):
+        """
+        Poll until the job is done, then remove it
+        Raises InferenceFailed if it failed and InferenceTimeout if no worker finished it in time.
+        """
+        conn = self._connect()
+        started = time.monotonic()
+        delay = 0.001
+        while True:
+            row = conn.execute(
+                'SELECT status, result, error FROM inference_jobs WHERE job_id = ?', (job_id,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown inference job: {job_id}")
+            if row['status'] in ('completed', 'failed'):
+                break
+            if time.monotonic() - started > timeout:
+                # Nobody will collect it now, so stop workers from picking it up
+                conn.execute("DELETE FROM inference_jobs WHERE job_id = ? AND status = 'queued'", (job_id,))
+                raise InferenceTimeout(f"No inference worker finished the job within {timeout}s")
+            time.sleep(delay)
+            delay = min(delay * 2, self.poll_interval)
+
+        conn.execute('DELETE FROM inference_jobs WHERE job_id = ?', (job_id,))
+        with self._lock:
+            self._wait_total += time.monotonic() - started
+            if row['status'] == 'failed':
+                self._failed += 1
+            else:
+                self._completed += 1
+        if row['status'] == 'failed':
+            raise InferenceFailed(f"Inference failed: {row['error']}")
+        return DetectionArray.from_bytes(row['result'])
+
+    def _claim(self, worker_id, model_version):
+        """Atomically lease the oldest job, retrying expired leases and failing exhausted ones"""
+        conn = self._connect()
+        now = time.time()
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM inference_jobs WHERE finished_at < ?', (now - ORPHAN_TTL_SECONDS,))
+            conn.execute(
+                '''UPDATE inference_jobs SET status = 'failed', finished_at = ?, image = NULL,
+                   error = 'Lease expired ' || attempts || ' times (worker died or timed out)'
+                   WHERE status = 'leased' AND lease_until < ? AND attempts >= ?''',
+                (now, now, self.max_attempts)
+            )
+            row = conn.execute(
+                '''SELECT job_id, image, model_version FROM inference_jobs
+                   WHERE (status = 'queued' OR (status = 'leased' AND lease_until < ?))
+                   AND (model_version IS NULL OR model_version = ?)
+                   ORDER BY created_at LIMIT 1''',
+                (now, model_version)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    '''UPDATE inference_jobs SET status = 'leased', worker_id = ?, leased_at = ?,
+                       lease_until = ?, attempts = attempts + 1 WHERE job_id = ?''',
+                    (worker_id, now, now + self.lease_seconds, row['job_id'])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return row
+
+    def lease(self, worker_id, model_version=None, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while True:
+            row = self._claim(worker_id, model_version)
+            if row is not None:
+                return row['job_id'], bytes(row['image']), row['model_version']
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, self.poll_interval)
+
+    def _finish(self, job_id, worker_id, status, result=None, error=None):
+        # Only the current lease holder may finish; a retried job belongs to its new worker
+        self._connect().execute(
+            '''UPDATE inference_jobs SET status = ?, result = ?, error = ?, image = NULL,
+               finished_at = ?, lease_until = NULL
+               WHERE job_id = ? AND worker_id = ? AND status = 'leased' ''',
+            (status, result, error, time.time(), job_id, worker_id)
+        )
+
+    def complete(self, job_id, worker_id, detections):
+        self._finish(job_id, worker_id, 'completed', result=sqlite3.Binary(detections.to_bytes()))
+
+    def fail(self, job_id, worker_id, error):
+        self._finish(job_id, worker_id, 'failed', error=str(error))
+
+    def get_stats(self):
+        """Queue depth and results collected by this process"""
+        counts = dict(self._connect().execute(
+            'SELECT status, COUNT(*) FROM inference_jobs GROUP BY status'
+        ).fetchall())
+        retried = self._connect().execute(
+            "SELECT COUNT(*) FROM inference_jobs WHERE attempts > 1 AND status != 'completed'"
+        ).fetchone()[0]
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "enabled": True,
+                "backend": "sqlite",
+                "queued": counts.get('queued', 0),
+                "leased": counts.get('leased', 0),
+                "retrying": retried,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_wait_ms": round(self._wait_total / finished * 1000, 2) if finished else 0
+            }
+
+
+class RemoteDetector:
+    """Detector stand-in for front-ends: detection runs on the broker's workers"""
+
+    supports_batching = False
+    memory_bytes = 0  #The weights are loaded by the workers, not this process
+
+    def __init__(self, broker, model_version=None, timeout=60):
+        """
+        Args:
+            broker: Broker to submit images to
+            model_version: Version workers must serve (None: any worker)
+            timeout: Seconds to wait for a worker before failing the request
+        """
+        self.broker = broker
+        self.model_version = model_version
+        self.timeout = timeout
+
+    def detect_bricks(self, image_path, deadline=None):
+        """
+        Same contract as BrickDetector.detect_bricks
+        With a request Deadline the wait ends when it does (DeadlineExceeded)
+        instead of after the full timeout.
+        """
+        timeout = self.timeout
+        if deadline:
+            deadline.check('inference')
+            timeout = min(timeout, deadline.remaining())
+        if isinstance(image_path, np.ndarray):
+            ok, encoded = cv2.imencode('.png', image_path)
+            if not ok:
+                raise ValueError("Could not encode image")
+            image_bytes = encoded.tobytes()
+        else:
+            # Send the file as uploaded: a JPEG is far smaller than the decoded tensor
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+        job_id = self.broker.submit(image_bytes, self.model_version)
+        try:
+            return self.broker.wait(job_id, timeout)
+        except InferenceTimeout:
+            if deadline:
+                deadline.check('inference result')  #Out of time: a 504 like the in-process path
+            raise
+
+    def get_stats(self):
+        return {"mode": "remote", "model_version": self.model_version}
+
+
+def run_worker(broker, detector, model_version=None, worker_id=None, max_jobs=None, stop=None):
+    """
+    Lease and run jobs until stop is set (or max_jobs are done)
+
+    Args:
+        broker: Broker to lease from
+        detector: Object with detect_bricks (a BrickDetector)
+        model_version: Version this worker serves; it only takes jobs for it
+        worker_id: Name recorded on leased jobs (default host:pid)
+        max_jobs: Stop after this many jobs
+        stop: Optional threading.Event to stop the loop
+
+    Returns:
+        Number of jobs processed
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    processed = 0
+    while (max_jobs is None or processed < max_jobs) and not (stop and stop.is_set()):
+        job = broker.lease(worker_id, model_version)
+        if job is None:
+            continue
+        job_id, image_bytes, _ = job
+        try:
+            image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError("Could not decode image")
+            broker.complete(job_id, worker_id, detector.detect_bricks(image))
+        except Exception as e:
+            broker.fail(job_id, worker_id, e)
+        processed += 1
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference worker pulling detection jobs from a broker")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    worker_parser = subparsers.add_parser('worker', help="Run detections for the front-ends")
+    worker_parser.add_argument('--broker', default=os.path.join('data', 'broker.db'), help="SQLite broker file")
+    source = worker_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--model-dir', help="Version folder, e.g. models/v3; the version is the folder name")
+    source.add_argument('--model', help="Single model file, e.g. best.onnx; needs --version")
+    worker_parser.add_argument('--class-file', default='class_names.txt', help="With --model")
+    worker_parser.add_argument('--classifier', help="Part classifier for cascade mode, with --model")
+    worker_parser.add_argument('--version', help="Model version served, as in /api/models ('default' without models/)")
+    worker_parser.add_argument('--threads', type=int, default=0, help="onnxruntime threads (0: all cores)")
+    worker_parser.add_argument('--lease-seconds', type=float, default=30)
+    worker_parser.add_argument('--max-jobs', type=int, help="Exit after this many jobs")
+    args = parser.parse_args()
+
+    if args.model_dir:
+        spec = version_spec(args.model_dir)
+        if spec is None:
+            parser.error(f"No model file ({', '.join(MODEL_FILES)}) in {args.model_dir}")
+        version = args.version or spec['version']
+        classifier_path = spec['classifier_path'] if os.path.exists(spec['classifier_path']) else None
+        options = dict(class_file=spec['class_file'], classifier_path=classifier_path,
+                       classifier_class_file=spec['classifier_class_file'])
+        model_path = spec['model_path']
+    else:
+        if not args.version:
+            parser.error("--model needs --version, the name front-ends request (see /api/models)")
+        version = args.version
+        options = dict(class_file=args.class_file, classifier_path=args.classifier)
+        model_path = args.model
+
+    from brick_detector import BrickDetector
+    detector = BrickDetector(model_path, intra_op_threads=args.threads, **options)
+    broker = SQLiteBroker(args.broker, lease_seconds=args.lease_seconds)
+    print(f"✅ Worker {os.getpid()} serving model {version} from {args.broker}", flush=True)
+    try:
+        run_worker(broker, detector, version, max_jobs=args.max_jobs)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
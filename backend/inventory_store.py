@@ -0,0 +1,652 @@
+# inventory_store.py - SQLite-backed brick inventory
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from queue import Queue, Empty
+
+# Statements are constant strings so each pooled connection compiles them once
+# and reuses them from sqlite3's per-connection statement cache
+UPSERT_ADD_SQL = '''
+    INSERT INTO inventory (part_id, color, name, quantity, last_updated)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(part_id, color) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        name = excluded.name,
+        last_updated = excluded.last_updated
+'''
+UPSERT_SET_SQL = '''
+    INSERT INTO inventory (part_id, color, name, quantity, last_updated)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(part_id, color) DO UPDATE SET
+        quantity = excluded.quantity,
+        last_updated = excluded.last_updated
+'''
+SELECT_COLUMNS = 'SELECT part_id, name, color, quantity, last_updated FROM inventory'
+
+
+def utc_timestamp():
+    return datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class InventoryStore:
+    def __init__(self, db_path, pool_size=4):
+        """
+        Brick inventory keyed by (part ID, color)
+
+        Uses SQLite in WAL mode so readers never block the single writer, with
+        indexes for the color, part ID and quantity filters of GET
+        /api/inventory. Connections come from a small pool shared by request
+        threads; every write runs as one transaction.
+
+        Args:
+            db_path: SQLite database file
+            pool_size: Maximum number of open connections
+        """
+        self.db_path = db_path
+        self.pool_size = pool_size
+
+        self._reset_after_fork()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+        with self._connection() as conn:
+            self._create_schema(conn)
+
+    def _reset_after_fork(self):
+        # SQLite connections must not be shared across fork
+        self._pool = Queue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')  #Safe with WAL, avoids an fsync per commit
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a pooled connection, opening one if the pool is not full yet"""
+        try:
+            conn = self._pool.get_nowait()
+        except Empty:
+            with self._lock:
+                can_open = self._opened < self.pool_size
+                if can_open:
+                    self._opened += 1
+            conn = self._open() if can_open else self._pool.get()
+
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction; takes the write lock up front to avoid upgrade deadlocks"""
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _create_schema(self, conn):
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS inventory (
+                part_id TEXT NOT NULL,
+                color TEXT NOT NULL COLLATE NOCASE,
+                name TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                last_updated TEXT NOT NULL,
+                PRIMARY KEY (part_id, color)
+            );
+            CREATE INDEX IF NOT EXISTS idx_inventory_color ON inventory (color, part_id);
+            CREATE INDEX IF NOT EXISTS idx_inventory_quantity ON inventory (quantity);
+        ''')
+        self._create_summary_schema(conn)
+        self._create_version_schema(conn)
+        self._create_changelog_schema(conn)
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS applied_uploads (
+                upload_id TEXT PRIMARY KEY,
+                bricks_merged INTEGER NOT NULL,
+                applied_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_applied_uploads_time ON applied_uploads (applied_at);
+        ''')
+
+    def _create_version_schema(self, conn):
+        """Inventory version, bumped by triggers on every row change (used for ETags)"""
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS inventory_meta (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO inventory_meta (id, version) VALUES (1, 0);
+
+            CREATE TRIGGER IF NOT EXISTS trg_inventory_version_insert AFTER INSERT ON inventory BEGIN
+                UPDATE inventory_meta SET version = version + 1 WHERE id = 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_inventory_version_update AFTER UPDATE ON inventory BEGIN
+                UPDATE inventory_meta SET version = version + 1 WHERE id = 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_inventory_version_delete AFTER DELETE ON inventory BEGIN
+                UPDATE inventory_meta SET version = version + 1 WHERE id = 1;
+            END;
+        ''')
+
+    def _create_changelog_schema(self, conn):
+        """
+        Change log for delta sync: one entry per row written, in commit order
+
+        Entries only name the changed key; a sync reads the current row (or
+        its absence) from the inventory. Compaction keeps the newest entry per
+        key and drops entries older than the retention window, moving
+        min_seq forward so older tokens force a full resync.
+        """
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS inventory_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                part_id TEXT NOT NULL,
+                color TEXT NOT NULL COLLATE NOCASE,
+                changed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_inventory_changes_key ON inventory_changes (part_id, color, seq);
+            CREATE TABLE IF NOT EXISTS sync_meta (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                epoch TEXT NOT NULL,
+                min_seq INTEGER NOT NULL,
+                last_compacted REAL NOT NULL
+            );
+            INSERT OR IGNORE INTO sync_meta (id, epoch, min_seq, last_compacted)
+                VALUES (1, lower(hex(randomblob(8))), 0, CAST(strftime('%s', 'now') AS INTEGER));
+
+            CREATE TRIGGER IF NOT EXISTS trg_inventory_changes_insert AFTER INSERT ON inventory BEGIN
+                INSERT INTO inventory_changes (part_id, color, changed_at) VALUES (NEW.part_id, NEW.color, CAST(strftime('%s', 'now') AS INTEGER));
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_inventory_changes_update AFTER UPDATE ON inventory BEGIN
+                INSERT INTO inventory_changes (part_id, color, changed_at) VALUES (NEW.part_id, NEW.color, CAST(strftime('%s', 'now') AS INTEGER));
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_inventory_changes_delete AFTER DELETE ON inventory BEGIN
+                INSERT INTO inventory_changes (part_id, color, changed_at) VALUES (OLD.part_id, OLD.color, CAST(strftime('%s', 'now') AS INTEGER));
+            END;
+        ''')
+
+    def _create_summary_schema(self, conn):
+        """
+        Summary aggregates kept up to date by triggers
+
+        Every inventory write adjusts the per-color, per-part and global rows
+        inside the same transaction, so summaries are always consistent with
+        the inventory and can be read without scanning it.
+        """
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS inventory_summary (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_bricks INTEGER NOT NULL,
+                unique_colors INTEGER NOT NULL,
+                unique_types INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS color_summary (
+                color TEXT PRIMARY KEY COLLATE NOCASE,
+                total_bricks INTEGER NOT NULL,
+                unique_types INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS part_summary (
+                part_id TEXT PRIMARY KEY,
+                total_bricks INTEGER NOT NULL,
+                unique_colors INTEGER NOT NULL
+            );
+
+            CREATE TRIGGER IF NOT EXISTS trg_inventory_insert AFTER INSERT ON inventory BEGIN
+                INSERT INTO color_summary (color, total_bricks, unique_types) VALUES (NEW.color, NEW.quantity, 1)
+                    ON CONFLICT(color) DO UPDATE SET
+                        total_bricks = total_bricks + excluded.total_bricks,
+                        unique_types = unique_types + 1;
+                INSERT INTO part_summary (part_id, total_bricks, unique_colors) VALUES (NEW.part_id, NEW.quantity, 1)
+                    ON CONFLICT(part_id) DO UPDATE SET
+                        total_bricks = total_bricks + excluded.total_bricks,
+                        unique_colors = unique_colors + 1;
+                UPDATE inventory_summary SET total_bricks = total_bricks + NEW.quantity WHERE id = 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_inventory_delete AFTER DELETE ON inventory BEGIN
+                UPDATE color_summary SET total_bricks = total_bricks - OLD.quantity, unique_types = unique_types - 1
+                    WHERE color = OLD.color;
+                DELETE FROM color_summary WHERE color = OLD.color AND unique_types = 0;
+                UPDATE part_summary SET total_bricks = total_bricks - OLD.quantity, unique_colors = unique_colors - 1
+                    WHERE part_id = OLD.part_id;
+                DELETE FROM part_summary WHERE part_id = OLD.part_id AND unique_colors = 0;
+                UPDATE inventory_summary SET total_bricks = total_bricks - OLD.quantity WHERE id = 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_inventory_quantity AFTER UPDATE OF quantity ON inventory BEGIN
+                UPDATE color_summary SET total_bricks = total_bricks + NEW.quantity - OLD.quantity
+                    WHERE color = NEW.color;
+                UPDATE part_summary SET total_bricks = total_bricks + NEW.quantity - OLD.quantity
+                    WHERE part_id = NEW.part_id;
+                UPDATE inventory_summary SET total_bricks = total_bricks + NEW.quantity - OLD.quantity WHERE id = 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_color_summary_insert AFTER INSERT ON color_summary BEGIN
+                UPDATE inventory_summary SET unique_colors = unique_colors + 1 WHERE id = 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_color_summary_delete AFTER DELETE ON color_summary BEGIN
+                UPDATE inventory_summary SET unique_colors = unique_colors - 1 WHERE id = 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_part_summary_insert AFTER INSERT ON part_summary BEGIN
+                UPDATE inventory_summary SET unique_types = unique_types + 1 WHERE id = 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_part_summary_delete AFTER DELETE ON part_summary BEGIN
+                UPDATE inventory_summary SET unique_types = unique_types - 1 WHERE id = 1;
+            END;
+        ''')
+
+        created = conn.execute(
+            'INSERT OR IGNORE INTO inventory_summary (id, total_bricks, unique_colors, unique_types) VALUES (1, 0, 0, 0)'
+        ).rowcount
+        if created:
+            # Databases created before the summary tables existed
+            self._rebuild_summaries(conn)
+
+    def _rebuild_summaries(self, conn):
+        conn.execute('DELETE FROM color_summary')
+        conn.execute('DELETE FROM part_summary')
+        conn.execute('''
+            INSERT INTO color_summary (color, total_bricks, unique_types)
+            SELECT color, SUM(quantity), COUNT(*) FROM inventory GROUP BY color
+        ''')
+        conn.execute('''
+            INSERT INTO part_summary (part_id, total_bricks, unique_colors)
+            SELECT part_id, SUM(quantity), COUNT(*) FROM inventory GROUP BY part_id
+        ''')
+        conn.execute('''
+            UPDATE inventory_summary SET
+                total_bricks = (SELECT COALESCE(SUM(quantity), 0) FROM inventory),
+                unique_colors = (SELECT COUNT(*) FROM color_summary),
+                unique_types = (SELECT COUNT(*) FROM part_summary)
+            WHERE id = 1
+        ''')
+
+    def rebuild_summaries(self):
+        """Re-derive all summary aggregates from the inventory rows"""
+        with self._transaction() as conn:
+            self._rebuild_summaries(conn)
+
+    def _row_to_dict(self, row):
+        return {
+            "id": row['part_id'],
+            "name": row['name'],
+            "color": row['color'],
+            "quantity": row['quantity'],
+            "last_updated": row['last_updated']
+        }
+
+    def list_bricks(self, color=None, min_quantity=None, limit=50, after=None):
+        """
+        Inventory rows ordered by (part ID, color), filtered with indexed queries
+
+        Args:
+            after: (part_id, color) of the last row of the previous page. The
+                query seeks straight to it in the index, so deep pages cost
+                the same as the first one.
+        """
+        return self.page(color, min_quantity, limit, after)[0]
+
+    def page(self, color=None, min_quantity=None, limit=50, after=None):
+        """
+        One keyset page of inventory rows plus the inventory version
+        Both are read from the same snapshot. Returns (rows, has_more, version).
+        """
+        conditions = []
+        params = []
+        if color:
+            conditions.append('color = ?')
+            params.append(color)
+        if min_quantity:
+            conditions.append('quantity >= ?')
+            params.append(min_quantity)
+        if after:
+            if color:
+                # Within one color the order is just part_id (idx_inventory_color)
+                conditions.append('part_id > ?')
+                params.append(after[0])
+            else:
+                conditions.append('(part_id, color) > (?, ?)')
+                params.extend(after)
+
+        sql = SELECT_COLUMNS
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY part_id, color LIMIT ?'
+        params.append(limit + 1)  #One extra row tells us whether there is a next page
+
+        with self._connection() as conn:
+            conn.execute('BEGIN')
+            try:
+                rows = conn.execute(sql, params).fetchall()
+                version = conn.execute('SELECT version FROM inventory_meta WHERE id = 1').fetchone()[0]
+            finally:
+                conn.execute('COMMIT')
+
+        has_more = len(rows) > limit
+        return [self._row_to_dict(row) for row in rows[:limit]], has_more, version
+
+    def all_bricks(self):
+        """Every inventory row as (id, color, quantity) dicts, for whole-inventory scoring"""
+        with self._connection() as conn:
+            rows = conn.execute('SELECT part_id, color, quantity FROM inventory').fetchall()
+        return [{"id": row[0], "color": row[1], "quantity": row[2]} for row in rows]
+
+    def version(self):
+        """Inventory version, incremented by every row written"""
+        with self._connection() as conn:
+            return conn.execute('SELECT version FROM inventory_meta WHERE id = 1').fetchone()[0]
+
+    def summary(self, color=None, min_quantity=None):
+        """
+        Total bricks, unique colors and unique part types matching the filters
+        Served from the maintained aggregates unless min_quantity is given
+        """
+        if not min_quantity:
+            with self._connection() as conn:
+                if color:
+                    row = conn.execute(
+                        'SELECT total_bricks, unique_types FROM color_summary WHERE color = ?', (color,)
+                    ).fetchone()
+                    return {
+                        "total_bricks": row['total_bricks'] if row else 0,
+                        "unique_colors": 1 if row else 0,
+                        "unique_types": row['unique_types'] if row else 0
+                    }
+
+                row = conn.execute(
+                    'SELECT total_bricks, unique_colors, unique_types FROM inventory_summary WHERE id = 1'
+                ).fetchone()
+                return dict(row)
+
+        conditions = []
+        params = []
+        if color:
+            conditions.append('color = ?')
+            params.append(color)
+        if min_quantity:
+            conditions.append('quantity >= ?')
+            params.append(min_quantity)
+
+        sql = 'SELECT COALESCE(SUM(quantity), 0), COUNT(DISTINCT color), COUNT(DISTINCT part_id) FROM inventory'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+
+        with self._connection() as conn:
+            total, colors, types = conn.execute(sql, params).fetchone()
+
+        return {
+            "total_bricks": total,
+            "unique_colors": colors,
+            "unique_types": types
+        }
+
+    def changes_since(self, token, max_changes=5000):
+        """
+        Rows added, changed or deleted since a sync token
+
+        Returns a dict with 'sync_token' (pass it to the next call),
+        'full_resync' and, for a delta, 'upserted' rows and 'deleted' keys.
+        A full resync is required when the token is missing, from another
+        database, older than the compacted log, or more than max_changes
+        keys changed. The client then reloads the inventory and continues
+        from the returned token. Changes made while it reloads are replayed
+        on the next sync.
+        """
+        with self._connection() as conn:
+            conn.execute('BEGIN')
+            try:
+                meta = conn.execute('SELECT epoch, min_seq FROM sync_meta WHERE id = 1').fetchone()
+                current = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM inventory_changes').fetchone()[0]
+                current = max(current, meta['min_seq'])
+                new_token = f"{meta['epoch']}:{current}"
+
+                since = self._parse_sync_token(token, meta['epoch'])
+                if since is None or since < meta['min_seq'] or since > current:
+                    return {"sync_token": new_token, "full_resync": True}
+
+                rows = conn.execute('''
+                    SELECT k.part_id, k.color, i.name, i.quantity, i.last_updated
+                    FROM (SELECT DISTINCT part_id, color FROM inventory_changes WHERE seq > ? AND seq <= ?) k
+                    LEFT JOIN inventory i ON i.part_id = k.part_id AND i.color = k.color
+                    LIMIT ?
+                ''', (since, current, max_changes + 1)).fetchall()
+            finally:
+                conn.execute('COMMIT')
+
+        if len(rows) > max_changes:
+            return {"sync_token": new_token, "full_resync": True}
+
+        upserted = []
+        deleted = []
+        for row in rows:
+            if row['name'] is None:
+                deleted.append({"id": row['part_id'], "color": row['color']})
+            else:
+                upserted.append(self._row_to_dict(row))
+
+        return {
+            "sync_token": new_token,
+            "full_resync": False,
+            "upserted": upserted,
+            "deleted": deleted
+        }
+
+    def _parse_sync_token(self, token, epoch):
+        if not token:
+            return None
+        token_epoch, _, seq = token.partition(':')
+        if token_epoch != epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def compact_changes(self, retention_seconds):
+        """
+        Bound the change log: keep only the newest entry per key, and drop
+        entries (and merged upload IDs) older than retention_seconds.
+        Returns the number removed.
+        """
+        with self._transaction() as conn:
+            removed = conn.execute('''
+                DELETE FROM inventory_changes WHERE seq < (
+                    SELECT MAX(c.seq) FROM inventory_changes c
+                    WHERE c.part_id = inventory_changes.part_id AND c.color = inventory_changes.color
+                )
+            ''').rowcount
+
+            horizon = conn.execute(
+                'SELECT MAX(seq) FROM inventory_changes WHERE changed_at < ?',
+                (time.time() - retention_seconds,)
+            ).fetchone()[0]
+            if horizon is not None:
+                removed += conn.execute('DELETE FROM inventory_changes WHERE seq <= ?', (horizon,)).rowcount
+                # Tokens at or before the horizon can no longer be served as a delta
+                conn.execute('UPDATE sync_meta SET min_seq = MAX(min_seq, ?) WHERE id = 1', (horizon,))
+
+            # Upload IDs older than the retention window can no longer be retried
+            removed += conn.execute(
+                'DELETE FROM applied_uploads WHERE applied_at < ?', (time.time() - retention_seconds,)
+            ).rowcount
+
+            conn.execute('UPDATE sync_meta SET last_compacted = ? WHERE id = 1', (time.time(),))
+        return removed
+
+    def compact_changes_if_due(self, retention_seconds, interval_seconds):
+        """Run compact_changes() at most once per interval_seconds (across processes)"""
+        with self._connection() as conn:
+            due = conn.execute(
+                'SELECT last_compacted < ? FROM sync_meta WHERE id = 1',
+                (time.time() - interval_seconds,)
+            ).fetchone()[0]
+        if due:
+            return self.compact_changes(retention_seconds)
+        return 0
+
+    def color_summary(self, color):
+        """Total bricks and part types stocked in one color"""
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT color, total_bricks, unique_types FROM color_summary WHERE color = ?', (color,)
+            ).fetchone()
+        return dict(row) if row else {"color": color, "total_bricks": 0, "unique_types": 0}
+
+    def part_summary(self, part_id):
+        """Total bricks and colors stocked for one part"""
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT part_id AS id, total_bricks, unique_colors FROM part_summary WHERE part_id = ?', (part_id,)
+            ).fetchone()
+        return dict(row) if row else {"id": part_id, "total_bricks": 0, "unique_colors": 0}
+
+    def add_bricks(self, bricks):
+        """Add quantities for many bricks in one transaction"""
+        now = utc_timestamp()
+        rows = [
+            (str(b['id']), b.get('color', 'Unknown'), b['name'], int(b['quantity']), now)
+            for b in bricks
+        ]
+
+        with self._transaction() as conn:
+            conn.executemany(UPSERT_ADD_SQL, rows)
+
+        return len(rows)
+
+    def merge_detections(self, upload_id, bricks):
+        """
+        Add detected bricks to the inventory exactly once per upload ID
+
+        The upload is recorded in the same transaction as the quantities, so a
+        retried request for the same upload ID changes nothing and reports
+        applied = False.
+        """
+        now = utc_timestamp()
+        rows = [
+            (str(b['id']), b.get('color', 'Unknown'), b['name'], int(b['quantity']), now)
+            for b in bricks
+        ]
+        total = sum(row[3] for row in rows)
+
+        with self._transaction() as conn:
+            applied = conn.execute(
+                'INSERT OR IGNORE INTO applied_uploads (upload_id, bricks_merged, applied_at) VALUES (?, ?, ?)',
+                (upload_id, total, time.time())
+            ).rowcount
+            if applied:
+                conn.executemany(UPSERT_ADD_SQL, rows)
+            else:
+                total = conn.execute(
+                    'SELECT bricks_merged FROM applied_uploads WHERE upload_id = ?', (upload_id,)
+                ).fetchone()[0]
+
+        return {
+            "upload_id": upload_id,
+            "applied": bool(applied),
+            "bricks_merged": total
+        }
+
+    def update_quantities(self, updates):
+        """
+        Apply quantity updates in one transaction
+
+        Each update has 'id', 'quantity' and an optional 'color' and 'action'
+        ('set' by default, or 'add'/'remove'). Without a color the update
+        applies to the part's only color; parts stocked in several colors need
+        one. Rows that drop to zero are removed.
+
+        Returns a list of {id, color, old_quantity, new_quantity}
+        """
+        now = utc_timestamp()
+        results = []
+
+        with self._transaction() as conn:
+            for update in updates:
+                part_id = str(update['id'])
+                quantity = int(update['quantity'])
+                action = update.get('action', 'set')
+                if action not in ('set', 'add', 'remove'):
+                    raise ValueError(f"Unknown action '{action}' for brick {part_id}")
+
+                color = update.get('color')
+                if color is None:
+                    colors = conn.execute(
+                        'SELECT color FROM inventory WHERE part_id = ? LIMIT 2', (part_id,)
+                    ).fetchall()
+                    if len(colors) > 1:
+                        raise ValueError(f"Brick {part_id} is stocked in several colors, specify 'color'")
+                    color = colors[0]['color'] if colors else 'Unknown'
+
+                row = conn.execute(
+                    'SELECT quantity FROM inventory WHERE part_id = ? AND color = ?',
+                    (part_id, color)
+                ).fetchone()
+                old_quantity = row['quantity'] if row else 0
+
+                if action == 'add':
+                    new_quantity = old_quantity + quantity
+                elif action == 'remove':
+                    new_quantity = old_quantity - quantity
+                else:
+                    new_quantity = quantity
+                new_quantity = max(new_quantity, 0)
+
+                if new_quantity == 0:
+                    conn.execute(
+                        'DELETE FROM inventory WHERE part_id = ? AND color = ?', (part_id, color)
+                    )
+                else:
+                    conn.execute(
+                        UPSERT_SET_SQL,
+                        (part_id, color, update.get('name', part_id), new_quantity, now)
+                    )
+
+                results.append({
+                    "id": part_id,
+                    "color": color,
+                    "old_quantity": old_quantity,
+                    "new_quantity": new_quantity
+                })
+
+        return results
+
+    def delete_parts(self, part_ids):
+        """Remove every color of the given parts; returns the number of rows deleted"""
+        with self._transaction() as conn:
+            deleted = 0
+            for part_id in part_ids:
+                deleted += conn.execute(
+                    'DELETE FROM inventory WHERE part_id = ?', (part_id,)
+                ).rowcount
+        return deleted
+
+    def clear(self):
+        """Remove all inventory rows"""
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM inventory')
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inventory store maintenance")
+    parser.add_argument('command', choices=['rebuild-summaries'])
+    parser.add_argument('--db', default=os.path.join(os.environ.get('DATA_FOLDER', 'data'), 'inventory.db'))
+    args = parser.parse_args()
+
+    store = InventoryStore(args.db)
+    store.rebuild_summaries()
+    print(f"✅ Summaries rebuilt: {store.summary()}")
@@ -0,0 +1,259 @@
+# job_queue.py - Persistent background job queue for long-running analyses
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class JobQueue:
+    def __init__(self, db_path, handler, num_workers=2, ttl_seconds=86400,
+                 lease_seconds=600, cleanup_interval=60, dumps=json.dumps, on_finish=None):
+        """
+        SQLite-backed job queue processed by a pool of background threads
+
+        Jobs are claimed highest priority first (then oldest first). A claimed
+        job holds a lease, so jobs left running by a crashed process are picked
+        up again once the lease expires. Each claim is a new attempt and only
+        the latest attempt may record the result, so a slow run that lost its
+        lease cannot overwrite the retry's and on_finish runs once per job.
+        Finished jobs are deleted after ttl_seconds.
+
+        Args:
+            db_path: SQLite database file for job state
+            handler: Callable taking a job payload dict and returning a result dict
+            num_workers: Number of worker threads
+            ttl_seconds: How long finished jobs (and their results) are kept
+            lease_seconds: How long a worker may hold a job before it is retried
+            cleanup_interval: Seconds between TTL cleanup passes
+            dumps: Serializer for payloads and results (e.g. one handling NumPy values)
+            on_finish: Optional function called with the payload once the job has
+                completed or failed (e.g. to release resources the job held)
+        """
+        self.db_path = db_path
+        self.handler = handler
+        self.num_workers = num_workers
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.cleanup_interval = cleanup_interval
+        self.dumps = dumps
+        self.on_finish = on_finish
+
+        self._reset_after_fork()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+        self._create_schema()
+
+    def _reset_after_fork(self):
+        # Threads and SQLite connections must not be shared across fork
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._workers = []
+        self._last_cleanup = 0.0
+        self._completed = 0
+        self._failed = 0
+        self._superseded = 0
+        self._queue_wait_total = 0.0
+        self._run_time_total = 0.0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self._connect()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                lease_until REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority DESC, created_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at);
+        ''')
+
+    def start(self):
+        """Start the worker threads (called automatically on first use)"""
+        with self._lock:
+            self._workers = [w for w in self._workers if w.is_alive()]
+            for i in range(len(self._workers), self.num_workers):
+                worker = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, payload, priority=0):
+        """Queue a job and return its ID immediately"""
+        self.start()
+        job_id = f"job_{uuid.uuid4().hex}"
+
+        self._connect().execute(
+            'INSERT INTO jobs (job_id, status, priority, payload, created_at) VALUES (?, ?, ?, ?, ?)',
+            (job_id, 'queued', priority, self.dumps(payload), time.time())
+        )
+
+        with self._changed:
+            self._changed.notify_all()
+        return job_id
+
+    def get(self, job_id):
+        """Get job status (and result once finished), or None if unknown or expired"""
+        row = self._connect().execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            "job_id": row['job_id'],
+            "status": row['status'],
+            "priority": row['priority'],
+            "attempts": row['attempts'],
+            "created_at": row['created_at'],
+            "started_at": row['started_at'],
+            "finished_at": row['finished_at']
+        }
+        if row['status'] == 'queued':
+            job['queue_position'] = self._connect().execute(
+                'SELECT COUNT(*) FROM jobs WHERE status = ? AND (priority > ? OR (priority = ? AND created_at < ?))',
+                ('queued', row['priority'], row['priority'], row['created_at'])
+            ).fetchone()[0]
+        if row['result'] is not None:
+            job['result'] = json.loads(row['result'])
+        if row['error'] is not None:
+            job['error'] = row['error']
+        return job
+
+    def wait(self, job_id, timeout):
+        """Long-poll: return the job once it has finished or timeout seconds have passed"""
+        self.start()
+        deadline = time.time() + timeout
+
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.time()
+            if job is None or job['status'] in ('completed', 'failed') or remaining <= 0:
+                return job
+
+            # Re-check periodically as another process may own the job
+            with self._changed:
+                self._changed.wait(min(remaining, 0.5))
+
+    def _claim(self):
+        """Atomically take the next job, including ones whose lease has expired"""
+        conn = self._connect()
+        now = time.time()
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                '''SELECT job_id, payload, created_at, attempts + 1 AS attempt FROM jobs
+                   WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)
+                   ORDER BY priority DESC, created_at LIMIT 1''',
+                (now,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    '''UPDATE jobs SET status = 'running', started_at = ?, lease_until = ?,
+                       attempts = attempts + 1 WHERE job_id = ?''',
+                    (now, now + self.lease_seconds, row['job_id'])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        return row
+
+    def _finish(self, job_id, attempt, status, result=None, error=None):
+        """Record one attempt's outcome; False if the job has been claimed again since"""
+        # Only the latest attempt may finish; a re-leased job belongs to its retry
+        cursor = self._connect().execute(
+            '''UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL
+               WHERE job_id = ? AND attempts = ? AND status = 'running' ''',
+            (status, self.dumps(result) if result is not None else None, error, time.time(), job_id, attempt)
+        )
+        with self._changed:
+            self._changed.notify_all()
+        return cursor.rowcount == 1
+
+    def _run(self):
+        while True:
+            self._maybe_cleanup()
+
+            row = self._claim()
+            if row is None:
+                with self._changed:
+                    self._changed.wait(1.0)
+                continue
+
+            started = time.time()
+            payload = json.loads(row['payload'])
+            try:
+                result = self.handler(payload)
+                status = 'completed'
+                recorded = self._finish(row['job_id'], row['attempt'], status, result=result)
+            except Exception as e:
+                status = 'failed'
+                recorded = self._finish(row['job_id'], row['attempt'], status, error=str(e))
+
+            if recorded and self.on_finish:
+                self.on_finish(payload)
+
+            with self._lock:
+                if not recorded:
+                    self._superseded += 1  #Lease expired and a newer attempt owns the job
+                elif status == 'completed':
+                    self._completed += 1
+                else:
+                    self._failed += 1
+                self._queue_wait_total += started - row['created_at']
+                self._run_time_total += time.time() - started
+
+    def _maybe_cleanup(self):
+        with self._lock:
+            if time.time() - self._last_cleanup < self.cleanup_interval:
+                return
+            self._last_cleanup = time.time()
+        self.cleanup()
+
+    def cleanup(self):
+        """Delete finished jobs older than the TTL; returns the number removed"""
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND finished_at < ?",
+            (time.time() - self.ttl_seconds,)
+        )
+        return cursor.rowcount
+
+    def get_stats(self):
+        """Queue depth and job latency metrics"""
+        counts = dict(self._connect().execute(
+            'SELECT status, COUNT(*) FROM jobs GROUP BY status'
+        ).fetchall())
+
+        with self._lock:
+            processed = self._completed + self._failed
+            return {
+                "workers": self.num_workers,
+                "queue_depth": counts.get('queued', 0),
+                "running": counts.get('running', 0),
+                "stored": {status: count for status, count in counts.items()},
+                "completed": self._completed,
+                "failed": self._failed,
+                "superseded": self._superseded,
+                "avg_queue_wait_ms": round(self._queue_wait_total / processed * 1000, 2) if processed else 0,
+                "avg_run_time_ms": round(self._run_time_total / processed * 1000, 2) if processed else 0
+            }
@@ -0,0 +1,64 @@
+# json_provider.py - Fast JSON for Flask with native NumPy support
+
+import json
+
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+from detections import DetectionArray
+
+try:
+    import orjson
+except ImportError:  #Optional: stdlib json fallback
+    orjson = None
+
+
+def default(obj):
+    """Serialize NumPy values, detection arrays (and what Flask handles) that the encoder doesn't know"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, DetectionArray):
+        return obj.to_dicts()
+    return DefaultJSONProvider.default(obj)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider using orjson when installed, otherwise the stdlib encoder
+
+    Both serialize NumPy scalars and arrays directly, so handlers can return
+    detector output without converting each value to a Python float or int.
+    orjson encodes straight to bytes, which Flask responses send as-is.
+    """
+
+    sort_keys = False  #Keep insertion order, sorting every response costs time
+
+    def __init__(self, app):
+        super().__init__(app)
+        if orjson is not None:
+            self._options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=default, option=self._options).decode()
+        kwargs.setdefault('default', default)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self._options | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(orjson.dumps(obj, default=default, option=option), mimetype=self.mimetype)
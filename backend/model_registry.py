@@ -0,0 +1,288 @@
+# model_registry.py - Versioned detection models with hot-swap and a memory budget
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+MODEL_FILES = ('model.onnx', 'best.onnx', 'best_e2e.onnx')  #First one found is the detector
+CLASS_FILE = 'class_names.txt'
+CLASSIFIER_FILE = 'classifier.onnx'
+CLASSIFIER_CLASS_FILE = 'classifier_classes.txt'
+
+
+def version_key(version):
+    """Natural sort key, so 'v10' comes after 'v9'"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', version)]
+
+
+def version_spec(folder):
+    """Spec of the model version stored in folder (named after it), or None without a model"""
+    model_file = next((f for f in MODEL_FILES if os.path.exists(os.path.join(folder, f))), None)
+    if model_file is None:
+        return None
+    return {
+        "version": os.path.basename(os.path.normpath(folder)),
+        "model_path": os.path.join(folder, model_file),
+        "class_file": os.path.join(folder, CLASS_FILE),
+        "classifier_path": os.path.join(folder, CLASSIFIER_FILE),
+        "classifier_class_file": os.path.join(folder, CLASSIFIER_CLASS_FILE)
+    }
+
+
+def rss_bytes():
+    """Resident set size of this process, or 0 where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class LoadedModel:
+    """A resident model version and the requests currently using it"""
+
+    def __init__(self, version, runner, memory_bytes, load_time):
+        self.version = version
+        self.runner = runner
+        self.memory_bytes = memory_bytes
+        self.load_time = load_time
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.in_use = 0
+        self.requests = 0
+
+
+class ModelRegistry:
+    def __init__(self, models_folder, loader, memory_budget_mb=1024, on_activate=None):
+        """
+        Versioned detection models, loaded on demand and swapped without restarts
+
+        Each subdirectory of models_folder is a version holding the model
+        (model.onnx, best.onnx or best_e2e.onnx), its class_names.txt and
+        optionally a cascade classifier.onnx with classifier_classes.txt.
+
+        Requests take a model with acquire(), which counts them as in use.
+        activate() loads a version first and then swaps the active pointer,
+        so requests that already hold the old model finish on it. Several
+        versions stay resident for pinned requests; when their estimated
+        memory exceeds the budget, the least recently used idle versions
+        (never the active one) are unloaded.
+
+        Args:
+            models_folder: Directory of version subdirectories
+            loader: Function taking a version spec dict and returning the
+                runner (anything with detect_bricks; close() is called on eviction).
+                A runner with a memory_bytes attribute is charged that instead
+                of the estimate (e.g. 0 when the weights live elsewhere)
+            memory_budget_mb: Memory allowed for resident models
+            on_activate: Optional function called with the new active LoadedModel
+        """
+        self.models_folder = models_folder
+        self.loader = loader
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.on_activate = on_activate
+
+        self._versions = {}
+        self._resident = OrderedDict()  #version -> LoadedModel, least recently used first
+        self._active = None
+        self._loads = 0
+        self._evictions = 0
+        self._reset_after_fork()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Requests in flight in the parent do not exist in the child
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        for model in self._resident.values():
+            model.in_use = 0
+
+    def refresh(self):
+        """Rescan models_folder for versions; returns the version names"""
+        found = {}
+        if os.path.isdir(self.models_folder):
+            for name in os.listdir(self.models_folder):
+                spec = version_spec(os.path.join(self.models_folder, name))
+                if spec is not None:
+                    found[name] = spec
+
+        with self._lock:
+            # Versions registered with add() stay available
+            self._versions = {
+                **{v: spec for v, spec in self._versions.items() if spec.get('static')},
+                **found
+            }
+            return sorted(self._versions, key=version_key)
+
+    def add(self, version, model_path, class_file=CLASS_FILE,
+            classifier_path=CLASSIFIER_FILE, classifier_class_file=CLASSIFIER_CLASS_FILE):
+        """Register a model outside models_folder (e.g. the legacy best.onnx)"""
+        with self._lock:
+            self._versions[version] = {
+                "version": version,
+                "model_path": model_path,
+                "class_file": class_file,
+                "classifier_path": classifier_path,
+                "classifier_class_file": classifier_class_file,
+                "static": True
+            }
+
+    def versions(self):
+        with self._lock:
+            return sorted(self._versions, key=version_key)
+
+    @property
+    def active_version(self):
+        active = self._active
+        return active.version if active else None
+
+    def resolve(self, version=None):
+        """The version a request would use; ValueError for unknown versions"""
+        if version is None:
+            return self.active_version
+        with self._lock:
+            known = version in self._versions
+        if not known:
+            raise ValueError(f"Unknown model version '{version}'. Available: {', '.join(self.versions())}")
+        return version
+
+    @contextmanager
+    def acquire(self, version=None):
+        """
+        Use a model for one request: the active one or a pinned version
+        Yields the LoadedModel (None when no model is available).
+        """
+        if version is None:
+            with self._lock:
+                model = self._active
+                if model is not None:
+                    model.in_use += 1
+        else:
+            model = self._load(self.resolve(version), hold=True)
+
+        if model is None:
+            yield None
+            return
+        try:
+            yield model
+        finally:
+            with self._lock:
+                model.in_use -= 1
+                model.requests += 1
+                model.last_used = time.time()
+            self._evict()
+
+    def activate(self, version):
+        """
+        Make a version the default for new requests
+        It is loaded before the swap, so there is no gap without a model.
+        """
+        model = self._load(self.resolve(version), hold=False)
+        with self._lock:
+            previous = self._active
+            self._active = model  #Single reference swap; old holders keep their model
+            self._resident[model.version] = model
+            self._resident.move_to_end(model.version)
+        if self.on_activate:
+            self.on_activate(model)
+        self._evict()
+        return previous.version if previous else None
+
+    def _load(self, version, hold):
+        """Resident model for a version, loading it on first use"""
+        with self._lock:
+            model = self._resident.get(version)
+            if model is None:
+                load_lock = self._load_locks.setdefault(version, threading.Lock())
+            else:
+                self._resident.move_to_end(version)
+                if hold:
+                    model.in_use += 1
+                return model
+
+        # One thread loads each version; others wait for it instead of loading again
+        with load_lock:
+            with self._lock:
+                model = self._resident.get(version)
+                spec = self._versions[version]
+            if model is None:
+                before = rss_bytes()
+                started = time.perf_counter()
+                runner = self.loader(spec)
+                load_time = time.perf_counter() - started
+
+                memory = getattr(runner, 'memory_bytes', None)
+                if memory is None:
+                    # RSS growth is noisy, the model files are a lower bound
+                    files = sum(
+                        os.path.getsize(spec[key]) for key in ('model_path', 'classifier_path')
+                        if spec.get(key) and os.path.exists(spec[key])
+                    )
+                    memory = max(rss_bytes() - before, files)
+                model = LoadedModel(version, runner, memory, load_time)
+
+        with self._lock:
+            if version not in self._resident:
+                self._resident[version] = model
+                self._loads += 1
+            model = self._resident[version]
+            self._resident.move_to_end(version)
+            if hold:
+                model.in_use += 1
+        if hold:
+            # An idle model could be evicted again before activate() swaps it in
+            self._evict()
+        return model
+
+    def _evict(self):
+        """Unload idle least recently used versions while over the memory budget"""
+        evicted = []
+        with self._lock:
+            used = sum(m.memory_bytes for m in self._resident.values())
+            for version, model in list(self._resident.items()):
+                if used <= self.memory_budget:
+                    break
+                if model is self._active or model.in_use:
+                    continue
+                del self._resident[version]
+                used -= model.memory_bytes
+                evicted.append(model)
+                self._evictions += 1
+
+        for model in evicted:
+            close = getattr(model.runner, 'close', None)
+            if close:
+                close()
+
+    def get_stats(self):
+        """Known versions, resident models and their memory use"""
+        with self._lock:
+            resident = dict(self._resident)
+            versions = sorted(self._versions, key=version_key)
+            active = self._active
+            used = sum(m.memory_bytes for m in resident.values())
+            return {
+                "active": active.version if active else None,
+                "memory_budget_mb": round(self.memory_budget / 1024 ** 2, 1),
+                "memory_used_mb": round(used / 1024 ** 2, 1),
+                "loads": self._loads,
+                "evictions": self._evictions,
+                "versions": [
+                    {
+                        "version": version,
+                        "active": active is not None and version == active.version,
+                        "loaded": version in resident,
+                        **({
+                            "memory_mb": round(resident[version].memory_bytes / 1024 ** 2, 1),
+                            "load_time_ms": round(resident[version].load_time * 1000, 1),
+                            "in_use": resident[version].in_use,
+                            "requests": resident[version].requests,
+                            "last_used": resident[version].last_used
+                        } if version in resident else {})
+                    }
+                    for version in versions
+                ]
+            }
@@ -0,0 +1,182 @@
+# part_catalog.py - Map detected brick names to LEGO part numbers
+
+import os
+import re
+import threading
+
+import numpy as np
+
+from recommendation_engine import open_csv
+
+UNKNOWN_PART = '0000'
+
+# Model class names and their part numbers, used with or without a parts dump
+BUILTIN_PARTS = {
+    # Basic bricks
+    '2x4 Brick': '3001',
+    '2x2 Brick': '3003',
+    '1x2 Plate': '3023',
+    '1x1 Brick': '3005',
+    '2x6 Brick': '2456',
+    '1x4 Brick': '3010',
+
+    # More bricks
+    '1x2 Brick': '3004',
+    '1x3 Brick': '3622',
+    '1x6 Brick': '3009',
+    '2x2 Plate': '3022',
+    '2x3 Plate': '3021',
+    '2x4 Plate': '3020',
+
+    # Special bricks
+    '2x4 Sloped Brick': '3039',
+    '2x2 Corner Brick': '2357',
+}
+
+# Other names the detector and clients use for the same parts
+BUILTIN_ALIASES = {
+    'lego_brick': '3001',  # Generic brick
+    'brick': '3001',
+    'Unknown': UNKNOWN_PART,
+    'Slope 45 2 x 4': '3039',
+    'Brick 2 x 2 Corner': '2357',
+}
+
+FUZZY_THRESHOLD = 0.45  #Minimum trigram similarity for a fuzzy match
+MAX_MEMO_SIZE = 100_000
+
+_DIMENSIONS = re.compile(r'(?<=\d)\s*x\s*(?=\d)')
+_SEPARATORS = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(name):
+    """
+    Canonical form of a part name: case, punctuation, spacing and word order
+    are ignored, so '2x4 Brick', 'Brick 2 x 4' and 'brick_2X4' are equal
+    """
+    name = _DIMENSIONS.sub('x', name.lower())
+    tokens = [t[:-1] if t.endswith('s') and len(t) > 3 else t for t in _SEPARATORS.split(name) if t]
+    return ' '.join(sorted(tokens))
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PartCatalog:
+    def __init__(self, catalog_folder=None):
+        """
+        Part number lookup by name, built once at startup
+
+        Names are reduced to a normalized key and looked up in one hash table
+        that also holds the alias table and the part numbers themselves.
+        Names that still don't match fall back to a trigram index (built on
+        the first miss). Every result, fuzzy or not, is memoized by the raw
+        name, so repeated detector class names cost a single dict lookup.
+
+        Args:
+            catalog_folder: Folder with a Rebrickable parts.csv(.gz) dump and
+                an optional part_aliases.csv (alias, part_num). The built-in
+                parts are always included.
+        """
+        self.catalog_folder = catalog_folder
+        self._lock = threading.Lock()
+        self._memo = {}
+        self._fuzzy_index = None
+        self._fuzzy_lookups = 0
+        self._misses = 0
+
+        self.names = {}  #part_num -> display name
+        self._keys = {}  #normalized name or alias -> part_num
+
+        for name, part_num in BUILTIN_PARTS.items():
+            self._add(name, part_num)
+        for alias, part_num in BUILTIN_ALIASES.items():
+            self._keys[normalize(alias)] = part_num
+
+        if catalog_folder:
+            self._load_rebrickable(catalog_folder)
+
+    def _add(self, name, part_num):
+        self.names.setdefault(part_num, name)
+        self._keys.setdefault(normalize(name), part_num)
+        self._keys.setdefault(normalize(part_num), part_num)
+
+    def _load_rebrickable(self, folder):
+        if os.path.exists(os.path.join(folder, 'parts.csv')) or os.path.exists(os.path.join(folder, 'parts.csv.gz')):
+            handle, reader = open_csv(folder, 'parts')
+            with handle:
+                for row in reader:
+                    self._add(row['name'], row['part_num'])
+
+        if os.path.exists(os.path.join(folder, 'part_aliases.csv')):
+            handle, reader = open_csv(folder, 'part_aliases')
+            with handle:
+                for row in reader:
+                    self._keys[normalize(row['alias'])] = row['part_num']
+
+    def lookup(self, name):
+        """Part number for a brick name, or '0000' if nothing matches"""
+        part_num = self._memo.get(name)
+        if part_num is not None:
+            return part_num
+
+        key = normalize(name)
+        part_num = self._keys.get(key)
+        if part_num is None:
+            part_num = self._fuzzy(key)
+
+        if len(self._memo) >= MAX_MEMO_SIZE:
+            self._memo.clear()
+        self._memo[name] = part_num
+        return part_num
+
+    def name(self, part_num):
+        """Display name of a part number, or None if unknown"""
+        return self.names.get(part_num)
+
+    def _build_fuzzy_index(self):
+        with self._lock:
+            if self._fuzzy_index is None:
+                keys = list(self._keys)
+                postings = {}
+                sizes = np.empty(len(keys))
+                for i, key in enumerate(keys):
+                    grams = trigrams(key)
+                    sizes[i] = len(grams)
+                    for gram in grams:
+                        postings.setdefault(gram, []).append(i)
+                postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+                self._fuzzy_index = (keys, sizes, postings)
+        return self._fuzzy_index
+
+    def _fuzzy(self, key):
+        """Best trigram (Jaccard) match above FUZZY_THRESHOLD"""
+        keys, sizes, postings = self._build_fuzzy_index()
+        self._fuzzy_lookups += 1
+
+        # Shared trigram counts for every name at once from the posting lists
+        grams = trigrams(key)
+        hits = [postings[g] for g in grams if g in postings]
+        if not hits:
+            self._misses += 1
+            return UNKNOWN_PART
+        shared = np.bincount(np.concatenate(hits), minlength=len(keys))
+        scores = shared / (len(grams) + sizes - shared)
+
+        best = int(np.argmax(scores))
+        if scores[best] <= FUZZY_THRESHOLD:
+            self._misses += 1
+            return UNKNOWN_PART
+        return self._keys[keys[best]]
+
+    def get_stats(self):
+        """Catalog size and lookup counters"""
+        return {
+            "parts": len(self.names),
+            "names_and_aliases": len(self._keys),
+            "memoized": len(self._memo),
+            "fuzzy_lookups": self._fuzzy_lookups,
+            "unmatched": self._misses
+        }
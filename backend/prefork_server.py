@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Pre-fork production server sharing one loaded model across workers
+
+The master process imports the app, loads and warms the detector once, then
+forks the workers. Model weights, the class tables and the set catalog are
+only read after that, so the workers share those pages with the master
+(copy-on-write) instead of each loading its own copy. gc.freeze() keeps the
+garbage collector from touching, and so copying, the objects loaded before
+the fork.
+
+Each worker serves the shared listening socket with the threaded werkzeug
+server and an onnxruntime pool of --threads threads, so N workers use about
+N x threads cores in total.
+
+Signals to the master:
+    SIGHUP           Rescan model versions, then restart the workers one at a time
+    SIGTERM/SIGINT   Stop accepting connections, finish in-flight requests, exit
+    SIGUSR1          Print the memory of every worker
+
+Usage:
+    python prefork_server.py serve [--workers 4] [--port 5000] [--cpu-affinity]
+    python prefork_server.py report [--workers 4]
+"""
+
+import argparse
+import gc
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+import numpy as np
+
+WARMUP_IMAGE_SHAPE = (480, 640, 3)
+
+
+def read_memory(pid='self'):
+    """
+    Memory of a process in bytes from /proc/<pid>/smaps_rollup
+
+    uss is the memory only this process uses (what killing it frees), pss
+    splits shared pages evenly between the processes sharing them.
+    """
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    except OSError:
+        return {"rss": 0, "pss": 0, "uss": 0}
+    return {
+        "rss": fields.get('Rss', 0),
+        "pss": fields.get('Pss', 0),
+        "uss": fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    }
+
+
+def load_app(threads=1):
+    """Import the app with its models loaded and warmed, ready to fork"""
+    os.environ.setdefault('DETECTOR_THREADS', str(threads))
+    os.environ.setdefault('JOB_AUTOSTART', 'false')  #Threads do not survive fork; each worker starts its own
+    import app as app_module
+    warm_up(app_module)
+    return app_module
+
+
+def warm_up(app_module):
+    """Touch everything the first request would load lazily"""
+    if app_module.detector is not None and app_module.inference_broker is None:
+        # The bare detector: a BatchScheduler would start its thread in the master
+        app_module.detector.detect_bricks(np.zeros(WARMUP_IMAGE_SHAPE, dtype=np.uint8))
+    app_module.recommendation_engine.recommend([], limit=1)
+
+
+def format_mb(value):
+    return f"{value / 1024 ** 2:8.1f}"
+
+
+class PreforkServer:
+    def __init__(self, app_module, host='0.0.0.0', port=5000, workers=4,
+                 cpu_affinity=False, graceful_timeout=30):
+        """
+        Fork workers serving the app from a shared socket
+
+        Args:
+            app_module: The imported app module, models already loaded
+            host: Interface to bind
+            port: Port to bind (0 picks a free one)
+            workers: Number of worker processes
+            cpu_affinity: Pin each worker to its own CPU (round robin)
+            graceful_timeout: Seconds a stopping worker gets for in-flight requests
+        """
+        self.app_module = app_module
+        self.num_workers = workers
+        self.cpu_affinity = cpu_affinity
+        self.graceful_timeout = graceful_timeout
+
+        self.socket = socket.create_server((host, port), backlog=128)
+        self.host = host
+        self.port = self.socket.getsockname()[1]
+
+        self.workers = {}  #pid -> worker index
+        self.retiring = set()
+        self.restarts = 0
+        self._stopping = False
+        self._reload = False
+        self._report = False
+
+    def start(self):
+        """Freeze the loaded state and fork the workers"""
+        gc.collect()
+        gc.freeze()  #Objects from before the fork are never scanned, so their pages stay shared
+        for index in range(self.num_workers):
+            self._spawn(index)
+
+    def serve_forever(self):
+        """Fork the workers and supervise them until SIGTERM/SIGINT"""
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, '_reload', True))
+        signal.signal(signal.SIGUSR1, lambda *_: setattr(self, '_report', True))
+
+        self.start()
+        print(f"✅ Serving on http://{self.host}:{self.port} with {self.num_workers} workers (master {os.getpid()})")
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                self.reload()
+            if self._report:
+                self._report = False
+                self.print_memory()
+            self._reap(respawn=True)
+            time.sleep(0.5)
+        self.stop()
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _spawn(self, index):
+        """Fork one worker and wait until it is accepting connections"""
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            try:
+                self._run_worker(index, ready_write)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                os._exit(0)
+
+        os.close(ready_write)
+        self.workers[pid] = index
+        ready, _, _ = select.select([ready_read], [], [], 60)
+        if not ready or not os.read(ready_read, 1):
+            print(f"⚠️  Worker {index} (pid {pid}) did not start")
+        os.close(ready_read)
+        return pid
+
+    def _run_worker(self, index, ready_write):
+        """Worker process: serve requests until SIGTERM, then drain"""
+        from werkzeug.serving import make_server
+
+        for signum in (signal.SIGHUP, signal.SIGUSR1):
+            signal.signal(signum, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  #Ctrl+C reaches the master, which stops us
+
+        if self.cpu_affinity and hasattr(os, 'sched_setaffinity'):
+            cpus = sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(0, {cpus[index % len(cpus)]})
+
+        server = make_server(self.host, self.port, self.app_module.app, threaded=True, fd=self.socket.fileno())
+        server.daemon_threads = False  #server_close() waits for in-flight requests
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+
+        job_queue = getattr(self.app_module, 'job_queue', None)
+        if job_queue is not None:
+            job_queue.start()
+
+        os.write(ready_write, b'1')
+        os.close(ready_write)
+        server.serve_forever()
+        server.server_close()
+
+    def _reap(self, respawn):
+        """Collect exited workers, replacing ones that died unexpectedly"""
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = self.workers.pop(pid, None)
+            if index is None:
+                continue
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            elif respawn and not self._stopping:
+                print(f"⚠️  Worker {index} (pid {pid}) exited with status {status}, restarting")
+                self._spawn(index)
+
+    def _retire(self, pid):
+        """Stop one worker gracefully; kill it after graceful_timeout"""
+        self.retiring.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while time.monotonic() < deadline:
+            if os.waitpid(pid, os.WNOHANG)[0]:
+                break
+            time.sleep(0.05)
+        else:
+            print(f"⚠️  Worker {self.workers.get(pid)} (pid {pid}) did not stop in {self.graceful_timeout}s, killing")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.pop(pid, None)
+        self.retiring.discard(pid)
+
+    def reload(self):
+        """
+        Rolling restart: pick up new model versions, then replace the workers
+        one at a time, starting each replacement before stopping the old one
+        """
+        registry = self.app_module.model_registry
+        versions = registry.refresh()
+        wanted = self.app_module.app.config['ACTIVE_MODEL'] or (versions[-1] if versions else None)
+        if wanted and wanted != registry.active_version:
+            gc.unfreeze()
+            registry.activate(wanted)
+            warm_up(self.app_module)
+            gc.collect()
+            gc.freeze()
+
+        for pid, index in list(self.workers.items()):
+            self._spawn(index)
+            self._retire(pid)
+        self.restarts += 1
+        print(f"✅ Workers restarted with model {registry.active_version}")
+
+    def stop(self):
+        """Stop all workers, letting each finish its in-flight requests"""
+        for pid in list(self.workers):
+            self.retiring.add(pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self._reap(respawn=False)
+            time.sleep(0.05)
+        for pid in list(self.workers):
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.workers.pop(pid)
+        self.socket.close()
+
+    def memory(self):
+        """Memory of the master and each worker"""
+        return {
+            "master": read_memory(os.getpid()),
+            "workers": {pid: read_memory(pid) for pid in sorted(self.workers)}
+        }
+
+    def print_memory(self):
+        memory = self.memory()
+        print_memory_table(
+            [('master', memory['master'])] +
+            [(f'worker {self.workers[pid]}', m) for pid, m in memory['workers'].items()]
+        )
+
+
+def print_memory_table(rows):
+    print(f"{'process':<12} {'RSS MB':>8} {'PSS MB':>8} {'USS MB':>8}")
+    for name, memory in rows:
+        print(f"{name:<12} {format_mb(memory['rss'])} {format_mb(memory['pss'])} {format_mb(memory['uss'])}")
+
+
+NAIVE_WORKER = """
+import sys
+import prefork_server
+prefork_server.load_app(threads=int(sys.argv[1]))
+print('ready', flush=True)
+sys.stdin.read()
+"""
+
+
+def naive_memory(workers, threads):
+    """Memory of N processes that each import the app and load the model themselves"""
+    backend = os.path.dirname(os.path.abspath(__file__))
+    processes = [
+        subprocess.Popen(
+            [sys.executable, '-c', NAIVE_WORKER, str(threads)],
+            cwd=backend, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        for _ in range(workers)
+    ]
+    try:
+        for process in processes:
+            while process.stdout.readline().strip() != 'ready':
+                if process.poll() is not None:
+                    raise RuntimeError("Naive worker failed to start")
+        return [read_memory(process.pid) for process in processes]
+    finally:
+        for process in processes:
+            process.stdin.close()
+            process.wait()
+
+
+def report(args):
+    """Per-worker memory of the pre-fork server against N independent processes"""
+    app_module = load_app(args.threads)
+    server = PreforkServer(app_module, host='127.0.0.1', port=0, workers=args.workers)
+    server.start()
+    try:
+        time.sleep(0.5)  #Let the workers settle after their first allocations
+        memory = server.memory()
+    finally:
+        server.stop()
+    prefork = list(memory['workers'].values())
+    naive = naive_memory(args.workers, args.threads)
+
+    print(f"\nPre-fork ({args.workers} workers, model {app_module.model_registry.active_version}):")
+    print_memory_table([('master', memory['master'])] + [(f'worker {i}', m) for i, m in enumerate(prefork)])
+    print(f"\nNaive ({args.workers} independent processes):")
+    print_memory_table([(f'process {i}', m) for i, m in enumerate(naive)])
+
+    prefork_total = memory['master']['uss'] + sum(m['pss'] for m in prefork)
+    naive_total = sum(m['pss'] for m in naive)
+    print(f"\nUnique memory per worker: {format_mb(np.mean([m['uss'] for m in prefork])).strip()} MB pre-fork, "
+          f"{format_mb(np.mean([m['uss'] for m in naive])).strip()} MB naive")
+    print(f"Total (PSS): {format_mb(prefork_total).strip()} MB pre-fork, {format_mb(naive_total).strip()} MB naive")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork server sharing the loaded model across workers")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help="Run the server")
+    serve_parser.add_argument('--host', default='0.0.0.0')
+    serve_parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    serve_parser.add_argument('--cpu-affinity', action='store_true', help="Pin each worker to one CPU")
+    serve_parser.add_argument('--graceful-timeout', type=float, default=30,
+                              help="Seconds workers get to finish requests when stopping")
+
+    report_parser = subparsers.add_parser('report', help="Compare worker memory with independent processes")
+
+    for sub in (serve_parser, report_parser):
+        sub.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        sub.add_argument('--threads', type=int, default=1, help="onnxruntime threads per worker")
+
+    args = parser.parse_args()
+    if args.command == 'report':
+        report(args)
+        return
+
+    app_module = load_app(args.threads)
+    PreforkServer(
+        app_module,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        cpu_affinity=args.cpu_affinity,
+        graceful_timeout=args.graceful_timeout
+    ).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
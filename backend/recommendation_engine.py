@@ -0,0 +1,317 @@
+# recommendation_engine.py - Set recommendations from a brick inventory
+
+import csv
+import gzip
+import heapq
+import os
+import threading
+
+import numpy as np
+
+# Matches any color, used by catalogs that only list part numbers
+ANY_COLOR = '*'
+
+# Used when no Rebrickable dump is installed in the catalog folder
+BUILTIN_CATALOG = {
+    "10698": {
+        "name": "Classic Creative Brick Box",
+        "required_bricks": ["3001", "3003", "3023", "3005"],
+        "total_pieces": 790,
+        "difficulty": "beginner"
+    },
+    "31134": {
+        "name": "Space Rocket",
+        "required_bricks": ["3001", "3004", "3622", "2456"],
+        "total_pieces": 837,
+        "difficulty": "intermediate"
+    },
+    "10302": {
+        "name": "Optimus Prime",
+        "required_bricks": ["3001", "3003", "3023", "2456", "3039"],
+        "total_pieces": 1508,
+        "difficulty": "advanced"
+    }
+}
+
+BUILD_TIMES = {
+    "beginner": "2-3 hours",
+    "intermediate": "3-4 hours",
+    "advanced": "5-6 hours"
+}
+
+
+def difficulty_for(total_pieces):
+    if total_pieces < 500:
+        return "beginner"
+    if total_pieces < 1000:
+        return "intermediate"
+    return "advanced"
+
+
+def open_csv(folder, name):
+    """Reader for name.csv or the gzipped name.csv.gz shipped by Rebrickable"""
+    path = os.path.join(folder, name + '.csv')
+    if os.path.exists(path):
+        handle = open(path, newline='', encoding='utf-8')
+    else:
+        handle = gzip.open(path + '.gz', 'rt', newline='', encoding='utf-8')
+    return handle, csv.DictReader(handle)
+
+
+def has_catalog(folder):
+    names = ('sets', 'inventories', 'inventory_parts', 'colors')
+    return all(
+        os.path.exists(os.path.join(folder, n + '.csv')) or os.path.exists(os.path.join(folder, n + '.csv.gz'))
+        for n in names
+    )
+
+
+class RecommendationEngine:
+    def __init__(self, catalog_folder=None):
+        """
+        Quantity- and color-aware set recommendations
+
+        The catalog is held as a sparse set x (part, color) matrix: parallel
+        arrays of (set, key, quantity) entries sorted by key, plus offsets
+        into them per key. That is an inverted index from each part/color to
+        the sets using it, so a query only touches the entries for bricks the
+        user owns and scores every set with one np.bincount.
+
+        A part's ANY_COLOR key holds all of its bricks, so the same bricks
+        also appear under their exact-color keys. Within a set, an ANY_COLOR
+        entry only counts the bricks the set's colored entries for that part
+        left over.
+
+        Args:
+            catalog_folder: Folder with Rebrickable CSV dumps (sets, inventories,
+                inventory_parts and colors, plain or .csv.gz). The built-in
+                catalog is used when it is missing. Loaded on first use.
+        """
+        self.catalog_folder = catalog_folder
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded:
+                return
+            if self.catalog_folder and has_catalog(self.catalog_folder):
+                sets, entries = self._read_rebrickable(self.catalog_folder)
+                self.source = 'rebrickable'
+            else:
+                sets, entries = self._read_builtin()
+                self.source = 'builtin'
+            self._build(sets, entries)
+            self._loaded = True
+
+    def _read_builtin(self):
+        sets = []
+        entries = []
+        for set_id, info in BUILTIN_CATALOG.items():
+            for part_id in info['required_bricks']:
+                entries.append((len(sets), part_id, ANY_COLOR, 1))
+            sets.append({
+                "set_id": set_id,
+                "name": info['name'],
+                "total_pieces": info['total_pieces'],
+                "difficulty": info['difficulty'],
+                "image_url": f"https://example.com/sets/{set_id}.jpg"
+            })
+        return sets, entries
+
+    def _read_rebrickable(self, folder):
+        handle, reader = open_csv(folder, 'colors')
+        with handle:
+            colors = {row['id']: row['name'].lower() for row in reader}
+
+        # Only the newest inventory version of each set counts
+        handle, reader = open_csv(folder, 'inventories')
+        with handle:
+            latest = {}
+            for row in reader:
+                version = int(row['version'])
+                if version >= latest.get(row['set_num'], (0, None))[0]:
+                    latest[row['set_num']] = (version, row['id'])
+
+        handle, reader = open_csv(folder, 'sets')
+        with handle:
+            sets = []
+            set_index = {}
+            for row in reader:
+                if row['set_num'] not in latest:
+                    continue
+                total = int(row['num_parts'] or 0)
+                if total <= 0:
+                    continue
+                set_index[latest[row['set_num']][1]] = len(sets)
+                sets.append({
+                    "set_id": row['set_num'],
+                    "name": row['name'],
+                    "year": int(row['year']) if row.get('year') else None,
+                    "total_pieces": total,
+                    "difficulty": difficulty_for(total),
+                    "image_url": row.get('img_url') or f"https://example.com/sets/{row['set_num']}.jpg"
+                })
+
+        handle, reader = open_csv(folder, 'inventory_parts')
+        with handle:
+            entries = []
+            for row in reader:
+                set_idx = set_index.get(row['inventory_id'])
+                if set_idx is None or row.get('is_spare', 'f').lower() in ('t', 'true'):
+                    continue
+                color = colors.get(row['color_id'], ANY_COLOR)
+                entries.append((set_idx, row['part_num'], color, int(row['quantity'])))
+
+        return sets, entries
+
+    def _build(self, sets, entries):
+        self.sets = sets
+        self.key_index = {}
+        set_ids = np.empty(len(entries), dtype=np.int64)
+        keys = np.empty(len(entries), dtype=np.int64)
+        quantities = np.empty(len(entries), dtype=np.int64)
+
+        for i, (set_idx, part_id, color, quantity) in enumerate(entries):
+            key = (part_id, color)
+            set_ids[i] = set_idx
+            keys[i] = self.key_index.setdefault(key, len(self.key_index))
+            quantities[i] = quantity
+        n_keys = len(self.key_index)
+
+        # Merge duplicate (set, key) entries and sort by key for the inverted index
+        combined, inverse = np.unique(keys * len(sets) + set_ids, return_inverse=True)
+        self.entry_qty = np.bincount(inverse, weights=quantities).astype(np.int64)
+        self.entry_key = combined // max(len(sets), 1)
+        self.entry_set = combined % max(len(sets), 1)
+        self.key_offsets = np.searchsorted(self.entry_key, np.arange(n_keys + 1))
+
+        # Completion is measured against the pieces the catalog actually lists
+        self.set_required = np.bincount(self.entry_set, weights=self.entry_qty, minlength=len(sets))
+
+        # The same entries ordered by set, for per-set requirement lookups
+        self.set_order = np.argsort(self.entry_set, kind='stable')
+        self.set_offsets = np.searchsorted(self.entry_set[self.set_order], np.arange(len(sets) + 1))
+        self.set_positions = {info['set_id']: i for i, info in enumerate(sets)}
+
+        # Keys of the same part share bricks: map each key to its part and to
+        # the part's ANY_COLOR key (-1 if the catalog has none)
+        part_index = {}
+        self.key_part = np.empty(n_keys, dtype=np.int64)
+        self.key_is_any = np.zeros(n_keys, dtype=bool)
+        for (part_id, color), k in self.key_index.items():
+            self.key_part[k] = part_index.setdefault(part_id, len(part_index))
+            self.key_is_any[k] = color == ANY_COLOR
+        self.n_parts = len(part_index)
+        self.any_key = np.full(n_keys, -1, dtype=np.int64)
+        self.part_color_keys = {}  #ANY_COLOR key -> colored keys of the same part
+        for (part_id, color), k in self.key_index.items():
+            if color != ANY_COLOR:
+                any_k = self.key_index.get((part_id, ANY_COLOR), -1)
+                self.any_key[k] = any_k
+                if any_k >= 0:
+                    self.part_color_keys.setdefault(any_k, []).append(k)
+        self.part_color_keys = {k: np.array(v, dtype=np.int64) for k, v in self.part_color_keys.items()}
+
+    def _inventory_vector(self, bricks):
+        """
+        Owned quantity per catalog key; unlisted bricks are ignored
+        An ANY_COLOR key holds the part's bricks in every color, the same
+        bricks its colored keys hold, so consumers must not add them up
+        """
+        owned = {}
+        for brick in bricks:
+            part_id = str(brick.get('id'))
+            quantity = int(brick.get('quantity', 1))
+            color = str(brick.get('color') or '').lower()
+            for key in ((part_id, color), (part_id, ANY_COLOR)):
+                k = self.key_index.get(key)
+                if k is not None:
+                    owned[k] = owned.get(k, 0) + quantity
+        return owned
+
+    def owned_vector(self, bricks):
+        """Owned quantity per catalog key as a dense array"""
+        self._ensure_loaded()
+        vector = np.zeros(len(self.key_index), dtype=np.int64)
+        for k, quantity in self._inventory_vector(bricks).items():
+            vector[k] = quantity
+        return vector
+
+    def set_entries(self, set_idx):
+        """(keys, quantities) arrays a set requires"""
+        order = self.set_order[self.set_offsets[set_idx]:self.set_offsets[set_idx + 1]]
+        return self.entry_key[order], self.entry_qty[order]
+
+    def score(self, bricks):
+        """Pieces owned towards every set, as an array aligned with self.sets"""
+        self._ensure_loaded()
+        owned = self._inventory_vector(bricks)
+        if not owned:
+            return np.zeros(len(self.sets))
+
+        keys = np.fromiter(owned.keys(), dtype=np.int64, count=len(owned))
+        have = np.fromiter(owned.values(), dtype=np.int64, count=len(owned))
+
+        # Gather the posting lists of the owned keys without a Python loop
+        starts = self.key_offsets[keys]
+        lengths = self.key_offsets[keys + 1] - starts
+        total = int(lengths.sum())
+        run_starts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        entries = run_starts + np.arange(total)
+
+        usable = np.minimum(self.entry_qty[entries], np.repeat(have, lengths))
+
+        # ANY_COLOR entries only get the bricks the set's colored entries of
+        # the same part did not already use
+        entry_keys = self.entry_key[entries]
+        wildcard = self.key_is_any[entry_keys]
+        if wildcard.any() and not wildcard.all():
+            pairs = self.entry_set[entries] * self.n_parts + self.key_part[entry_keys]
+            colored_pairs, inverse = np.unique(pairs[~wildcard], return_inverse=True)
+            colored_used = np.bincount(inverse, weights=usable[~wildcard])
+
+            wildcard_pairs = pairs[wildcard]
+            position = np.minimum(np.searchsorted(colored_pairs, wildcard_pairs), len(colored_pairs) - 1)
+            used = np.where(colored_pairs[position] == wildcard_pairs, colored_used[position], 0)
+            left = np.maximum(np.repeat(have, lengths)[wildcard] - used, 0)
+            usable[wildcard] = np.minimum(self.entry_qty[entries][wildcard], left)
+        return np.bincount(self.entry_set[entries], weights=usable, minlength=len(self.sets))
+
+    def recommend(self, bricks, limit=5, min_completion=0):
+        """
+        Top sets by completion percentage for the given bricks
+
+        Args:
+            bricks: Dicts with id, color and quantity (inventory rows or detections)
+            limit: Number of sets to return
+            min_completion: Only sets above this completion percentage
+        """
+        owned = self.score(bricks)
+        completion = np.divide(owned, self.set_required, out=np.zeros(len(self.sets)),
+                               where=self.set_required > 0) * 100
+        candidates = np.flatnonzero((completion > min_completion) & (owned > 0))
+        top = heapq.nlargest(limit, candidates.tolist(), key=completion.__getitem__)
+
+        recommendations = []
+        for i in top:
+            info = self.sets[i]
+            recommendations.append({
+                **info,
+                "completion_percentage": round(float(completion[i])),
+                "missing_pieces": int(self.set_required[i] - owned[i]),
+                "estimated_build_time": BUILD_TIMES[info['difficulty']]
+            })
+        return recommendations
+
+    def get_stats(self):
+        """Catalog size (without forcing the catalog to load)"""
+        if not self._loaded:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "sets": len(self.sets),
+            "part_colors": len(self.key_index),
+            "entries": len(self.entry_set),
+            "source": self.source
+        }
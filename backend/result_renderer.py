@@ -0,0 +1,277 @@
+# result_renderer.py - Annotated result images rendered on demand and cached
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from detections import COLOR_NAMES, DetectionArray
+
+RENDER_FORMATS = {'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+                  'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY)}
+REDUCED_READS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                 (2, cv2.IMREAD_REDUCED_COLOR_2))
+EXIF_ORIENTATION = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)  #Rotated by 90 degrees: width and height swap
+
+# Box color (BGR) per detected brick color, so the overlay matches the bricks
+BOX_COLORS = {
+    'Unknown': (0, 255, 0), 'Black': (80, 80, 80), 'White': (255, 255, 255), 'Gray': (160, 160, 160),
+    'Red': (0, 0, 255), 'Orange': (0, 140, 255), 'Yellow': (0, 230, 255), 'Green': (0, 200, 0),
+    'Blue': (255, 80, 0), 'Purple': (200, 0, 160)
+}
+
+
+class RenderCache:
+    def __init__(self, max_bytes):
+        """LRU cache of rendered images, bounded by their total size"""
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  #key -> bytes, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def discard(self, analysis_id):
+        """Drop every rendered variant of one analysis"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == analysis_id]:
+                self._bytes -= len(self._entries.pop(key))
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+                "evictions": self.evictions
+            }
+
+
+class ResultRenderer:
+    def __init__(self, db_path, cache_mb=64, ttl_seconds=30 * 24 * 60 * 60, on_save=None, on_delete=None):
+        """
+        Stored detections per analysis, drawn onto the photo when asked for
+
+        Analyses save the photo path and the raw detections (every box, not
+        the aggregated counts) as a small binary blob. Nothing is drawn until
+        a client requests a preview; each (analysis, size, format, quality)
+        variant is then rendered once and kept in an LRU cache of encoded
+        bytes.
+
+        Rendering decodes large JPEGs at 1/2, 1/4 or 1/8 scale directly
+        when the preview is that much smaller, and draws all boxes of one
+        color with a single polylines call.
+
+        Args:
+            db_path: SQLite database file for stored detections
+            cache_mb: Memory for rendered images
+            ttl_seconds: How long stored detections are kept
+            on_save: Optional function called with the photo path of each saved
+                analysis (e.g. to keep the photo stored while it can be rendered)
+            on_delete: Optional function called with the photo path when an
+                analysis is replaced or expires
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.on_save = on_save
+        self.on_delete = on_delete
+        self.cache = RenderCache(cache_mb * 1024 * 1024)
+
+        self._reset_after_fork()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+        self._create_schema()
+
+    def _reset_after_fork(self):
+        # SQLite connections must not be shared across fork
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._renders = 0
+        self._render_time_total = 0.0
+        self._last_cleanup = 0.0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        self._connect().executescript('''
+            CREATE TABLE IF NOT EXISTS analyses (
+                analysis_id TEXT PRIMARY KEY,
+                image_path TEXT NOT NULL,
+                detections BLOB NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses (created_at);
+        ''')
+
+    def save(self, analysis_id, image_path, detections):
+        """Keep an analysis's raw detections for rendering later"""
+        now = time.time()
+        conn = self._connect()
+        if self.on_save:
+            self.on_save(image_path)
+        # A retried job saves the same analysis again; the photo it replaces is let go
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            previous = conn.execute(
+                'SELECT image_path FROM analyses WHERE analysis_id = ?', (analysis_id,)
+            ).fetchone()
+            conn.execute(
+                'INSERT OR REPLACE INTO analyses (analysis_id, image_path, detections, created_at) VALUES (?, ?, ?, ?)',
+                (analysis_id, image_path, sqlite3.Binary(detections.to_bytes()), now)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            if self.on_delete:
+                self.on_delete(image_path)
+            raise
+        self.cache.discard(analysis_id)
+
+        deleted = [previous[0]] if previous else []
+        if now - self._last_cleanup > 60 * 60:
+            self._last_cleanup = now
+            cursor = conn.execute(
+                'DELETE FROM analyses WHERE created_at < ? RETURNING image_path', (now - self.ttl_seconds,)
+            )
+            deleted += [row[0] for row in cursor.fetchall()]
+        if self.on_delete:
+            for path in deleted:
+                self.on_delete(path)
+
+    def exists(self, analysis_id):
+        return self._connect().execute(
+            'SELECT 1 FROM analyses WHERE analysis_id = ?', (analysis_id,)
+        ).fetchone() is not None
+
+    def render(self, analysis_id, max_size=1024, image_format='jpeg', quality=80):
+        """
+        Annotated image for an analysis as (bytes, mimetype)
+
+        Args:
+            analysis_id: ID returned by the analysis
+            max_size: Longest side of the rendered image in pixels (never upscaled)
+            image_format: 'jpeg' or 'webp'
+            quality: Encoder quality, 1-100
+
+        Raises FileNotFoundError if the analysis or its photo is no longer stored.
+        """
+        extension, mimetype, quality_flag = RENDER_FORMATS[image_format]
+        key = (analysis_id, max_size, image_format, quality)
+        data = self.cache.get(key)
+        if data is not None:
+            return data, mimetype
+
+        row = self._connect().execute(
+            'SELECT image_path, detections FROM analyses WHERE analysis_id = ?', (analysis_id,)
+        ).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"Analysis '{analysis_id}' not found or expired")
+        image_path, blob = row
+
+        started = time.perf_counter()
+        image, scale = self._load_scaled(image_path, max_size)
+        self._draw(image, DetectionArray.from_bytes(blob), scale)
+        ok, encoded = cv2.imencode(extension, image, [quality_flag, quality])
+        if not ok:
+            raise RuntimeError(f"Could not encode {image_format} image")
+        data = encoded.tobytes()
+        elapsed = time.perf_counter() - started
+
+        self.cache.put(key, data)
+        with self._stats_lock:
+            self._renders += 1
+            self._render_time_total += elapsed
+        return data, mimetype
+
+    def _load_scaled(self, image_path, max_size):
+        """Image with its longest side at most max_size, and the scale applied"""
+        if image_path is None or not os.path.exists(image_path):
+            raise FileNotFoundError("The analysed photo is no longer stored")
+        with Image.open(image_path) as header:  #Reads the size only
+            width, height = header.size
+            # cv2.imread applies the EXIF orientation (as the detector saw it), PIL's size does not
+            if header.getexif().get(EXIF_ORIENTATION) in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+        scale = min(1.0, max_size / max(width, height))
+
+        # Let the JPEG decoder skip detail the preview does not need
+        flags = cv2.IMREAD_COLOR
+        for factor, reduced_flag in REDUCED_READS:
+            if scale * factor <= 1:
+                flags = reduced_flag
+                break
+        image = cv2.imread(image_path, flags)
+        if image is None:
+            raise FileNotFoundError("The analysed photo could not be read")
+
+        target = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if (image.shape[1], image.shape[0]) != target:
+            image = cv2.resize(image, target, interpolation=cv2.INTER_AREA)
+        return image, scale
+
+    def _draw(self, image, detections, scale):
+        """Draw every box, one polylines call per brick color"""
+        if not len(detections):
+            return
+        thickness = max(2, round(max(image.shape[:2]) / 400))  #Thinner lines vanish in JPEG chroma subsampling
+        x, y, w, h = (detections.bbox * scale).round().astype(np.int32).T
+        corners = np.stack([
+            np.stack([x, y], axis=1), np.stack([x + w, y], axis=1),
+            np.stack([x + w, y + h], axis=1), np.stack([x, y + h], axis=1)
+        ], axis=1)  #[n, 4, 2]
+        color_names = detections.color_names or COLOR_NAMES
+        for code in np.unique(detections.color_code):
+            color = BOX_COLORS.get(color_names[code], BOX_COLORS['Unknown'])
+            boxes = corners[detections.color_code == code]
+            cv2.polylines(image, list(boxes), True, color, thickness, cv2.LINE_AA)
+
+    def get_stats(self):
+        with self._stats_lock:
+            renders = self._renders
+            render_time = self._render_time_total
+        return {
+            "stored_analyses": self._connect().execute('SELECT COUNT(*) FROM analyses').fetchone()[0],
+            "renders": renders,
+            "avg_render_ms": round(render_time / renders * 1000, 2) if renders else 0,
+            "cache": self.cache.get_stats()
+        }
@@ -0,0 +1,233 @@
+# set_solver.py - Which sets can be built at the same time from one inventory
+
+import time
+
+import numpy as np
+
+OBJECTIVES = ('pieces', 'sets')
+
+
+class BuildabilitySolver:
+    def __init__(self, engine, time_budget_ms=200):
+        """
+        Choose a combination of sets that can all be built simultaneously
+
+        Sets compete for the same bricks, so this is a multi-dimensional
+        knapsack over (part, color) quantities. Sets that are not buildable on
+        their own are dropped first; the rest are packed greedily, most
+        valuable per unit of scarce bricks first, and then improved by local
+        search. A swap move releases one chosen set and refills the freed
+        bricks with sets that share its parts, kept only if the objective
+        improves. Local search stops when no swap helps or the time budget
+        runs out, so a result is always returned.
+
+        Each brick is in one pool. An any-color requirement draws from the
+        part's stock in any color: first colors no set asks for, then the
+        most plentiful ones. Its bricks are then gone for colored
+        requirements too.
+
+        Args:
+            engine: RecommendationEngine holding the set catalog
+            time_budget_ms: Default time budget per solve
+        """
+        self.engine = engine
+        self.time_budget_ms = time_budget_ms
+
+    def solve(self, bricks, objective='pieces', candidates=None, time_budget_ms=None, previous=None):
+        """
+        Find a near-optimal set combination for the inventory
+
+        Args:
+            bricks: Dicts with id, color and quantity
+            objective: 'pieces' to use as many bricks as possible, 'sets' to
+                build as many sets as possible
+            candidates: Optional set IDs to choose from (default: whole catalog)
+            time_budget_ms: Local search budget, defaults to the solver's
+            previous: An earlier result for a similar inventory. Its sets are
+                kept where they still fit, so small inventory changes re-solve
+                from a nearly finished solution.
+        """
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Unknown objective '{objective}', expected one of {', '.join(OBJECTIVES)}")
+        if time_budget_ms is None:
+            time_budget_ms = self.time_budget_ms
+
+        started = time.perf_counter()
+        deadline = started + time_budget_ms / 1000
+        engine = self.engine
+        remaining = engine.owned_vector(bricks)
+        owned_total = sum(int(b.get('quantity', 1)) for b in bricks)
+
+        # Only sets buildable on their own can be part of a combination
+        short = np.bincount(
+            engine.entry_set,
+            weights=engine.entry_qty > remaining[engine.entry_key],
+            minlength=len(engine.sets)
+        )
+        buildable = (short == 0) & (engine.set_required > 0)
+        if candidates is not None:
+            allowed = np.zeros(len(engine.sets), dtype=bool)
+            allowed[[engine.set_positions[s] for s in candidates if s in engine.set_positions]] = True
+            buildable &= allowed
+        pool = np.flatnonzero(buildable)
+
+        values = engine.set_required if objective == 'pieces' else np.ones(len(engine.sets))
+        requirements = {i: engine.set_entries(i) for i in pool.tolist()}
+        needs = {i: self._needs(*requirements[i]) for i in requirements}
+        # The per-key test above misses colored and any-color entries sharing one part
+        requirements = {i: r for i, r in requirements.items() if np.all(remaining[r[0]] >= needs[i])}
+        pool = np.array(sorted(requirements), dtype=np.int64)
+
+        # Scarcity: how much of the contested bricks a set uses per unit of value
+        demand = np.zeros(len(remaining))
+        for keys, quantities in requirements.values():
+            demand[keys] += quantities
+        pressure = demand / np.maximum(remaining, 1)
+        upper_bound = self._upper_bound(objective, pool, demand, remaining)
+
+        def priority(i):
+            keys, quantities = requirements[i]
+            return values[i] / float((quantities * pressure[keys]).sum())
+
+        ranked = sorted(requirements, key=priority, reverse=True)
+        rank = {i: r for r, i in enumerate(ranked)}
+
+        # All candidate requirements concatenated in rank order, so one
+        # vectorized pass finds every candidate that currently fits
+        if ranked:
+            pool_keys = np.concatenate([requirements[i][0] for i in ranked])
+            pool_quantities = np.concatenate([needs[i] for i in ranked])
+            pool_owners = np.repeat(np.arange(len(ranked)), [len(requirements[i][0]) for i in ranked])
+        selected = {}  #set -> (key, quantity) drawn from colored stock for its any-color entries
+
+        def fits(i):
+            return bool(np.all(remaining[requirements[i][0]] >= needs[i]))
+
+        def take(i):
+            keys, quantities = requirements[i]
+            wildcard = engine.key_is_any[keys]
+            colored_keys, colored_quantities = keys[~wildcard], quantities[~wildcard]
+            remaining[colored_keys] -= colored_quantities
+            # A part's any-color key holds all its bricks, colored ones included
+            parts = engine.any_key[colored_keys]
+            np.subtract.at(remaining, parts[parts >= 0], colored_quantities[parts >= 0])
+
+            drawn = []
+            for key, quantity in zip(keys[wildcard].tolist(), quantities[wildcard].tolist()):
+                colors = engine.part_color_keys.get(key)
+                remaining[key] -= quantity
+                if colors is None:
+                    continue
+                # Colors no set asks for first, then the most plentiful ones
+                quantity -= min(quantity, max(int(remaining[key] + quantity - remaining[colors].sum()), 0))
+                for color in colors[np.argsort(-remaining[colors], kind='stable')].tolist():
+                    if quantity <= 0:
+                        break
+                    used = min(quantity, int(remaining[color]))
+                    remaining[color] -= used
+                    drawn.append((color, used))
+                    quantity -= used
+            selected[i] = drawn
+
+        def release(i):
+            keys, quantities = requirements[i]
+            wildcard = engine.key_is_any[keys]
+            colored_keys, colored_quantities = keys[~wildcard], quantities[~wildcard]
+            remaining[colored_keys] += colored_quantities
+            parts = engine.any_key[colored_keys]
+            np.add.at(remaining, parts[parts >= 0], colored_quantities[parts >= 0])
+            remaining[keys[wildcard]] += quantities[wildcard]
+            for color, used in selected.pop(i):
+                remaining[color] += used
+
+        # Warm start from the previous solution, then fill greedily
+        warm_start = False
+        if previous:
+            kept = [engine.set_positions[s] for s in previous.get('set_ids', []) if s in engine.set_positions]
+            for i in sorted((i for i in kept if i in requirements), key=rank.get):
+                if fits(i):
+                    take(i)
+                    warm_start = True
+        for i in ranked:
+            if i not in selected and fits(i):
+                take(i)
+
+        # Local search: release one set and refill the freed bricks. After the
+        # greedy pass nothing else fits, so only sets sharing its bricks can
+        swaps_tried = 0
+        improvements = 0
+        timed_out = False
+        improved = True
+        while improved and not timed_out:
+            improved = False
+            for i in sorted(selected, key=rank.get, reverse=True):
+                if time.perf_counter() > deadline:
+                    timed_out = True
+                    break
+                if i not in selected:
+                    continue
+                swaps_tried += 1
+                release(i)
+
+                # Screen with one vectorized test, then re-check in rank order
+                # as each set taken uses up bricks
+                blocked = np.bincount(pool_owners, weights=pool_quantities > remaining[pool_keys],
+                                      minlength=len(ranked))
+                added = []
+                for r in np.flatnonzero(blocked == 0).tolist():
+                    j = ranked[r]
+                    if j != i and j not in selected and fits(j):
+                        take(j)
+                        added.append(j)
+                if sum(values[j] for j in added) > values[i]:
+                    improvements += 1
+                    improved = True
+                else:
+                    for j in added:
+                        release(j)
+                    take(i)
+
+        chosen = sorted(selected, key=lambda i: (-engine.set_required[i], engine.sets[i]['set_id']))
+        pieces_used = int(sum(engine.set_required[i] for i in chosen))
+
+        return {
+            "objective": objective,
+            "sets": [
+                {**engine.sets[i], "pieces_used": int(engine.set_required[i])}
+                for i in chosen
+            ],
+            "set_ids": [engine.sets[i]['set_id'] for i in chosen],
+            "sets_built": len(chosen),
+            "pieces_used": pieces_used,
+            "pieces_left": max(owned_total - pieces_used, 0),
+            "upper_bound": upper_bound,
+            "candidates": len(pool),
+            "swaps_tried": swaps_tried,
+            "improvements": improvements,
+            "warm_start": warm_start,
+            "timed_out": timed_out,
+            "solve_time_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def _needs(self, keys, quantities):
+        """
+        Stock each required key must hold for the set to fit: a part's
+        any-color key also has to cover the set's colored entries of that part
+        """
+        needs = quantities.copy()
+        parts = self.engine.any_key[keys]
+        for position in np.flatnonzero(self.engine.key_is_any[keys]).tolist():
+            needs[position] += quantities[parts == keys[position]].sum()
+        return needs
+
+    def _upper_bound(self, objective, pool, demand, owned):
+        """Cheap bound on the best objective, to show how close the solution is"""
+        if not len(pool):
+            return 0
+        usable = int(np.minimum(demand, owned).sum())
+        sizes = self.engine.set_required[pool]
+
+        if objective == 'pieces':
+            return min(int(sizes.sum()), usable)
+        # At most as many sets as fit in the usable bricks, smallest first
+        return int(np.searchsorted(np.cumsum(np.sort(sizes)), usable, side='right'))
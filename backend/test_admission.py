@@ -0,0 +1,112 @@
+#test_admission.py
+import unittest
+import threading
+import time
+from admission import AdmissionController, DeadlineExceeded, Overloaded
+
+class TestAdmissionController(unittest.TestCase):
+
+    def hold_slots(self, controller, count):
+        """Occupy slots from background threads until the returned event is set"""
+        release = threading.Event()
+        started = threading.Barrier(count + 1)
+
+        def hold():
+            with controller.slot():
+                started.wait()
+                release.wait()
+
+        threads = [threading.Thread(target=hold) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        started.wait()
+        return release, threads
+
+    def test_sheds_when_queue_is_full(self):
+        """Test requests beyond the slots and the queue are rejected with a retry hint"""
+        controller = AdmissionController(max_concurrent=1, max_queue=0)
+        release, threads = self.hold_slots(controller, 1)
+        try:
+            with self.assertRaises(Overloaded) as context:
+                with controller.slot(controller.deadline()):
+                    pass
+            self.assertGreaterEqual(context.exception.retry_after, 1)
+            with self.assertRaises(Overloaded):
+                controller.check_capacity()
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        stats = controller.get_stats()
+        self.assertEqual((stats['shed'], stats['in_flight']), (2, 0))
+
+    def test_queued_request_expires(self):
+        """Test a request waiting for a slot gives up at its deadline"""
+        controller = AdmissionController(max_concurrent=1, max_queue=4)
+        release, threads = self.hold_slots(controller, 1)
+        try:
+            started = time.monotonic()
+            with self.assertRaises(DeadlineExceeded):
+                with controller.slot(controller.deadline(50)):
+                    pass
+            self.assertLess(time.monotonic() - started, 1)
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(controller.get_stats()['expired_by_stage'], {'queue': 1})
+
+    def test_queued_request_runs_when_slot_frees(self):
+        """Test waiting requests get the slot once it is released"""
+        controller = AdmissionController(max_concurrent=1, max_queue=4)
+        release, threads = self.hold_slots(controller, 1)
+        threading.Timer(0.05, release.set).start()
+        with controller.slot(controller.deadline(5000)):
+            self.assertEqual(controller.get_stats()['in_flight'], 1)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(controller.get_stats()['admitted'], 2)
+
+    def test_background_work_leaves_slots_for_requests(self):
+        """Test work without a deadline holds at most max_background slots and never fills the queue"""
+        controller = AdmissionController(max_concurrent=2, max_queue=0, max_background=1)
+        release, threads = self.hold_slots(controller, 1)
+        def background():
+            with controller.slot():
+                pass
+
+        waiting = threading.Thread(target=background)
+        waiting.start()
+        try:
+            for _ in range(100):
+                if controller.get_stats()['background_waiting']:
+                    break
+                time.sleep(0.01)
+            controller.check_capacity()
+            with controller.slot(controller.deadline(5000)):
+                self.assertEqual(controller.get_stats()['in_flight'], 2)
+        finally:
+            release.set()
+            for thread in threads + [waiting]:
+                thread.join()
+        self.assertEqual(controller.get_stats()['shed'], 0)
+
+    def test_deadline_check(self):
+        """Test stages after the deadline raise and are counted"""
+        controller = AdmissionController(default_deadline_seconds=10, max_deadline_seconds=60)
+        self.assertAlmostEqual(controller.deadline().seconds, 10)
+        self.assertEqual(controller.deadline(10 ** 9).seconds, 60)
+        controller.deadline(1000).check('detection')
+
+        expired = controller.deadline(0.001)
+        time.sleep(0.002)
+        with self.assertRaises(DeadlineExceeded):
+            expired.check('detection')
+        self.assertEqual(controller.get_stats()['expired'], 1)
+
+        with self.assertRaises(ValueError):
+            controller.deadline('-5')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,19 @@
 import unittest
 import json
 import os
+import contextlib
 import tempfile
+import zipfile
+from io import BytesIO
+from unittest import mock
+
+#Keep test data out of the real uploads/ and data/ folders
+os.environ['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+os.environ['DATA_FOLDER'] = tempfile.mkdtemp()
+
+import app as app_module
 from app import app
+from admission import AdmissionController
 
 class TestLegoAPI(unittest.TestCase):
     
@@ -40,6 +51,23 @@ class TestLegoAPI(unittest.TestCase):
         self.assertIn('version', data)
         self.assertIn('endpoints', data)
     
+    def test_version_reports_models(self):
+        """Test model versions are reported and unknown pinned versions rejected"""
+        data = json.loads(self.app.get('/api/version').data)
+        self.assertIn('models', data)
+        self.assertIn('versions', data['models'])
+        
+        with open(self.test_image_path, 'rb') as f:
+            response = self.app.post('/api/analyze-photo?model_version=nope', data={'file': (f, 'scan.jpg')})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_metrics_endpoint(self):
+        """Test metrics endpoint"""
+        response = self.app.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertIn('batching', data)
+    
     def test_upload_no_file(self):
         """Test upload without file"""
         response = self.app.post('/api/upload')
@@ -58,6 +86,412 @@ class TestLegoAPI(unittest.TestCase):
         response = self.app.post('/api/analyze-photo')
         self.assertEqual(response.status_code, 400)
     
+    def test_submit_job_no_file(self):
+        """Test job submission without file"""
+        response = self.app.post('/api/jobs')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_get_job_unknown(self):
+        """Test polling an unknown job ID"""
+        response = self.app.get('/api/jobs/job_missing')
+        self.assertEqual(response.status_code, 404)
+        data = json.loads(response.data)
+        self.assertFalse(data['success'])
+    
+    def test_analyze_batch_no_files(self):
+        """Test bulk analysis without files"""
+        response = self.app.post('/api/analyze-batch')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_analyze_batch_zip_streams_ndjson(self):
+        """Test bulk ZIP analysis streams per-image lines and an aggregated summary"""
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            with open(self.test_image_path, 'rb') as f:
+                image_bytes = f.read()
+            zf.writestr('scan_1.jpg', image_bytes)
+            zf.writestr('nested/scan_2.jpg', image_bytes)
+            zf.writestr('notes.txt', 'not an image')
+        archive.seek(0)
+        
+        detections = [{"id": "3001", "name": "2x4 Brick", "color": "Red", "quantity": 2, "confidence": 0.9}]
+        with mock.patch.object(app_module, 'detector', object()), \
+             mock.patch.object(app_module, 'process_image_for_bricks', return_value=detections):
+            response = self.app.post('/api/analyze-batch', data={'archive': (archive, 'scans.zip')})
+            lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(sorted(line['filename'] for line in lines[:-1]), ['nested/scan_2.jpg', 'scan_1.jpg'])
+        summary = lines[-1]
+        self.assertEqual(summary['type'], 'summary')
+        self.assertEqual(summary['images_processed'], 2)
+        self.assertEqual(summary['total_bricks'], 4)
+    
+    def test_analyze_photo_gets_slot_during_bulk_run(self):
+        """Test a bulk run cannot take the detection slots interactive requests need"""
+        import threading
+        bulk_started = threading.Event()
+        release = threading.Event()
+        
+        class Runner:
+            def detect_bricks(self, image):
+                if not isinstance(image, str):
+                    #Bulk images are decoded in memory
+                    bulk_started.set()
+                    release.wait(5)
+                return app_module.DetectionArray([[1, 1, 5, 5]], [0.9], [0], [0])
+        
+        @contextlib.contextmanager
+        def acquire(version=None):
+            yield mock.Mock(runner=Runner())
+        
+        with open(self.test_image_path, 'rb') as f:
+            image = f.read()
+        admission = AdmissionController(max_concurrent=2, max_queue=0, max_background=1)
+        results = {}
+        with mock.patch.object(app_module, 'detector', object()), \
+             mock.patch.object(app_module, 'admission', admission), \
+             mock.patch.object(app_module.model_registry, 'acquire', acquire):
+            def bulk():
+                files = [(BytesIO(image), f'scan{i}.jpg') for i in range(4)]
+                results['bulk'] = self.app.post('/api/analyze-batch', data={'files': files}).get_data(as_text=True)
+            
+            thread = threading.Thread(target=bulk)
+            thread.start()
+            try:
+                self.assertTrue(bulk_started.wait(5))
+                response = self.app.post('/api/analyze-photo', data={'file': (BytesIO(image), 'scan.jpg')})
+                self.assertEqual(response.status_code, 200)
+            finally:
+                release.set()
+                thread.join()
+        
+        summary = json.loads(results['bulk'].splitlines()[-1])
+        self.assertEqual(summary['images_processed'], 4)
+        self.assertEqual(admission.get_stats()['shed'], 0)
+    
+    def test_analyze_batch_reports_stream_errors(self):
+        """Test an error after streaming has started ends the stream with an error line"""
+        with open(self.test_image_path, 'rb') as f:
+            image_bytes = f.read()
+        
+        def broken_archive():
+            yield 'scan_1.jpg', image_bytes
+            raise zipfile.BadZipFile("Bad CRC-32 for file 'scan_2.jpg'")
+        
+        detections = [{"id": "3001", "name": "2x4 Brick", "color": "Red", "quantity": 1}]
+        with mock.patch.object(app_module, 'detector', object()), \
+             mock.patch.object(app_module, 'iter_bulk_images', broken_archive), \
+             mock.patch.object(app_module, 'process_image_for_bricks', return_value=detections):
+            with open(self.test_image_path, 'rb') as f:
+                response = self.app.post('/api/analyze-batch', data={'files': (f, 'scan_1.jpg')})
+            lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(lines[-1]['type'], 'error')
+        self.assertIn('CRC', lines[-1]['error'])
+    
+    def test_analyze_photo_merge_inventory_once(self):
+        """Test analyze-and-merge adds bricks to the inventory once per upload"""
+        self.app.delete('/api/inventory?confirm=true')
+        detections = [{"id": "3005", "name": "1x1 Brick", "color": "Green", "quantity": 4, "confidence": 0.9}]
+        
+        with mock.patch.object(app_module, 'detector', object()), \
+             mock.patch.object(app_module, 'process_image_for_bricks', return_value=detections):
+            for _ in range(2):
+                with open(self.test_image_path, 'rb') as f:
+                    response = self.app.post(
+                        '/api/analyze-photo?merge_inventory=true',
+                        data={'file': (f, 'scan.jpg'), 'upload_id': 'scan-42'}
+                    )
+                self.assertEqual(response.status_code, 200)
+        
+        merge = json.loads(response.data)['inventory_merge']
+        self.assertEqual(merge, {"upload_id": "scan-42", "applied": False, "bricks_merged": 4})
+        data = json.loads(self.app.get('/api/inventory/summary').data)
+        self.assertEqual(data['summary']['total_bricks'], 4)
+    
+    def test_failed_detection_is_not_merged(self):
+        """Test a detection error returns 5xx and leaves the upload free to merge on retry"""
+        self.app.delete('/api/inventory?confirm=true')
+        detections = [{"id": "3005", "name": "1x1 Brick", "color": "Green", "quantity": 2, "confidence": 0.9}]
+        
+        with mock.patch.object(app_module, 'detector', object()), \
+             mock.patch.object(app_module, 'process_image_for_bricks',
+                               side_effect=[RuntimeError("worker crashed"), detections]):
+            responses = []
+            for _ in range(2):
+                with open(self.test_image_path, 'rb') as f:
+                    responses.append(self.app.post(
+                        '/api/analyze-photo?merge_inventory=true',
+                        data={'file': (f, 'scan.jpg'), 'upload_id': 'scan-failed-once'}
+                    ))
+        
+        self.assertEqual(responses[0].status_code, 500)
+        self.assertEqual(responses[1].status_code, 200)
+        self.assertTrue(json.loads(responses[1].data)['inventory_merge']['applied'])
+    
+    def test_inference_worker_errors_map_to_5xx(self):
+        """Test broker timeouts and failed jobs are 504/503, never an empty 200"""
+        cases = [
+            (app_module.InferenceTimeout("No inference worker finished the job within 60s"), 504, 'INFERENCE_TIMEOUT'),
+            (app_module.InferenceFailed("Inference failed: Could not decode image"), 503, 'INFERENCE_FAILED')
+        ]
+        for error, status, code in cases:
+            with mock.patch.object(app_module, 'detector', object()), \
+                 mock.patch.object(app_module, 'process_image_for_bricks', side_effect=error):
+                with open(self.test_image_path, 'rb') as f:
+                    response = self.app.post('/api/upload', data={'file': (f, 'scan.jpg')})
+            self.assertEqual(response.status_code, status)
+            self.assertEqual(json.loads(response.data)['code'], code)
+    
+    def test_detection_without_model_raises(self):
+        """Test a missing model is an error, not an image without bricks"""
+        with mock.patch.object(app_module.model_registry, 'acquire', return_value=mock.MagicMock()) as acquire:
+            acquire.return_value.__enter__.return_value = None
+            with self.assertRaises(app_module.DetectorUnavailable):
+                app_module.process_image_for_bricks(self.test_image_path)
+    
+    def test_analyze_photo_fields_projection(self):
+        """Test ?fields= returns and computes only the requested sections"""
+        detections = [{"id": "3001", "name": "2x4 Brick", "color": "Red", "quantity": 1, "confidence": 0.9}]
+        
+        with mock.patch.object(app_module, 'detector', object()), \
+             mock.patch.object(app_module, 'process_image_for_bricks', return_value=detections), \
+             mock.patch.object(app_module, 'suggest_sets_from_bricks') as suggest, \
+             mock.patch.object(app_module, 'get_image_metadata') as metadata:
+            with open(self.test_image_path, 'rb') as f:
+                response = self.app.post('/api/analyze-photo?fields=bricks', data={'file': (f, 'scan.jpg')})
+            suggest.assert_not_called()
+            metadata.assert_not_called()
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(set(data), {'success', 'analysis_id', 'bricks'})
+        self.assertEqual(data['bricks'], detections)
+    
+    def test_analyze_photo_fields_without_detector(self):
+        """Test fields that need no detection are served without a model, others get 503"""
+        with mock.patch.object(app_module, 'detector', None), \
+             mock.patch.object(app_module.model_registry, 'acquire', return_value=contextlib.nullcontext()):
+            with open(self.test_image_path, 'rb') as f:
+                response = self.app.post('/api/analyze-photo?fields=timestamp', data={'file': (f, 'scan.jpg')})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('timestamp', json.loads(response.data))
+            
+            with open(self.test_image_path, 'rb') as f:
+                response = self.app.post('/api/analyze-photo?fields=bricks', data={'file': (f, 'scan.jpg')})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(json.loads(response.data)['code'], 'DETECTOR_NOT_INITIALIZED')
+    
+    def test_analyze_photo_unknown_field(self):
+        """Test an unknown field is rejected"""
+        with open(self.test_image_path, 'rb') as f:
+            response = self.app.post('/api/analyze-photo?fields=bricks,nope', data={'file': (f, 'scan.jpg')})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_analyze_photo_columnar(self):
+        """Test the columnar format returns parallel, dictionary-encoded arrays"""
+        detections = [
+            {"id": "3001", "name": "2x4 Brick", "color": "Red", "quantity": 1, "confidence": 0.9, "bbox": [1, 2, 3, 4]},
+            {"id": "3001", "name": "2x4 Brick", "color": "Blue", "quantity": 1, "confidence": 0.8, "bbox": [5, 6, 7, 8]},
+            {"id": "3023", "name": "1x2 Plate", "color": "Red", "quantity": 1, "confidence": 0.7, "bbox": [9, 10, 11, 12]}
+        ]
+        
+        with mock.patch.object(app_module, 'detector', object()), \
+             mock.patch.object(app_module, 'process_image_for_bricks', return_value=detections):
+            with open(self.test_image_path, 'rb') as f:
+                response = self.app.post(
+                    '/api/analyze-photo?format=columnar&fields=bricks',
+                    data={'file': (f, 'scan.jpg')}
+                )
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['format'], 'columnar')
+        bricks = data['bricks']
+        self.assertEqual(bricks['count'], 3)
+        self.assertEqual(bricks['id'], ['3001', '3001', '3023'])
+        self.assertEqual(bricks['name'], {"codes": [0, 0, 1], "values": ["2x4 Brick", "1x2 Plate"]})
+        self.assertEqual(bricks['color'], {"codes": [0, 1, 0], "values": ["Red", "Blue"]})
+        self.assertEqual(bricks['confidence'], [0.9, 0.8, 0.7])
+        self.assertEqual(bricks['bbox'], list(range(1, 13)))
+    
+    def test_upload_shed_when_overloaded(self):
+        """Test a full detection queue answers 429 with Retry-After before reading the upload"""
+        with mock.patch.object(app_module, 'admission', AdmissionController(max_concurrent=0, max_queue=0)), \
+             mock.patch.object(app_module, 'process_image_for_bricks') as process:
+            with open(self.test_image_path, 'rb') as f:
+                response = self.app.post('/api/upload', data={'file': (f, 'scan.jpg')})
+        
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(json.loads(response.data)['code'], 'OVERLOADED')
+        process.assert_not_called()
+    
+    def test_shed_request_body_is_not_parsed(self):
+        """Test a shed request is rejected before its multipart body is parsed"""
+        for url in ('/api/upload?model_version=v1', '/api/analyze-photo?fields=bricks&format=columnar'):
+            with mock.patch.object(app_module, 'admission', AdmissionController(max_concurrent=0, max_queue=0)), \
+                 mock.patch.object(app_module.LegoRequest, '_load_form_data') as load_form:
+                with open(self.test_image_path, 'rb') as f:
+                    response = self.app.post(url, data={'file': (f, 'scan.jpg'), 'fields': 'bricks'})
+            
+            self.assertEqual(response.status_code, 429)
+            load_form.assert_not_called()
+    
+    def test_analyze_photo_deadline_exceeded(self):
+        """Test work is abandoned with 504 once the client's deadline has passed"""
+        detections = [{"id": "3001", "name": "2x4 Brick", "color": "Red", "quantity": 1}]
+        
+        with mock.patch.object(app_module, 'detector', object()), \
+             mock.patch.object(app_module, 'process_image_for_bricks', return_value=detections), \
+             mock.patch.object(app_module, 'suggest_sets_from_bricks') as suggest:
+            with open(self.test_image_path, 'rb') as f:
+                response = self.app.post(
+                    '/api/analyze-photo',
+                    data={'file': (f, 'scan.jpg')},
+                    headers={'X-Request-Deadline-Ms': '0.001'}
+                )
+        
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(json.loads(response.data)['code'], 'DEADLINE_EXCEEDED')
+        suggest.assert_not_called()
+        metrics = json.loads(self.app.get('/api/metrics').data)
+        self.assertGreaterEqual(metrics['admission']['expired_by_stage']['suggested_sets'], 1)
+    
+    def test_invalid_deadline_header(self):
+        """Test a malformed deadline header is rejected"""
+        with open(self.test_image_path, 'rb') as f:
+            response = self.app.post('/api/upload', data={'file': (f, 'scan.jpg')},
+                                     headers={'X-Request-Deadline-Ms': 'soon'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_render_analysis_preview(self):
+        """Test an analysis preview is rendered as an image and revalidated by ETag"""
+        detections = app_module.DetectionArray([[1, 1, 5, 5]], [0.9], [0], [0])
+        app_module.result_renderer.save('ana_test_render', self.test_image_path, detections)
+        
+        response = self.app.get('/api/analyses/ana_test_render/render?max_size=64&format=webp&quality=50')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/webp')
+        self.assertIn('max-age', response.headers['Cache-Control'])
+        
+        cached = self.app.get('/api/analyses/ana_test_render/render?max_size=64&format=webp&quality=50',
+                              headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+    
+    def test_uploads_are_held_while_in_use(self):
+        """Test an upload is referenced while it is processed and while a saved analysis renders it"""
+        import numpy as np
+        import cv2
+        ok, image = cv2.imencode('.png', np.full((12, 12, 3), 77, dtype=np.uint8))
+        store = app_module.upload_store
+        detections = app_module.DetectionArray([[1, 1, 5, 5]], [0.9], [0], [0])
+        held = []
+        
+        def refcount(digest):
+            return store._connect().execute('SELECT refcount FROM blobs WHERE digest = ?', (digest,)).fetchone()[0]
+        
+        def detect(image_path, model_version=None, deadline=None, analysis_id=None):
+            held.append(refcount(store.digest(image_path)))
+            if analysis_id:
+                app_module.save_for_rendering(analysis_id, image_path, detections)
+            return []
+        
+        with mock.patch.object(app_module, 'detector', object()), \
+             mock.patch.object(app_module, 'process_image_for_bricks', side_effect=detect):
+            response = self.app.post('/api/upload', data={'file': (BytesIO(image.tobytes()), 'held.png')})
+            upload_id = json.loads(response.data)['upload_id']
+            self.assertEqual((held, refcount(upload_id)), ([1], 0))
+            
+            response = self.app.post('/api/analyze-photo', data={'file': (BytesIO(image.tobytes()), 'held.png')})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((held, refcount(upload_id)), ([1, 1], 1))  #The saved analysis keeps it
+    
+    def test_render_analysis_errors(self):
+        """Test unknown analyses are 404 and bad render parameters 400"""
+        self.assertEqual(self.app.get('/api/analyses/ana_missing/render').status_code, 404)
+        self.assertEqual(self.app.get('/api/analyses/ana_missing/render?format=gif').status_code, 400)
+        self.assertEqual(self.app.get('/api/analyses/ana_missing/render?quality=0').status_code, 400)
+    
+    def test_recommendations_from_inventory(self):
+        """Test recommendations are scored against the stored inventory"""
+        self.app.delete('/api/inventory?confirm=true')
+        bricks = [{"id": bid, "name": bid, "color": "Red", "quantity": 2} for bid in ['3001', '3004', '3622']]
+        self.app.post('/api/inventory', json={"bricks": bricks})
+        
+        response = self.app.get('/api/recommendations?limit=1')
+        self.assertEqual(response.status_code, 200)
+        recommendations = json.loads(response.data)['recommendations']
+        self.assertEqual(len(recommendations), 1)
+        self.assertEqual(recommendations[0]['set_id'], '31134')
+        self.assertEqual(recommendations[0]['completion_percentage'], 75)
+    
+    def test_buildable_sets(self):
+        """Test solving for sets buildable together, cached until the inventory changes"""
+        self.app.delete('/api/inventory?confirm=true')
+        bricks = [{"id": bid, "name": bid, "color": "Red", "quantity": 1} for bid in ['3001', '3003', '3023', '3005']]
+        self.app.post('/api/inventory', json={"bricks": bricks})
+        
+        data = json.loads(self.app.get('/api/buildable-sets').data)
+        self.assertEqual(data['set_ids'], ['10698'])
+        self.assertFalse(data['cached'])
+        self.assertTrue(json.loads(self.app.get('/api/buildable-sets').data)['cached'])
+        
+        response = self.app.get('/api/buildable-sets?objective=cheapest')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_buildable_sets_cache_is_bounded_and_shared(self):
+        """Test concurrent identical requests solve once and old set_ids keys are evicted"""
+        import threading
+        import time
+        calls = []
+        
+        def slow_solve(bricks, **kwargs):
+            calls.append(kwargs['candidates'])
+            time.sleep(0.2)
+            return {"set_ids": []}
+        
+        app_module.buildable_solutions.clear()
+        with mock.patch.object(app_module.set_solver, 'solve', side_effect=slow_solve), \
+             mock.patch.dict(app.config, {'SOLVER_CACHE_SIZE': 2}):
+            threads = [threading.Thread(target=app.test_client().get, args=('/api/buildable-sets?set_ids=a',))
+                       for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(calls, [['a']])
+            
+            for set_id in ('b', 'c'):
+                self.app.get(f'/api/buildable-sets?set_ids={set_id}')
+        
+        self.assertEqual(list(app_module.buildable_solutions), [('pieces', ('b',)), ('pieces', ('c',))])
+    
+    def test_bulk_metadata_lookup(self):
+        """Test bricks and sets can be fetched many at a time"""
+        response = self.app.get('/api/bricks?ids=3001,9999,3023')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual([b['id'] for b in data['bricks']], ['3001', '3023'])
+        self.assertEqual(data['not_found'], ['9999'])
+        
+        data = json.loads(self.app.get('/api/sets?ids=31134,10698').data)
+        self.assertEqual([s['set_id'] for s in data['sets']], ['31134', '10698'])
+        
+        response = self.app.get('/api/bricks')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_catalog_responses_are_cacheable(self):
+        """Test catalog endpoints send cache headers and honour If-None-Match"""
+        response = self.app.get('/api/brick/3001')
+        self.assertIn('max-age=86400', response.headers['Cache-Control'])
+        
+        response = self.app.get('/api/brick/3001', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+    
     def test_get_brick_metadata_valid(self):
         """Test getting metadata for known brick"""
         response = self.app.get('/api/brick/3001')
@@ -87,6 +521,66 @@ class TestLegoAPI(unittest.TestCase):
         response = self.app.post('/api/inventory', json={})
         self.assertEqual(response.status_code, 400)
     
+    def test_inventory_add_update_delete(self):
+        """Test inventory changes are persisted"""
+        self.app.delete('/api/inventory?confirm=true')
+        bricks = [
+            {"id": "3001", "name": "2x4 Brick", "color": "Red", "quantity": 5},
+            {"id": "3001", "name": "2x4 Brick", "color": "Blue", "quantity": 2},
+            {"id": "3023", "name": "1x2 Plate", "color": "Red", "quantity": 7}
+        ]
+        response = self.app.post('/api/inventory', json={"bricks": bricks})
+        self.assertEqual(response.status_code, 200)
+        
+        data = json.loads(self.app.get('/api/inventory?color=red&min_quantity=6').data)
+        self.assertEqual([item['id'] for item in data['inventory']], ['3023'])
+        
+        response = self.app.put('/api/inventory', json={"updates": [{"id": "3023", "quantity": 20}]})
+        update = json.loads(response.data)['updates'][0]
+        self.assertEqual((update['old_quantity'], update['new_quantity']), (7, 20))
+        
+        self.app.delete('/api/inventory?brick_id=3001')
+        data = json.loads(self.app.get('/api/inventory').data)
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['summary']['total_bricks'], 20)
+    
+    def test_inventory_pagination_and_etag(self):
+        """Test cursor pagination and If-None-Match revalidation"""
+        self.app.delete('/api/inventory?confirm=true')
+        bricks = [{"id": str(3000 + i), "name": "Part", "color": "Red", "quantity": 1} for i in range(5)]
+        self.app.post('/api/inventory', json={"bricks": bricks})
+        
+        first = self.app.get('/api/inventory?limit=3')
+        data = json.loads(first.data)
+        self.assertTrue(data['has_more'])
+        second = json.loads(self.app.get(f"/api/inventory?limit=3&cursor={data['next_cursor']}").data)
+        self.assertEqual([item['id'] for item in second['inventory']], ['3003', '3004'])
+        self.assertFalse(second['has_more'])
+        
+        etag = first.headers['ETag']
+        response = self.app.get('/api/inventory?limit=3', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        
+        self.app.post('/api/inventory', json={"bricks": bricks[:1]})
+        response = self.app.get('/api/inventory?limit=3', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+    
+    def test_inventory_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        response = self.app.get('/api/inventory?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_inventory_sync(self):
+        """Test delta sync endpoint"""
+        data = json.loads(self.app.get('/api/inventory/sync').data)
+        self.assertTrue(data['full_resync'])
+        
+        self.app.post('/api/inventory', json={"bricks": [{"id": "3622", "name": "1x3 Brick", "color": "Tan", "quantity": 2}]})
+        data = json.loads(self.app.get(f"/api/inventory/sync?token={data['sync_token']}").data)
+        self.assertFalse(data['full_resync'])
+        self.assertIn('3622', [item['id'] for item in data['upserted']])
+    
     def test_recommendations_get(self):
         """Test getting recommendations"""
         response = self.app.get('/api/recommendations')
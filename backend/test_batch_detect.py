@@ -0,0 +1,152 @@
+#test_batch_detect.py
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+import cv2
+import numpy as np
+from detections import COLOR_CODES, DetectionArray
+from batch_detect import find_images, run_batch
+
+PART_IDS = {'2x4 Brick': '3001', '1x2 Plate': '3023'}
+
+class FakeDetector:
+    """Two red 2x4 bricks and a blue 1x2 plate per image; can stop after a number of images"""
+
+    def __init__(self, interrupt_after=None, fail_on='broken'):
+        self.calls = 0
+        self.interrupt_after = interrupt_after
+        self.fail_on = fail_on
+        self.lock = threading.Lock()
+
+    def detect_bricks(self, image_path):
+        with self.lock:
+            self.calls += 1
+            if self.interrupt_after is not None and self.calls > self.interrupt_after:
+                raise KeyboardInterrupt
+        if self.fail_on and self.fail_on in image_path:
+            raise ValueError("Could not read image")
+        return DetectionArray(
+            [[0, 0, 4, 2], [5, 0, 4, 2], [0, 5, 2, 1]], [0.9, 0.8, 0.7], [0, 0, 1],
+            [COLOR_CODES['Red'], COLOR_CODES['Red'], COLOR_CODES['Blue']],
+            class_names=('2x4 Brick', '1x2 Plate')
+        )
+
+class TestBatchDetect(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.images = os.path.join(self.folder, 'images')
+        image = np.zeros((8, 8, 3), dtype=np.uint8)
+        for i in range(10):
+            subfolder = os.path.join(self.images, f'box{i % 2}')
+            os.makedirs(subfolder, exist_ok=True)
+            cv2.imwrite(os.path.join(subfolder, f'scan{i}.jpg'), image)
+        with open(os.path.join(self.images, 'notes.txt'), 'w') as f:
+            f.write('not an image')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def run_batch(self, output, detector, workers=3, **kwargs):
+        return run_batch(self.images, output, detector, workers=workers, pool='thread',
+                         part_id=PART_IDS.get, progress=False, **kwargs)
+
+    def test_find_images(self):
+        """Test images are found recursively, in a stable order, with other files skipped"""
+        images = find_images(self.images)
+        self.assertEqual(len(images), 10)
+        self.assertEqual(images[0], os.path.join('box0', 'scan0.jpg'))
+        self.assertEqual(images, sorted(images))
+
+    def test_report_counts_per_part_and_color(self):
+        """Test every output format adds up to the same counts"""
+        for output_format, name in (('jsonl', 'out.jsonl'), ('csv', 'out.csv'), ('npz', 'out_npz')):
+            summary = self.run_batch(os.path.join(self.folder, name), FakeDetector(),
+                                     output_format_name=output_format, shard_size=4)
+            self.assertEqual(summary['processed'], 10)
+            self.assertEqual(
+                dict(summary['counts']),
+                {('3001', '2x4 Brick', 'Red'): 20, ('3023', '1x2 Plate', 'Blue'): 10}
+            )
+
+    def test_resume_after_interruption(self):
+        """Test an interrupted run resumes without redoing or duplicating images"""
+        output = os.path.join(self.folder, 'out.jsonl')
+        with self.assertRaises(KeyboardInterrupt):
+            self.run_batch(output, FakeDetector(interrupt_after=4), workers=1)
+
+        #A record written after the last checkpoint is dropped on resume
+        with open(output, 'a') as f:
+            f.write('{"path": "half written')
+
+        detector = FakeDetector()
+        summary = self.run_batch(output, detector)
+        self.assertEqual(summary['skipped'] + summary['processed'], 10)
+        self.assertEqual(detector.calls, summary['processed'])
+        self.assertEqual(summary['skipped'], 4)
+
+        with open(output) as f:
+            paths = [json.loads(line)['path'] for line in f]
+        self.assertEqual(sorted(paths), find_images(self.images))
+        self.assertEqual(summary['counts'][('3001', '2x4 Brick', 'Red')], 20)
+
+        #Nothing left to do
+        self.assertEqual(self.run_batch(output, FakeDetector())['processed'], 0)
+
+    def test_failed_images_are_recorded(self):
+        """Test unreadable images are reported once and not retried on resume"""
+        cv2.imwrite(os.path.join(self.images, 'broken.png'), np.zeros((2, 2, 3), dtype=np.uint8))
+        output = os.path.join(self.folder, 'out.csv')
+        summary = self.run_batch(output, FakeDetector(), output_format_name='csv')
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(self.run_batch(output, FakeDetector(), output_format_name='csv')['processed'], 0)
+
+    def test_retry_failed_images(self):
+        """Test failed images are detected again with retry_failed, and only once they succeed"""
+        cv2.imwrite(os.path.join(self.images, 'broken.png'), np.zeros((2, 2, 3), dtype=np.uint8))
+        output = os.path.join(self.folder, 'out.jsonl')
+        self.run_batch(output, FakeDetector())
+        self.assertEqual(self.run_batch(output, FakeDetector())['earlier_failures'], 1)
+
+        #Still failing: retried and recorded as failed again
+        detector = FakeDetector()
+        summary = self.run_batch(output, detector, retry_failed=True)
+        self.assertEqual((summary['processed'], summary['failed'], detector.calls), (1, 1, 1))
+
+        #Fixed: retried once, then done
+        summary = self.run_batch(output, FakeDetector(fail_on=None), retry_failed=True)
+        self.assertEqual((summary['processed'], summary['failed']), (1, 0))
+        self.assertEqual(summary['counts'][('3001', '2x4 Brick', 'Red')], 22)
+        self.assertEqual(self.run_batch(output, FakeDetector(), retry_failed=True)['processed'], 0)
+
+    def test_npz_resume_leaves_other_files_alone(self):
+        """Test resuming into an npz folder only touches its own shards"""
+        output = os.path.join(self.folder, 'out_npz')
+        with self.assertRaises(KeyboardInterrupt):
+            self.run_batch(output, FakeDetector(interrupt_after=4), workers=1, output_format_name='npz', shard_size=2)
+        for name in ('foo.npz', 'notes.txt', 'part-00001.npz.tmp'):
+            with open(os.path.join(output, name), 'w') as f:
+                f.write('not a shard')
+
+        summary = self.run_batch(output, FakeDetector(), output_format_name='npz', shard_size=2)
+        self.assertEqual((summary['skipped'], summary['processed']), (4, 6))
+        self.assertEqual(summary['counts'][('3001', '2x4 Brick', 'Red')], 20)
+        self.assertEqual(
+            sorted(os.listdir(output)),
+            ['foo.npz', 'notes.txt'] + [f'part-{i:05d}.npz' for i in range(5)]
+        )
+
+    def test_existing_output_needs_restart(self):
+        """Test results from elsewhere are not overwritten without --restart"""
+        output = os.path.join(self.folder, 'out.jsonl')
+        with open(output, 'w') as f:
+            f.write('{}\n')
+        with self.assertRaises(FileExistsError):
+            self.run_batch(output, FakeDetector())
+        self.assertEqual(self.run_batch(output, FakeDetector(), restart=True)['processed'], 10)
+
+if __name__ == '__main__':
+    unittest.main()
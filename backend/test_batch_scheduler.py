@@ -0,0 +1,102 @@
+#test_batch_scheduler.py
+import unittest
+import json
+import threading
+import numpy as np
+from brick_detector import BrickDetector
+from batch_scheduler import BatchScheduler
+from json_provider import default
+
+class FakeSession:
+    """Stands in for onnxruntime: one box per image, width taken from the pixel value"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def run(self, output_names, feed):
+        tensor = feed['images']
+        self.batch_sizes.append(tensor.shape[0])
+
+        #YOLOv8 layout: [batch, 4 + classes, anchors]
+        outputs = np.zeros((tensor.shape[0], 6, 2), dtype=np.float32)
+        for i in range(tensor.shape[0]):
+            width = 10 + round(float(tensor[i, 0, 32, 32]) * 40)
+            outputs[i, :4, 0] = [32, 32, width, 20]
+            outputs[i, 4, 0] = 0.9
+        return [outputs]
+
+def make_detector():
+    detector = BrickDetector.__new__(BrickDetector)
+    detector.session = FakeSession()
+    detector.input_name = 'images'
+    detector.input_size = 64
+    detector.supports_batching = True
+    detector.conf_threshold = 0.25
+    detector.iou_threshold = 0.45
+    detector.class_names = ['2x4 Brick', '2x2 Brick']
+    detector._reset_stats()
+    return detector
+
+class TestBatchScheduler(unittest.TestCase):
+
+    def test_results_match_unbatched_detector(self):
+        """Test scheduler returns the same detections as calling the detector directly"""
+        detector = make_detector()
+        scheduler = BatchScheduler(detector, max_batch_size=4, window_ms=5)
+        image = np.full((64, 64, 3), 255, dtype=np.uint8)
+
+        # Detections hold NumPy values, so compare them as the API serializes them
+        self.assertEqual(
+            json.dumps(scheduler.detect_bricks(image), default=default),
+            json.dumps(detector.detect_bricks(image), default=default)
+        )
+
+    def test_concurrent_requests_share_a_batch(self):
+        """Test concurrent requests are batched and each gets its own slice back"""
+        detector = make_detector()
+        scheduler = BatchScheduler(detector, max_batch_size=8, window_ms=200)
+        results = {}
+
+        def request(value):
+            image = np.full((64, 64, 3), value, dtype=np.uint8)
+            results[value] = scheduler.detect_bricks(image)
+
+        threads = [threading.Thread(target=request, args=(v,)) for v in (0, 255)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(detector.session.batch_sizes, [2])
+        self.assertEqual(results[0][0]['bbox'][2], 10)
+        self.assertEqual(results[255][0]['bbox'][2], 50)
+
+        stats = scheduler.get_stats()
+        self.assertEqual(stats['images_processed'], 2)
+        self.assertEqual(stats['batches_run'], 1)
+        self.assertEqual(stats['batch_size_distribution'], {'2': 1})
+
+    def test_post_processing_runs_on_request_thread(self):
+        """Test finish() runs on the calling thread, not the scheduler thread"""
+        detector = make_detector()
+        scheduler = BatchScheduler(detector, max_batch_size=4, window_ms=5)
+        finish = detector.finish
+        threads = []
+
+        def recording_finish(predictions, context):
+            threads.append(threading.current_thread())
+            return finish(predictions, context)
+
+        detector.finish = recording_finish
+        scheduler.detect_bricks(np.full((64, 64, 3), 255, dtype=np.uint8))
+        self.assertEqual(threads, [threading.current_thread()])
+
+    def test_fixed_batch_model_disables_batching(self):
+        """Test models with a fixed batch dimension run one image at a time"""
+        detector = make_detector()
+        detector.supports_batching = False
+        scheduler = BatchScheduler(detector, max_batch_size=8)
+        self.assertEqual(scheduler.max_batch_size, 1)
+
+if __name__ == '__main__':
+    unittest.main()
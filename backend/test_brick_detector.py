@@ -0,0 +1,162 @@
+#test_brick_detector.py
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from brick_detector import BrickDetector
+
+class FakeDetectorSession:
+    """Three well separated boxes; class scores per box given as rows"""
+
+    def __init__(self, class_scores):
+        self.class_scores = np.asarray(class_scores, dtype=np.float32)
+
+    def run(self, output_names, feed):
+        num_boxes, num_classes = self.class_scores.shape
+        outputs = np.zeros((1, 4 + num_classes, num_boxes), dtype=np.float32)
+        for i in range(num_boxes):
+            outputs[0, :4, i] = [10 + 20 * i, 32, 12, 12]
+            outputs[0, 4:, i] = self.class_scores[i]
+        return [outputs]
+
+class FakeClassifierSession:
+    """Returns logits favouring the part given by the crop's brightness"""
+
+    def __init__(self, num_parts=3):
+        self.num_parts = num_parts
+        self.batch_sizes = []
+
+    def run(self, output_names, feed):
+        crops = feed['crops']
+        self.batch_sizes.append(crops.shape[0])
+        logits = np.zeros((crops.shape[0], self.num_parts), dtype=np.float32)
+        for i in range(crops.shape[0]):
+            value = float(crops[i].mean())
+            if value > 0.1:
+                logits[i, min(int(value * self.num_parts), self.num_parts - 1)] = 10
+        return [logits]
+
+def make_detector(class_names, class_scores):
+    detector = BrickDetector.__new__(BrickDetector)
+    detector.session = FakeDetectorSession(class_scores)
+    detector.input_name = 'images'
+    detector.input_size = 64
+    detector.supports_batching = True
+    detector.conf_threshold = 0.25
+    detector.iou_threshold = 0.45
+    detector.class_names = class_names
+    detector._reset_stats()
+
+    detector.classifier = FakeClassifierSession()
+    detector.classifier_input_name = 'crops'
+    detector.classifier_size = 16
+    detector.classifier_batching = True
+    detector.part_names = ('1x1 Brick', '2x2 Plate', '2x4 Brick')
+    detector.exit_confidence = 0.8
+    detector.classifier_threshold = 0.5
+    return detector
+
+def make_image():
+    """Dark, mid-gray and white patches under the three boxes"""
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+    image[:, 24:44] = 128
+    image[:, 44:] = 255
+    return image
+
+class TestCascadeDetector(unittest.TestCase):
+
+    def test_crops_classified_in_one_batch(self):
+        """Test a generic detector's crops are labelled with one classifier call"""
+        detector = make_detector(['lego_brick'], [[0.9], [0.9], [0.9]])
+        results = detector.detect_bricks(make_image())
+
+        self.assertEqual(detector.classifier.batch_sizes, [3])
+        names = sorted(r['name'] for r in results)
+        #The dark crop gets no confident label and stays a generic brick
+        self.assertEqual(names, ['2x2 Plate', '2x4 Brick', 'lego_brick'])
+
+        stats = detector.get_stats()
+        self.assertEqual(stats['mode'], 'cascade')
+        self.assertEqual(stats['classifier']['crops_classified'], 3)
+        self.assertEqual(stats['classifier']['crops_relabelled'], 2)
+
+    def test_confident_specific_classes_skip_classifier(self):
+        """Test boxes the detector labels confidently exit before the classifier"""
+        detector = make_detector(
+            ['2x4 Brick', '2x2 Brick'],
+            [[0.95, 0.0], [0.5, 0.1], [0.0, 0.9]]
+        )
+        results = detector.detect_bricks(make_image())
+
+        self.assertEqual(detector.classifier.batch_sizes, [1])
+        self.assertEqual(detector.get_stats()['classifier']['crops_skipped'], 2)
+        by_x = sorted(results, key=lambda r: int(r['bbox'][0]))
+        self.assertEqual([r['name'] for r in by_x], ['2x4 Brick', '2x2 Plate', '2x2 Brick'])
+
+    def test_single_mode_has_no_classifier_stats(self):
+        """Test the plain detector path is unchanged without a classifier"""
+        detector = make_detector(['2x4 Brick'], [[0.9], [0.9], [0.9]])
+        detector.classifier = None
+        results = detector.detect_bricks(make_image())
+
+        self.assertEqual([r['name'] for r in results], ['2x4 Brick'] * 3)
+        self.assertEqual(detector.get_stats()['mode'], 'single')
+        self.assertNotIn('classifier', detector.get_stats())
+
+def write_classifier(path, num_parts):
+    """Tiny ONNX classifier with num_parts outputs"""
+    from onnx import TensorProto, helper, numpy_helper, save
+
+    graph = helper.make_graph(
+        [
+            helper.make_node('Flatten', ['crops'], ['flat']),
+            helper.make_node('MatMul', ['flat', 'weights'], ['logits']),
+        ],
+        'fake_classifier',
+        [helper.make_tensor_value_info('crops', TensorProto.FLOAT, ['n', 3, 16, 16])],
+        [helper.make_tensor_value_info('logits', TensorProto.FLOAT, ['n', num_parts])],
+        initializer=[numpy_helper.from_array(np.zeros((768, num_parts), dtype=np.float32), 'weights')]
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)])
+    model.ir_version = 8
+    save(model, path)
+
+class TestClassifierLoading(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            import onnx  # noqa: F401
+        except ImportError:
+            self.skipTest("onnx is not installed")
+        self.temp_dir = tempfile.mkdtemp()
+        self.classifier_path = os.path.join(self.temp_dir, 'classifier.onnx')
+        self.class_file = os.path.join(self.temp_dir, 'classifier_classes.txt')
+        write_classifier(self.classifier_path, num_parts=3)
+        self.detector = make_detector(['lego_brick'], [[0.9]])
+        self.detector.session_options = None
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_parts(self, names):
+        with open(self.class_file, 'w') as f:
+            f.write('\n'.join(names) + '\n')
+
+    def test_matching_class_file_loads(self):
+        """Test a classifier loads when its outputs match the part names"""
+        self.write_parts(['1x1 Brick', '2x2 Plate', '2x4 Brick'])
+        self.detector._load_classifier(self.classifier_path, self.class_file)
+        self.assertEqual(len(self.detector.part_names), 3)
+
+    def test_missing_or_mismatched_class_file_is_refused(self):
+        """Test cascade mode is refused instead of labelling past the part names"""
+        with self.assertRaises(FileNotFoundError):
+            self.detector._load_classifier(self.classifier_path, self.class_file)
+
+        self.write_parts(['1x1 Brick', '2x2 Plate'])
+        with self.assertRaises(ValueError):
+            self.detector._load_classifier(self.classifier_path, self.class_file)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#test_build_e2e_model.py
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from brick_detector import BrickDetector
+from build_e2e_model import build_end_to_end, onnx
+
+def fake_yolo_model(predictions, size=64):
+    """YOLOv8-shaped model returning fixed predictions (still reads its input)"""
+    from onnx import TensorProto, helper, numpy_helper
+
+    graph = helper.make_graph(
+        [
+            helper.make_node('ReduceMean', ['images'], ['mean'], keepdims=0),
+            helper.make_node('Mul', ['mean', 'zero'], ['nothing']),
+            helper.make_node('Add', ['predictions', 'nothing'], ['output0']),
+        ],
+        'fake_yolo',
+        [helper.make_tensor_value_info('images', TensorProto.FLOAT, [1, 3, size, size])],
+        [helper.make_tensor_value_info('output0', TensorProto.FLOAT, list(predictions.shape))],
+        initializer=[
+            numpy_helper.from_array(predictions.astype(np.float32), 'predictions'),
+            numpy_helper.from_array(np.array(0, dtype=np.float32), 'zero'),
+        ]
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)])
+    model.ir_version = 8
+    return model
+
+@unittest.skipIf(onnx is None, "onnx is only needed to build models")
+class TestEndToEndModel(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def make_detectors(self, predictions):
+        model = fake_yolo_model(predictions)
+        plain_path = os.path.join(self.folder, 'best.onnx')
+        e2e_path = os.path.join(self.folder, 'best_e2e.onnx')
+        onnx.save(model, plain_path)
+        onnx.save(build_end_to_end(model), e2e_path)
+        return BrickDetector(plain_path), BrickDetector(e2e_path)
+
+    def test_matches_python_pipeline(self):
+        """Test the fused graph gives the same detections as the Python pre/post-processing"""
+        predictions = np.zeros((1, 4 + 6, 5), dtype=np.float32)
+        predictions[0, :4, 0] = [20, 30, 10, 8]
+        predictions[0, 6, 0] = 0.9
+        predictions[0, :4, 1] = [21, 31, 10, 8]  #Overlaps box 0, suppressed
+        predictions[0, 6, 1] = 0.7
+        predictions[0, :4, 2] = [50, 40, 12, 12]
+        predictions[0, 9, 2] = 0.6
+        predictions[0, :4, 3] = [5, 60, 10, 10]  #Below the confidence threshold
+        predictions[0, 5, 3] = 0.1
+        plain, e2e = self.make_detectors(predictions)
+        self.assertTrue(e2e.end_to_end)
+        self.assertFalse(e2e.supports_batching)
+
+        #Wide image, so letterboxing pads top and bottom
+        image = (np.random.default_rng(0).random((48, 96, 3)) * 255).astype(np.uint8)
+        expected = plain.detect_bricks(image).to_dicts()
+        results = e2e.detect_bricks(image).to_dicts()
+
+        self.assertEqual([r['name'] for r in results], [r['name'] for r in expected])
+        self.assertEqual(len(results), 2)
+        for result, reference in zip(results, expected):
+            self.assertAlmostEqual(float(result['confidence']), float(reference['confidence']), places=5)
+            np.testing.assert_allclose(result['bbox'], reference['bbox'], atol=1)
+
+    def test_no_detections(self):
+        """Test an image without boxes above the threshold returns nothing"""
+        predictions = np.zeros((1, 4 + 6, 3), dtype=np.float32)
+        _, e2e = self.make_detectors(predictions)
+        image = np.zeros((64, 64, 3), dtype=np.uint8)
+        self.assertEqual(len(e2e.detect_bricks(image)), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#test_catalog_store.py
+import unittest
+import csv
+import os
+import shutil
+import tempfile
+from catalog_store import CatalogStore
+
+class TestCatalogStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = CatalogStore(os.path.join(self.temp_dir, 'catalog.db'), cache_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_csv(self, name, header, rows):
+        with open(os.path.join(self.temp_dir, name + '.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    def test_seed_records(self):
+        """Test the built-in records are available without a dump"""
+        self.assertEqual(self.store.get('brick', '3001')['official_name'], 'Brick 2x4')
+        self.assertEqual(self.store.get('set', '31134')['name'], 'Space Rocket')
+        self.assertIsNone(self.store.get('brick', '9999'))
+
+    def test_get_many_uses_cache_and_lru_eviction(self):
+        """Test bulk lookups skip unknown IDs and the cache keeps the newest records"""
+        found = self.store.get_many('brick', ['3001', '9999', '3003'])
+        self.assertEqual(set(found), {'3001', '3003'})
+
+        self.store.get('brick', '3001')
+        self.store.get('brick', '3023')  #Evicts 3003, the least recently used
+        stats = self.store.get_stats()
+        self.assertEqual(stats['cached'], 2)
+        self.assertEqual(stats['cache_hits'], 1)
+
+        self.store.get('brick', '3001')
+        self.assertEqual(self.store.get_stats()['cache_hits'], 2)
+
+    def test_load_dumps_merges_into_seed_records(self):
+        """Test dump fields are merged into existing records and loads are skipped when unchanged"""
+        self.write_csv('part_categories', ['id', 'name'], [['11', 'Bricks']])
+        self.write_csv('parts', ['part_num', 'name', 'part_cat_id', 'part_material'], [
+            ['3001', 'Brick 2 x 4', '11', 'Plastic'],
+            ['3941', 'Brick Round 2 x 2 x 1', '11', 'Plastic']
+        ])
+        self.write_csv('sets', ['set_num', 'name', 'year', 'theme_id', 'num_parts', 'img_url'], [
+            ['10698', 'Classic Creative Brick Box', '2015', '621', '790', '']
+        ])
+        self.store.get('brick', '3001')
+
+        self.assertEqual(self.store.load_dumps_if_changed(self.temp_dir), (2, 1))
+        self.assertIsNone(self.store.load_dumps_if_changed(self.temp_dir))
+
+        brick = self.store.get('brick', '3001')
+        self.assertEqual(brick['official_name'], 'Brick 2 x 4')
+        self.assertEqual(brick['category'], 'Bricks')
+        self.assertEqual(brick['weight_g'], 2.32)  #Kept from the seed record
+        self.assertEqual(self.store.get('brick', '3941')['material'], 'Plastic')
+        self.assertEqual(self.store.get('set', '10698')['year'], 2015)
+        self.assertNotIn('image_url', self.store.get('set', '10698'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#test_detections.py
+import unittest
+import numpy as np
+from detections import COLOR_CODES, DetectionArray
+
+class TestDetectionArray(unittest.TestCase):
+
+    def make_detections(self):
+        return DetectionArray(
+            bbox=[[0, 0, 10, 10], [5, 5, 10, 10], [20, 20, 5, 5], [30, 30, 5, 5], [40, 40, 5, 5]],
+            confidence=[0.5, 0.9, 0.7, 0.6, 0.8],
+            class_code=[1, 0, 1, 1, 0],
+            color_code=[COLOR_CODES['Red'], COLOR_CODES['Blue'], COLOR_CODES['Red'],
+                        COLOR_CODES['Blue'], COLOR_CODES['Blue']],
+            class_names=('2x2 Brick', '2x4 Brick')
+        )
+
+    def test_to_dicts_numbers_ids_per_class(self):
+        """Test raw detections get '<name>_<n>' ids like the detector reported"""
+        detections = self.make_detections()
+        ids = [d['id'] for d in detections.to_dicts()]
+        self.assertEqual(ids, ['2x4 Brick_1', '2x2 Brick_1', '2x4 Brick_2', '2x4 Brick_3', '2x2 Brick_2'])
+        self.assertEqual(detections[0]['color'], 'Red')
+        self.assertEqual(len(detections), 5)
+
+    def test_indexing_builds_single_rows(self):
+        """Test d[i] matches to_dicts()[i] without building every row"""
+        detections = self.make_detections()
+        expected = detections.to_dicts()
+        for i in range(-len(detections), len(detections)):
+            self.assertEqual(detections[i]['id'], expected[i]['id'])
+            self.assertEqual(detections[i]['color'], expected[i]['color'])
+        self.assertIsNone(detections._dicts)
+        with self.assertRaises(IndexError):
+            detections[5]
+
+        self.assertEqual([d['id'] for d in detections], [d['id'] for d in expected])
+        self.assertIs(next(iter(detections)), next(iter(detections)))  #Built once for iteration
+
+    def test_aggregate_groups_by_class_and_color(self):
+        """Test grouping sums quantities, keeps the best score and first-seen order"""
+        aggregated = self.make_detections().aggregate().to_dicts(part_id={'2x4 Brick': '3001', '2x2 Brick': '3003'}.get)
+
+        self.assertEqual(
+            [(b['id'], b['color'], b['quantity']) for b in aggregated],
+            [('3001', 'Red', 2), ('3003', 'Blue', 2), ('3001', 'Blue', 1)]
+        )
+        self.assertAlmostEqual(float(aggregated[0]['confidence']), 0.7, places=5)
+        self.assertAlmostEqual(float(aggregated[1]['confidence']), 0.9, places=5)
+        self.assertEqual(aggregated[1]['bbox'].tolist(), [5, 5, 10, 10])
+
+    def test_from_dicts_keeps_quantities(self):
+        """Test already aggregated dicts (e.g. from several images) add up"""
+        detections = DetectionArray.from_dicts([
+            {"name": "1x2 Plate", "color": "Green", "quantity": 3, "confidence": 0.4},
+            {"name": "1x2 Plate", "color": "Green", "quantity": 2},
+            {"name": "1x2 Plate", "color": "Red"}
+        ])
+        aggregated = detections.aggregate().to_dicts(part_id=lambda name: '3023')
+        self.assertEqual([b['quantity'] for b in aggregated], [5, 1])
+        self.assertAlmostEqual(float(aggregated[0]['confidence']), 0.5)
+        self.assertEqual(aggregated[1]['bbox'].tolist(), [0, 0, 100, 100])
+
+    def test_bytes_round_trip(self):
+        """Test the binary form used between processes keeps codes and names"""
+        detections = self.make_detections()
+        restored = DetectionArray.from_bytes(detections.to_bytes())
+        self.assertEqual([d['id'] for d in restored], [d['id'] for d in detections])
+        self.assertEqual([d['color'] for d in restored], [d['color'] for d in detections])
+        np.testing.assert_array_equal(restored.bbox, detections.bbox)
+        np.testing.assert_array_equal(restored.confidence, detections.confidence)
+        self.assertEqual(restored.class_names, ('2x2 Brick', '2x4 Brick'))
+
+    def test_empty(self):
+        """Test an empty scene aggregates to nothing"""
+        detections = DetectionArray(np.zeros((0, 4)), [], [], [])
+        self.assertEqual(detections.aggregate().to_dicts(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#test_http_cache.py
+import unittest
+import gzip
+import json
+from flask import Flask, jsonify, Response
+from http_cache import ResponseLayer
+
+class TestResponseLayer(unittest.TestCase):
+
+    def setUp(self):
+        app = Flask(__name__)
+        self.layer = ResponseLayer(app, cache_rules={'catalog': 'public, max-age=60'}, min_size=100)
+
+        @app.route('/catalog')
+        def catalog():
+            return jsonify({"parts": [{"id": str(i), "name": "Brick 2 x 4"} for i in range(50)]})
+
+        @app.route('/small')
+        def small():
+            return jsonify({"ok": True})
+
+        @app.route('/stream')
+        def stream():
+            return Response((line for line in [b'{"a": 1}\n'] * 200), mimetype='application/x-ndjson')
+
+        @app.route('/tagged')
+        def tagged():
+            response = jsonify({"items": ["x" * 10] * 50})
+            response.set_etag('v7')
+            return response
+
+        self.client = app.test_client()
+
+    def test_etag_cache_control_and_304(self):
+        """Test GET responses get a strong ETag, the route's cache rule and 304s"""
+        response = self.client.get('/catalog')
+        etag = response.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.client.get('/small').headers['Cache-Control'], 'no-cache')
+
+        response = self.client.get('/catalog', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(self.layer.get_stats()['not_modified'], 1)
+
+    def test_gzip_negotiation_and_threshold(self):
+        """Test large bodies are gzipped when accepted and small ones are not"""
+        plain = self.client.get('/catalog')
+        response = self.client.get('/catalog', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.data)), json.loads(plain.data))
+        self.assertLess(len(response.data), len(plain.data))
+        self.assertNotEqual(response.headers['ETag'], plain.headers['ETag'])
+
+        response = self.client.get('/small', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        response = self.client.get('/catalog', headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_streamed_and_tagged_responses(self):
+        """Test streams pass through and a view's own ETag becomes weak when compressed"""
+        response = self.client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertNotIn('ETag', response.headers)
+
+        response = self.client.get('/tagged', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['ETag'], 'W/"v7"')
+        response = self.client.get('/tagged', headers={'Accept-Encoding': 'gzip', 'If-None-Match': 'W/"v7"'})
+        self.assertEqual(response.status_code, 304)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#test_inference_broker.py
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+from admission import Deadline, DeadlineExceeded
+from detections import DetectionArray
+from inference_broker import Broker, SQLiteBroker, RemoteDetector, InferenceFailed, InferenceTimeout, run_worker
+
+class FakeDetector:
+    def detect_bricks(self, image):
+        height, width = image.shape[:2]
+        return DetectionArray([[0, 0, width, height]], [0.9], [0], [0], class_names=('2x4 Brick',))
+
+def encoded_image(width=32, height=16):
+    return cv2.imencode('.png', np.zeros((height, width, 3), dtype=np.uint8))[1].tobytes()
+
+def blank_image():
+    return np.zeros((16, 32, 3), dtype=np.uint8)
+
+class TestSQLiteBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.folder, 'broker.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_remote_detection_round_trip(self):
+        """Test a front-end gets the worker's detections for its own image"""
+        broker = SQLiteBroker(self.db_path)
+        stop = threading.Event()
+        worker = threading.Thread(target=run_worker, args=(SQLiteBroker(self.db_path), FakeDetector(), 'v1'),
+                                  kwargs={'stop': stop})
+        worker.start()
+        try:
+            remote = RemoteDetector(broker, model_version='v1', timeout=10)
+            detections = remote.detect_bricks(np.zeros((20, 40, 3), dtype=np.uint8))
+        finally:
+            stop.set()
+            worker.join()
+
+        self.assertEqual(detections[0]['bbox'].tolist(), [0, 0, 40, 20])
+        self.assertEqual(detections[0]['name'], '2x4 Brick')
+        stats = broker.get_stats()
+        self.assertEqual((stats['completed'], stats['queued']), (1, 0))
+
+    def test_only_matching_version_is_leased(self):
+        """Test workers only take jobs for the model version they serve"""
+        broker = SQLiteBroker(self.db_path)
+        broker.submit(encoded_image(), model_version='v2')
+        self.assertIsNone(broker.lease('w1', 'v1', timeout=0))
+        self.assertEqual(broker.lease('w2', 'v2', timeout=0)[2], 'v2')
+
+    def test_expired_lease_is_retried(self):
+        """Test a job held by a dead worker goes to another one, and the late result is ignored"""
+        broker = SQLiteBroker(self.db_path, lease_seconds=0.05)
+        job_id = broker.submit(encoded_image())
+        self.assertEqual(broker.lease('dead', timeout=0)[0], job_id)
+        self.assertIsNone(broker.lease('w2', timeout=0))  #Still leased
+
+        time.sleep(0.1)
+        self.assertEqual(broker.lease('w2', timeout=0)[0], job_id)
+        broker.complete(job_id, 'dead', FakeDetector().detect_bricks(np.zeros((1, 1, 3))))
+        broker.complete(job_id, 'w2', FakeDetector().detect_bricks(np.zeros((5, 5, 3))))
+        self.assertEqual(broker.wait(job_id, timeout=1)[0]['bbox'].tolist(), [0, 0, 5, 5])
+
+    def test_fails_after_max_attempts(self):
+        """Test a job that keeps killing workers fails instead of looping forever"""
+        broker = SQLiteBroker(self.db_path, lease_seconds=0.01, max_attempts=2)
+        job_id = broker.submit(encoded_image())
+        for _ in range(2):
+            self.assertIsNotNone(broker.lease('w', timeout=0))
+            time.sleep(0.02)
+        self.assertIsNone(broker.lease('w', timeout=0))
+
+        with self.assertRaises(InferenceFailed):
+            broker.wait(job_id, timeout=1)
+
+    def test_incomplete_broker_cannot_be_created(self):
+        """Test a broker missing interface methods fails when instantiated, not on first call"""
+        class SubmitOnlyBroker(Broker):
+            def submit(self, image_bytes, model_version=None):
+                return 'job'
+
+        with self.assertRaises(TypeError):
+            SubmitOnlyBroker()
+
+    def test_wait_times_out_without_workers(self):
+        """Test a front-end gives up when no worker is running"""
+        broker = SQLiteBroker(self.db_path)
+        job_id = broker.submit(encoded_image())
+        with self.assertRaises(InferenceTimeout):
+            broker.wait(job_id, timeout=0.05)
+        self.assertEqual(broker.get_stats()['queued'], 0)
+
+    def test_remote_wait_is_bounded_by_request_deadline(self):
+        """Test a remote detection gives up when the request deadline passes, not after the timeout"""
+        broker = SQLiteBroker(self.db_path)
+        remote = RemoteDetector(broker, timeout=60)
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            remote.detect_bricks(blank_image(), deadline=Deadline(0.05))
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(broker.get_stats()['queued'], 0)
+
+        with self.assertRaises(DeadlineExceeded):
+            remote.detect_bricks(blank_image(), deadline=Deadline(0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+#test_inventory_store.py
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from inventory_store import InventoryStore
+
+class TestInventoryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = InventoryStore(os.path.join(self.temp_dir, 'inventory.db'))
+        self.store.add_bricks([
+            {"id": "3001", "name": "2x4 Brick", "color": "Red", "quantity": 15},
+            {"id": "3003", "name": "2x2 Brick", "color": "Blue", "quantity": 12},
+            {"id": "3023", "name": "1x2 Plate", "color": "Red", "quantity": 3}
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_add_merges_quantities(self):
+        """Test adding an existing part/color increases its quantity"""
+        self.store.add_bricks([{"id": "3001", "name": "2x4 Brick", "color": "red", "quantity": 5}])
+        rows = self.store.list_bricks(color='Red')
+        self.assertEqual([(r['id'], r['quantity']) for r in rows], [('3001', 20), ('3023', 3)])
+
+    def test_filters_and_limit(self):
+        """Test color, min_quantity and limit filters"""
+        self.assertEqual([r['id'] for r in self.store.list_bricks(min_quantity=10)], ['3001', '3003'])
+        self.assertEqual(len(self.store.list_bricks(limit=1)), 1)
+        self.assertEqual(
+            self.store.summary(color='RED'),
+            {"total_bricks": 18, "unique_colors": 1, "unique_types": 2}
+        )
+
+    def test_filters_use_indexes(self):
+        """Test filtered queries are answered from an index instead of a table scan"""
+        with self.store._connection() as conn:
+            plan = ' '.join(row[3] for row in conn.execute(
+                'EXPLAIN QUERY PLAN SELECT * FROM inventory WHERE color = ? ORDER BY part_id, color LIMIT 50',
+                ('Red',)
+            ))
+        self.assertIn('idx_inventory_color', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_update_actions_and_removal(self):
+        """Test set/add/remove updates and that empty rows are removed"""
+        results = self.store.update_quantities([
+            {"id": "3001", "quantity": 5, "action": "add"},
+            {"id": "3003", "quantity": 20, "action": "remove"}
+        ])
+        self.assertEqual([(r['old_quantity'], r['new_quantity']) for r in results], [(15, 20), (12, 0)])
+        self.assertEqual([r['id'] for r in self.store.list_bricks()], ['3001', '3023'])
+
+    def test_update_rolls_back_on_error(self):
+        """Test a failing update leaves the whole batch unapplied"""
+        with self.assertRaises(ValueError):
+            self.store.update_quantities([
+                {"id": "3001", "quantity": 1},
+                {"id": "3023", "quantity": 1, "action": "explode"}
+            ])
+        self.assertEqual(self.store.list_bricks(color='Red')[0]['quantity'], 15)
+
+    def test_summaries_follow_writes(self):
+        """Test global, color and part aggregates are maintained on every write"""
+        self.assertEqual(self.store.summary(), {"total_bricks": 30, "unique_colors": 2, "unique_types": 3})
+
+        self.store.add_bricks([{"id": "3001", "name": "2x4 Brick", "color": "Green", "quantity": 4}])
+        self.store.update_quantities([{"id": "3003", "quantity": 0}])
+        self.store.update_quantities([{"id": "3023", "quantity": 10, "action": "set"}])
+
+        self.assertEqual(self.store.summary(), {"total_bricks": 29, "unique_colors": 2, "unique_types": 2})
+        self.assertEqual(self.store.summary(color='blue'), {"total_bricks": 0, "unique_colors": 0, "unique_types": 0})
+        self.assertEqual(self.store.part_summary('3001'), {"id": "3001", "total_bricks": 19, "unique_colors": 2})
+        self.assertEqual(self.store.color_summary('Red')['total_bricks'], 25)
+
+    def test_summaries_consistent_under_concurrent_writers(self):
+        """Test concurrent writers leave aggregates equal to a full rebuild"""
+        def writer(offset):
+            for i in range(20):
+                self.store.add_bricks([{"id": str(4000 + (offset + i) % 7), "name": "Part", "color": "Tan", "quantity": 1}])
+                self.store.update_quantities([{"id": "3001", "color": "Red", "quantity": 1, "action": "add"}])
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        maintained = self.store.summary()
+        self.assertEqual(maintained['total_bricks'], 30 + 80 + 80)
+        self.store.rebuild_summaries()
+        self.assertEqual(self.store.summary(), maintained)
+
+    def test_keyset_pages_cover_inventory_once(self):
+        """Test walking pages with the last key returns every row exactly once"""
+        self.store.add_bricks([
+            {"id": str(5000 + i), "name": "Part", "color": color, "quantity": 1}
+            for i in range(10) for color in ('Red', 'Blue')
+        ])
+        for color, expected in ((None, 23), ('Red', 12)):
+            seen = []
+            after = None
+            while True:
+                rows, has_more, _ = self.store.page(color=color, limit=4, after=after)
+                seen.extend((r['id'], r['color']) for r in rows)
+                if not has_more:
+                    break
+                after = (rows[-1]['id'], rows[-1]['color'])
+            self.assertEqual(len(seen), expected)
+            self.assertEqual(seen, sorted(set(seen)))
+
+    def test_deep_pages_seek_the_index(self):
+        """Test keyset pages search the index rather than scanning or sorting"""
+        queries = [
+            'SELECT * FROM inventory WHERE (part_id, color) > (?, ?) ORDER BY part_id, color LIMIT 51',
+            'SELECT * FROM inventory WHERE color = ? AND part_id > ? ORDER BY part_id, color LIMIT 51'
+        ]
+        with self.store._connection() as conn:
+            for sql in queries:
+                plan = ' '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, ('3001', 'Red')))
+                self.assertIn('SEARCH', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_version_changes_on_write(self):
+        """Test every write bumps the inventory version"""
+        version = self.store.version()
+        self.store.update_quantities([{"id": "3001", "quantity": 1, "action": "add"}])
+        self.assertGreater(self.store.version(), version)
+
+    def test_delta_sync(self):
+        """Test sync returns only changes since the token, including deletions"""
+        first = self.store.changes_since(None)
+        self.assertTrue(first['full_resync'])
+
+        self.store.add_bricks([{"id": "3001", "name": "2x4 Brick", "color": "Red", "quantity": 1}])
+        self.store.delete_parts(['3003'])
+        delta = self.store.changes_since(first['sync_token'])
+
+        self.assertFalse(delta['full_resync'])
+        self.assertEqual([(r['id'], r['quantity']) for r in delta['upserted']], [('3001', 16)])
+        self.assertEqual(delta['deleted'], [{"id": "3003", "color": "Blue"}])
+
+        unchanged = self.store.changes_since(delta['sync_token'])
+        self.assertEqual((unchanged['upserted'], unchanged['deleted']), ([], []))
+        self.assertTrue(self.store.changes_since('other-db:1')['full_resync'])
+
+    def test_compaction_bounds_log_and_expires_tokens(self):
+        """Test compaction keeps one entry per key and expired tokens force a resync"""
+        token = self.store.changes_since(None)['sync_token']
+        for _ in range(5):
+            self.store.update_quantities([{"id": "3001", "quantity": 1, "action": "add"}])
+
+        self.store.compact_changes(retention_seconds=3600)
+        with self.store._connection() as conn:
+            entries = conn.execute('SELECT COUNT(*) FROM inventory_changes').fetchone()[0]
+        self.assertEqual(entries, 3)
+        self.assertEqual(self.store.changes_since(token)['upserted'][0]['quantity'], 20)
+
+        self.store.compact_changes(retention_seconds=-1)
+        self.assertTrue(self.store.changes_since(token)['full_resync'])
+
+    def test_merge_detections_is_idempotent(self):
+        """Test merging the same upload twice only counts the bricks once"""
+        bricks = [
+            {"id": "3001", "name": "2x4 Brick", "color": "Red", "quantity": 3},
+            {"id": "3622", "name": "1x3 Brick", "color": "Tan", "quantity": 2}
+        ]
+        first = self.store.merge_detections('upload-1', bricks)
+        retry = self.store.merge_detections('upload-1', bricks)
+
+        self.assertTrue(first['applied'])
+        self.assertFalse(retry['applied'])
+        self.assertEqual(retry['bricks_merged'], 5)
+        self.assertEqual(self.store.part_summary('3001')['total_bricks'], 18)
+        self.assertEqual(self.store.summary()['total_bricks'], 35)
+
+if __name__ == '__main__':
+    unittest.main()
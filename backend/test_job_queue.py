@@ -0,0 +1,131 @@
+#test_job_queue.py
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from job_queue import JobQueue
+from upload_store import UploadStore
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'jobs.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_job_completes_with_result(self):
+        """Test a submitted job runs in the background and stores its result"""
+        queue = JobQueue(self.db_path, lambda payload: {"double": payload['value'] * 2})
+        job_id = queue.submit({"value": 21})
+
+        job = queue.wait(job_id, timeout=5)
+        self.assertEqual(job['status'], 'completed')
+        self.assertEqual(job['result'], {"double": 42})
+
+    def test_failed_job_records_error(self):
+        """Test handler exceptions mark the job as failed"""
+        def handler(payload):
+            raise RuntimeError("model exploded")
+
+        queue = JobQueue(self.db_path, handler)
+        job = queue.wait(queue.submit({}), timeout=5)
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('model exploded', job['error'])
+
+    def test_jobs_run_in_priority_order(self):
+        """Test higher priority jobs are claimed first"""
+        gate = threading.Event()
+        order = []
+
+        def handler(payload):
+            if payload['name'] == 'blocker':
+                gate.wait(5)
+            order.append(payload['name'])
+            return {}
+
+        queue = JobQueue(self.db_path, handler, num_workers=1)
+        blocker = queue.submit({"name": "blocker"})
+        while queue.get(blocker)['status'] == 'queued':
+            threading.Event().wait(0.01)
+
+        low = queue.submit({"name": "low"}, priority=0)
+        high = queue.submit({"name": "high"}, priority=5)
+        self.assertEqual(queue.get(low)['queue_position'], 1)
+        gate.set()
+
+        queue.wait(low, timeout=5)
+        self.assertEqual(order, ['blocker', 'high', 'low'])
+        self.assertEqual(queue.get(high)['status'], 'completed')
+
+    def test_stale_attempt_cannot_overwrite_retry(self):
+        """Test a run whose lease expired does not overwrite the retried job's result"""
+        runs = []
+        job_ids = []
+
+        def handler(payload):
+            runs.append(len(runs) + 1)
+            run = runs[-1]
+            if run == 1:
+                #Outlive the lease until the retry has finished
+                while not job_ids or queue.get(job_ids[0])['status'] != 'completed':
+                    threading.Event().wait(0.01)
+            return {"run": run}
+
+        queue = JobQueue(self.db_path, handler, num_workers=2, lease_seconds=0.1)
+        job_id = queue.submit({})
+        job_ids.append(job_id)
+
+        for _ in range(500):
+            if queue.get_stats()['superseded'] == 1:
+                break
+            threading.Event().wait(0.01)
+
+        job = queue.get(job_id)
+        self.assertEqual(job['result'], {"run": 2})
+        self.assertEqual(job['attempts'], 2)
+        self.assertEqual(queue.get_stats()['superseded'], 1)
+
+    def test_retried_job_releases_its_upload_once(self):
+        """Test a lease-expired attempt and its retry drop the job's upload reference only once"""
+        store = UploadStore(os.path.join(self.temp_dir, 'uploads'))
+        digest = store.put(b'image bytes', 'jpg')
+        store.acquire(digest)  #Another holder, e.g. a queued duplicate
+        store.acquire(digest)  #The job's own reference
+        job_ids = []
+        runs = []
+
+        def handler(payload):
+            runs.append(len(runs) + 1)
+            if runs[-1] == 1:
+                #Outlive the lease until the retry has finished
+                while not job_ids or queue.get(job_ids[0])['status'] != 'completed':
+                    threading.Event().wait(0.01)
+            return {}
+
+        queue = JobQueue(self.db_path, handler, num_workers=2, lease_seconds=0.1,
+                         on_finish=lambda payload: store.release(payload['upload_id']))
+        job_ids.append(queue.submit({"upload_id": digest}))
+
+        for _ in range(500):
+            if queue.get_stats()['superseded'] == 1:
+                break
+            threading.Event().wait(0.01)
+
+        self.assertEqual(len(runs), 2)
+        refcount = store._connect().execute('SELECT refcount FROM blobs WHERE digest = ?', (digest,)).fetchone()[0]
+        self.assertEqual(refcount, 1)
+
+    def test_cleanup_removes_expired_jobs(self):
+        """Test finished jobs are deleted once their TTL passes"""
+        queue = JobQueue(self.db_path, lambda payload: {}, ttl_seconds=0)
+        job_id = queue.submit({})
+        queue.wait(job_id, timeout=5)
+
+        self.assertEqual(queue.cleanup(), 1)
+        self.assertIsNone(queue.get(job_id))
+
+if __name__ == '__main__':
+    unittest.main()
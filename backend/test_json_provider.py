@@ -0,0 +1,48 @@
+#test_json_provider.py
+import unittest
+import json
+import numpy as np
+from flask import Flask, jsonify
+import json_provider
+from json_provider import FastJSONProvider
+
+class TestFastJSONProvider(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.json = FastJSONProvider(self.app)
+        self.payload = {
+            "confidence": np.float32(0.5),
+            "count": np.int64(3),
+            "bbox": np.array([1, 2, 3, 4], dtype=np.int32),
+            "scores": np.array([0.25, 0.75]),
+            "by_id": {3001: "2x4 Brick"}
+        }
+        self.expected = {
+            "confidence": 0.5, "count": 3, "bbox": [1, 2, 3, 4],
+            "scores": [0.25, 0.75], "by_id": {"3001": "2x4 Brick"}
+        }
+
+    def test_numpy_values_serialize(self):
+        """Test NumPy scalars and arrays are serialized without manual conversion"""
+        with self.app.app_context():
+            response = jsonify(self.payload)
+        self.assertEqual(json.loads(response.data), self.expected)
+        self.assertEqual(json.loads(self.app.json.dumps(self.payload)), self.expected)
+        self.assertEqual(self.app.json.loads('{"a": [1, 2]}'), {"a": [1, 2]})
+
+    def test_stdlib_fallback(self):
+        """Test the provider works the same without orjson installed"""
+        original = json_provider.orjson
+        json_provider.orjson = None
+        try:
+            app = Flask(__name__)
+            app.json = FastJSONProvider(app)
+            with app.app_context():
+                response = jsonify(self.payload)
+            self.assertEqual(json.loads(response.data), self.expected)
+        finally:
+            json_provider.orjson = original
+
+if __name__ == '__main__':
+    unittest.main()
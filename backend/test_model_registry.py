@@ -0,0 +1,151 @@
+#test_model_registry.py
+import unittest
+import gc
+import os
+import shutil
+import tempfile
+import weakref
+import numpy as np
+from batch_scheduler import BatchScheduler
+from model_registry import ModelRegistry, version_spec
+from test_batch_scheduler import make_detector
+
+class FakeRunner:
+    def __init__(self, spec):
+        self.version = spec['version']
+        self.closed = False
+
+    def detect_bricks(self, image_path):
+        return [self.version]
+
+    def close(self):
+        self.closed = True
+
+class TestModelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.loaded = []
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def add_version(self, version, size_mb=1):
+        os.makedirs(os.path.join(self.folder, version))
+        with open(os.path.join(self.folder, version, 'model.onnx'), 'wb') as f:
+            f.truncate(size_mb * 1024 * 1024)
+
+    def make_registry(self, memory_budget_mb=100):
+        def loader(spec):
+            runner = FakeRunner(spec)
+            self.loaded.append(runner)
+            return runner
+        return ModelRegistry(self.folder, loader, memory_budget_mb=memory_budget_mb)
+
+    def test_versions_and_pinning(self):
+        """Test versions are discovered in natural order and can be pinned per request"""
+        for version in ('v2', 'v10', 'v9'):
+            self.add_version(version)
+        registry = self.make_registry()
+
+        self.assertEqual(registry.refresh(), ['v2', 'v9', 'v10'])
+        registry.activate('v10')
+        with registry.acquire() as model:
+            self.assertEqual(model.runner.detect_bricks(None), ['v10'])
+        with registry.acquire('v2') as model:
+            self.assertEqual(model.runner.detect_bricks(None), ['v2'])
+        self.assertEqual(len(self.loaded), 2)  #v9 was never used
+
+        with self.assertRaises(ValueError):
+            registry.resolve('v3')
+
+    def test_version_spec_names_version_after_folder(self):
+        """Test a version folder is described the same way refresh() registers it"""
+        self.add_version('v3')
+        spec = version_spec(os.path.join(self.folder, 'v3') + os.sep)
+        self.assertEqual(spec['version'], 'v3')
+        self.assertEqual(spec['model_path'], os.path.join(self.folder, 'v3', 'model.onnx'))
+        self.assertIsNone(version_spec(self.folder))
+
+    def test_hot_swap_keeps_in_flight_model(self):
+        """Test requests holding the old model finish on it after a swap"""
+        self.add_version('v1', size_mb=2)
+        self.add_version('v2', size_mb=2)
+        registry = self.make_registry(memory_budget_mb=3)
+        registry.refresh()
+        registry.activate('v1')
+
+        with registry.acquire() as in_flight:
+            self.assertEqual(registry.activate('v2'), 'v1')
+            with registry.acquire() as new_request:
+                self.assertEqual(new_request.version, 'v2')
+            #Over budget, but still in use
+            self.assertFalse(in_flight.runner.closed)
+            self.assertEqual(in_flight.runner.detect_bricks(None), ['v1'])
+
+        #Released: the idle old version is unloaded to meet the budget
+        self.assertTrue(in_flight.runner.closed)
+        stats = registry.get_stats()
+        self.assertEqual(stats['active'], 'v2')
+        self.assertEqual([v['loaded'] for v in stats['versions']], [False, True])
+
+    def test_lru_eviction_under_budget(self):
+        """Test the least recently used idle version is evicted, never the active one"""
+        for version in ('v1', 'v2', 'v3', 'v4'):
+            self.add_version(version)
+        registry = self.make_registry(memory_budget_mb=3)
+        registry.refresh()
+        registry.activate('v1')
+
+        for version in ('v2', 'v3', 'v2', 'v4'):
+            with registry.acquire(version):
+                pass
+
+        stats = registry.get_stats()
+        loaded = [v['version'] for v in stats['versions'] if v['loaded']]
+        self.assertEqual(loaded, ['v1', 'v2', 'v4'])
+        self.assertEqual(stats['evictions'], 1)
+        self.assertLessEqual(stats['memory_used_mb'], 3)
+
+    def test_runner_can_report_its_memory(self):
+        """Test a runner holding no weights (e.g. remote) is not charged for the model file"""
+        for version in ('v1', 'v2'):
+            self.add_version(version, size_mb=2)
+
+        def remote_loader(spec):
+            runner = FakeRunner(spec)
+            runner.memory_bytes = 0
+            return runner
+        registry = ModelRegistry(self.folder, remote_loader, memory_budget_mb=3)
+        registry.refresh()
+        registry.activate('v1')
+        with registry.acquire('v2'):
+            pass
+
+        stats = registry.get_stats()
+        self.assertEqual(stats['memory_used_mb'], 0)
+        self.assertEqual(stats['evictions'], 0)
+
+    def test_evicted_batched_model_is_freed(self):
+        """Test an evicted version's scheduler and detector are garbage collected"""
+        self.add_version('v1', size_mb=2)
+        self.add_version('v2', size_mb=2)
+        registry = ModelRegistry(self.folder, lambda spec: BatchScheduler(make_detector(), window_ms=1),
+                                 memory_budget_mb=3)
+        registry.refresh()
+        registry.activate('v1')
+
+        with registry.acquire() as model:
+            model.runner.detect_bricks(np.full((64, 64, 3), 255, dtype=np.uint8))
+            runner, worker = weakref.ref(model.runner), model.runner._worker
+            detector = weakref.ref(model.runner.detector)
+        del model
+        registry.activate('v2')  #Over budget: the idle v1 is evicted
+
+        worker.join(timeout=5)
+        gc.collect()
+        self.assertIsNone(runner())
+        self.assertIsNone(detector())
+
+if __name__ == '__main__':
+    unittest.main()
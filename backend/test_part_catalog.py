@@ -0,0 +1,54 @@
+#test_part_catalog.py
+import unittest
+import csv
+import os
+import shutil
+import tempfile
+from part_catalog import PartCatalog, normalize
+
+class TestPartCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.temp_dir, 'parts.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['part_num', 'name', 'part_cat_id', 'part_material'])
+            writer.writerow(['3001', 'Brick 2 x 4', '11', 'Plastic'])
+            writer.writerow(['3068b', 'Tile 2 x 2 with Groove', '19', 'Plastic'])
+            writer.writerow(['3941', 'Brick Round 2 x 2 x 1', '20', 'Plastic'])
+        with open(os.path.join(self.temp_dir, 'part_aliases.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['alias', 'part_num'])
+            writer.writerow(['smooth 2x2', '3068b'])
+        self.catalog = PartCatalog(self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_normalize_ignores_case_spacing_and_order(self):
+        """Test equivalent spellings of a name normalize to the same key"""
+        self.assertEqual(normalize('2x4 Brick'), normalize('Brick 2 x 4'))
+        self.assertEqual(normalize('brick_2X4'), normalize('2x4 Bricks'))
+
+    def test_exact_normalized_and_alias_lookups(self):
+        """Test class names, dump names, aliases and part numbers all resolve"""
+        self.assertEqual(self.catalog.lookup('2x4 Brick'), '3001')
+        self.assertEqual(self.catalog.lookup('tile 2x2 with groove'), '3068b')
+        self.assertEqual(self.catalog.lookup('Smooth 2X2'), '3068b')
+        self.assertEqual(self.catalog.lookup('3941'), '3941')
+        self.assertEqual(self.catalog.lookup('lego_brick'), '3001')
+        self.assertEqual(self.catalog.name('3941'), 'Brick Round 2 x 2 x 1')
+
+    def test_fuzzy_match_is_memoized(self):
+        """Test misspelled names fall back to trigrams once and are then cached"""
+        self.assertEqual(self.catalog.lookup('Brick Rnd 2x2x1'), '3941')
+        self.assertEqual(self.catalog.lookup('Brick Rnd 2x2x1'), '3941')
+        self.assertEqual(self.catalog.get_stats()['fuzzy_lookups'], 1)
+
+    def test_unmatched_name(self):
+        """Test names unlike any part return the unknown part number"""
+        self.assertEqual(self.catalog.lookup('minifig torso'), '0000')
+        self.assertEqual(self.catalog.get_stats()['unmatched'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+#test_prefork_server.py
+import unittest
+import os
+import types
+import urllib.request
+from flask import Flask
+from prefork_server import PreforkServer, read_memory
+
+def make_app_module():
+    app = Flask(__name__)
+
+    @app.route('/pid')
+    def pid():
+        return str(os.getpid())
+
+    return types.SimpleNamespace(app=app)
+
+class TestPreforkServer(unittest.TestCase):
+
+    def test_read_memory(self):
+        """Test USS never exceeds PSS or RSS"""
+        memory = read_memory()
+        if memory['rss'] == 0:
+            self.skipTest("/proc/self/smaps_rollup is not available")
+        self.assertLessEqual(memory['uss'], memory['pss'])
+        self.assertLessEqual(memory['pss'], memory['rss'])
+
+    def test_workers_share_socket_and_stop(self):
+        """Test forked workers answer on the shared socket and all exit on stop"""
+        server = PreforkServer(make_app_module(), host='127.0.0.1', port=0, workers=2, graceful_timeout=5)
+        server.start()
+        try:
+            pids = set(server.workers)
+            self.assertEqual(len(pids), 2)
+            for _ in range(4):
+                with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/pid', timeout=5) as response:
+                    self.assertIn(int(response.read()), pids)
+        finally:
+            server.stop()
+
+        self.assertEqual(server.workers, {})
+        for pid in pids:
+            with self.assertRaises(ChildProcessError):
+                os.waitpid(pid, os.WNOHANG)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#test_recommendation_engine.py
+import unittest
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+from recommendation_engine import RecommendationEngine
+
+def write_csv(folder, name, header, rows, compress=False):
+    path = os.path.join(folder, name + ('.csv.gz' if compress else '.csv'))
+    opener = gzip.open if compress else open
+    with opener(path, 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+class TestRecommendationEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        write_csv(self.temp_dir, 'colors', ['id', 'name', 'rgb', 'is_trans'], [
+            ['4', 'Red', 'C91A09', 'f'],
+            ['1', 'Blue', '0055BF', 'f']
+        ])
+        write_csv(self.temp_dir, 'sets', ['set_num', 'name', 'year', 'theme_id', 'num_parts', 'img_url'], [
+            ['100-1', 'Red Wall', '2020', '1', '10', ''],
+            ['200-1', 'Blue Wall', '2021', '1', '4', ''],
+            ['300-1', 'Mixed Tower', '2022', '1', '6', '']
+        ])
+        # 100-1 has an outdated first inventory version
+        write_csv(self.temp_dir, 'inventories', ['id', 'version', 'set_num'], [
+            ['1', '1', '100-1'], ['2', '2', '100-1'], ['3', '1', '200-1'], ['4', '1', '300-1']
+        ], compress=True)
+        write_csv(self.temp_dir, 'inventory_parts',
+                  ['inventory_id', 'part_num', 'color_id', 'quantity', 'is_spare', 'img_url'], [
+            ['1', '3001', '4', '99', 'f', ''],
+            ['2', '3001', '4', '10', 'f', ''],
+            ['2', '3001', '4', '1', 't', ''],
+            ['3', '3001', '1', '4', 'f', ''],
+            ['4', '3001', '4', '3', 'f', ''],
+            ['4', '3003', '1', '3', 'f', '']
+        ])
+        self.engine = RecommendationEngine(self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_completion_counts_quantities_and_colors(self):
+        """Test owned quantities only count up to what each set needs, per color"""
+        bricks = [{"id": "3001", "color": "Red", "quantity": 5}]
+        results = {r['set_id']: r for r in self.engine.recommend(bricks, limit=10)}
+
+        self.assertEqual(set(results), {'100-1', '300-1'})
+        self.assertEqual(results['100-1']['completion_percentage'], 50)
+        self.assertEqual(results['100-1']['missing_pieces'], 5)
+        self.assertEqual(results['300-1']['completion_percentage'], 50)
+        self.assertEqual(results['300-1']['missing_pieces'], 3)
+
+    def test_top_k_ordering_and_threshold(self):
+        """Test results are ordered by completion and filtered by min_completion"""
+        bricks = [
+            {"id": "3001", "color": "red", "quantity": 3},
+            {"id": "3003", "color": "Blue", "quantity": 3},
+            {"id": "3001", "color": "Blue", "quantity": 1}
+        ]
+        results = self.engine.recommend(bricks, limit=2)
+        self.assertEqual([r['set_id'] for r in results], ['300-1', '100-1'])
+        self.assertEqual(results[0]['completion_percentage'], 100)
+
+        results = self.engine.recommend(bricks, min_completion=40)
+        self.assertEqual([r['set_id'] for r in results], ['300-1'])
+
+    def test_any_color_entry_does_not_reuse_colored_bricks(self):
+        """Test bricks counted for a colored entry are not counted again for the part's any-color entry"""
+        with open(os.path.join(self.temp_dir, 'inventory_parts.csv'), 'a', newline='') as f:
+            csv.writer(f).writerow(['4', '3001', '9999', '2', 'f', ''])  #Unknown color: any color
+        engine = RecommendationEngine(self.temp_dir)
+
+        results = {r['set_id']: r for r in engine.recommend([{"id": "3001", "color": "Red", "quantity": 4}], limit=10)}
+        #3 red for the colored entry, only the 1 left over for the any-color entry
+        self.assertEqual(results['300-1']['missing_pieces'], 4)
+        self.assertEqual(results['300-1']['completion_percentage'], 50)
+
+    def test_unknown_bricks_score_nothing(self):
+        """Test bricks missing from the catalog give no recommendations"""
+        self.assertEqual(self.engine.recommend([{"id": "9999", "color": "Red", "quantity": 4}]), [])
+        self.assertEqual(self.engine.recommend([]), [])
+
+    def test_builtin_catalog_matches_any_color(self):
+        """Test the built-in catalog is used without a dump and ignores colors"""
+        engine = RecommendationEngine(os.path.join(self.temp_dir, 'missing'))
+        bricks = [{"id": bid, "color": "Green", "quantity": 1} for bid in ['3001', '3003', '3023']]
+        results = engine.recommend(bricks, min_completion=40)
+
+        self.assertEqual([r['set_id'] for r in results], ['10698', '10302'])
+        self.assertEqual(results[0]['completion_percentage'], 75)
+        self.assertEqual(engine.get_stats()['source'], 'builtin')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#test_result_renderer.py
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+import cv2
+import numpy as np
+from detections import COLOR_CODES, DetectionArray
+from result_renderer import RenderCache, ResultRenderer
+
+class TestResultRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.renderer = ResultRenderer(os.path.join(self.folder, 'analyses.db'), cache_mb=1)
+        self.image_path = os.path.join(self.folder, 'scan.png')
+        cv2.imwrite(self.image_path, np.zeros((400, 800, 3), dtype=np.uint8))
+        detections = DetectionArray(
+            [[100, 100, 200, 100], [500, 200, 100, 100]], [0.9, 0.8],
+            [0, 0], [COLOR_CODES['Red'], COLOR_CODES['Blue']]
+        )
+        self.renderer.save('ana_1', self.image_path, detections)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def decode(self, data):
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def test_render_scales_image_and_boxes(self):
+        """Test boxes are drawn at the preview scale in their brick color"""
+        data, mimetype = self.renderer.render('ana_1', max_size=400, quality=95)
+        self.assertEqual(mimetype, 'image/jpeg')
+        image = self.decode(data)
+        self.assertEqual(image.shape[:2], (200, 400))
+
+        red = image[50, 75]  #Top edge of the first box, halved
+        self.assertGreater(int(red[2]), 150)
+        self.assertLess(int(red[0]), 100)
+        blue = image[100, 250]  #Left edge of the second box
+        self.assertGreater(int(blue[0]), 150)
+        self.assertLess(image[150, 75].max(), 30)  #Inside stays untouched
+
+    def test_exif_rotated_photo_keeps_its_orientation(self):
+        """Test a phone photo stored sideways (EXIF orientation 6) renders upright and undistorted"""
+        from PIL import Image
+        path = os.path.join(self.folder, 'phone.jpg')
+        exif = Image.Exif()
+        exif[0x0112] = 6  #Rotate 90 degrees clockwise on display
+        Image.new('RGB', (600, 300)).save(path, exif=exif)  #Stored 600x300, shown 300x600
+        self.renderer.save('ana_phone', path, DetectionArray([[10, 10, 50, 50]], [0.9], [0], [0]))
+
+        image = self.decode(self.renderer.render('ana_phone', max_size=200)[0])
+        self.assertEqual(image.shape[:2], (200, 100))
+
+    def test_variants_are_cached(self):
+        """Test each size/format/quality is rendered once"""
+        first, _ = self.renderer.render('ana_1', max_size=200)
+        again, _ = self.renderer.render('ana_1', max_size=200)
+        webp, mimetype = self.renderer.render('ana_1', max_size=200, image_format='webp')
+
+        self.assertIs(first, again)
+        self.assertEqual(mimetype, 'image/webp')
+        self.assertEqual(self.decode(webp).shape[:2], (100, 200))
+        stats = self.renderer.get_stats()
+        self.assertEqual(stats['renders'], 2)
+        self.assertEqual(stats['cache']['hits'], 1)
+
+    def test_saving_again_drops_old_renders(self):
+        """Test re-analysing replaces the cached previews"""
+        self.renderer.render('ana_1', max_size=200)
+        self.renderer.save('ana_1', self.image_path, DetectionArray(np.zeros((0, 4)), [], [], []))
+        image = self.decode(self.renderer.render('ana_1', max_size=200)[0])
+        self.assertLess(image.max(), 30)
+
+    def test_saved_analyses_hold_their_photo(self):
+        """Test each stored analysis keeps one reference to its photo until replaced or expired"""
+        held = Counter()
+        renderer = ResultRenderer(
+            os.path.join(self.folder, 'held.db'), ttl_seconds=0,
+            on_save=lambda path: held.update([path]), on_delete=lambda path: held.subtract([path])
+        )
+        empty = DetectionArray(np.zeros((0, 4)), [], [], [])
+        renderer.save('ana_2', 'first.png', empty)
+        renderer.save('ana_2', 'second.png', empty)  #e.g. a retried job
+        self.assertEqual(+held, Counter({'second.png': 1}))
+
+        time.sleep(0.01)
+        renderer._last_cleanup = 0  #Due for cleanup; ana_2 has expired
+        renderer.save('ana_3', 'third.png', empty)
+        self.assertEqual(+held, Counter({'third.png': 1}))
+
+    def test_unknown_analysis(self):
+        """Test missing analyses and photos raise FileNotFoundError"""
+        with self.assertRaises(FileNotFoundError):
+            self.renderer.render('ana_missing')
+        os.remove(self.image_path)
+        with self.assertRaises(FileNotFoundError):
+            self.renderer.render('ana_1')
+
+class TestRenderCache(unittest.TestCase):
+
+    def test_lru_eviction_by_bytes(self):
+        """Test the least recently used renders are evicted to stay within the budget"""
+        cache = RenderCache(max_bytes=10)
+        cache.put(('a',), b'1234')
+        cache.put(('b',), b'1234')
+        cache.get(('a',))
+        cache.put(('c',), b'1234')
+
+        self.assertIsNone(cache.get(('b',)))
+        self.assertEqual(cache.get(('a',)), b'1234')
+        self.assertEqual(cache.get_stats()['bytes'], 8)
+        cache.put(('huge',), b'x' * 11)
+        self.assertIsNone(cache.get(('huge',)))
+
+if __name__ == '__main__':
+    unittest.main()
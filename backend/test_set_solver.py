@@ -0,0 +1,112 @@
+#test_set_solver.py
+import unittest
+import shutil
+import tempfile
+from recommendation_engine import RecommendationEngine
+from set_solver import BuildabilitySolver
+from test_recommendation_engine import write_csv
+
+class TestBuildabilitySolver(unittest.TestCase):
+
+    def setUp(self):
+        # Big needs all the red 3001s; Left and Right share them with blue 3003s
+        self.temp_dir = tempfile.mkdtemp()
+        write_csv(self.temp_dir, 'colors', ['id', 'name', 'rgb', 'is_trans'], [
+            ['4', 'Red', 'C91A09', 'f'],
+            ['1', 'Blue', '0055BF', 'f']
+        ])
+        write_csv(self.temp_dir, 'sets', ['set_num', 'name', 'year', 'theme_id', 'num_parts', 'img_url'], [
+            ['big-1', 'Big', '2020', '1', '4', ''],
+            ['left-1', 'Left', '2020', '1', '3', ''],
+            ['right-1', 'Right', '2020', '1', '3', ''],
+            ['blue-1', 'Blue Tower', '2020', '1', '5', '']
+        ])
+        write_csv(self.temp_dir, 'inventories', ['id', 'version', 'set_num'], [
+            ['1', '1', 'big-1'], ['2', '1', 'left-1'], ['3', '1', 'right-1'], ['4', '1', 'blue-1']
+        ])
+        write_csv(self.temp_dir, 'inventory_parts',
+                  ['inventory_id', 'part_num', 'color_id', 'quantity', 'is_spare', 'img_url'], [
+            ['1', '3001', '4', '4', 'f', ''],
+            ['2', '3001', '4', '2', 'f', ''],
+            ['2', '3003', '1', '1', 'f', ''],
+            ['3', '3001', '4', '2', 'f', ''],
+            ['3', '3003', '1', '1', 'f', ''],
+            ['4', '3003', '1', '5', 'f', '']
+        ])
+        self.solver = BuildabilitySolver(RecommendationEngine(self.temp_dir))
+        self.bricks = [
+            {"id": "3001", "color": "Red", "quantity": 4},
+            {"id": "3003", "color": "Blue", "quantity": 2}
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_combination_respects_shared_quantities(self):
+        """Test chosen sets never need more bricks than the inventory holds together"""
+        result = self.solver.solve(self.bricks, objective='sets')
+
+        self.assertEqual(set(result['set_ids']), {'left-1', 'right-1'})
+        self.assertEqual(result['pieces_used'], 6)
+        self.assertEqual(result['pieces_left'], 0)
+        self.assertEqual(result['candidates'], 3)  #Blue Tower needs 5 blue bricks
+
+    def test_local_search_improves_warm_start(self):
+        """Test a swap replaces one set by two sets sharing its bricks"""
+        result = self.solver.solve(self.bricks, objective='sets', previous={"set_ids": ['big-1']})
+
+        self.assertTrue(result['warm_start'])
+        self.assertEqual(result['improvements'], 1)
+        self.assertEqual(set(result['set_ids']), {'left-1', 'right-1'})
+        self.assertEqual(result['upper_bound'], 2)
+
+    def test_incremental_resolve_after_inventory_change(self):
+        """Test sets that no longer fit are dropped when re-solving"""
+        first = self.solver.solve(self.bricks, objective='sets')
+        bricks = [{"id": "3001", "color": "Red", "quantity": 4}, {"id": "3003", "color": "Blue", "quantity": 1}]
+        result = self.solver.solve(bricks, objective='sets', previous=first)
+
+        self.assertEqual(result['sets_built'], 1)
+        self.assertIn(result['set_ids'][0], ('left-1', 'right-1'))
+        self.assertEqual(result['pieces_left'], 2)
+
+    def test_any_color_requirement_shares_colored_stock(self):
+        """Test an any-color requirement uses up the same bricks as colored ones"""
+        folder = tempfile.mkdtemp(dir=self.temp_dir)
+        write_csv(folder, 'colors', ['id', 'name', 'rgb', 'is_trans'], [['4', 'Red', 'C91A09', 'f']])
+        write_csv(folder, 'sets', ['set_num', 'name', 'year', 'theme_id', 'num_parts', 'img_url'], [
+            ['red-1', 'Red Wall', '2020', '1', '2', ''],
+            ['any-1', 'Any Wall', '2020', '1', '2', ''],
+            ['mixed-1', 'Mixed Wall', '2020', '1', '4', '']
+        ])
+        write_csv(folder, 'inventories', ['id', 'version', 'set_num'], [
+            ['1', '1', 'red-1'], ['2', '1', 'any-1'], ['3', '1', 'mixed-1']
+        ])
+        #Color 9999 is not in colors.csv, so it matches any color
+        write_csv(folder, 'inventory_parts',
+                  ['inventory_id', 'part_num', 'color_id', 'quantity', 'is_spare', 'img_url'], [
+            ['1', '3001', '4', '2', 'f', ''],
+            ['2', '3001', '9999', '2', 'f', ''],
+            ['3', '3001', '4', '2', 'f', ''],
+            ['3', '3001', '9999', '2', 'f', '']
+        ])
+        solver = BuildabilitySolver(RecommendationEngine(folder))
+
+        result = solver.solve([{"id": "3001", "color": "Red", "quantity": 3}], objective='sets')
+        self.assertEqual(result['sets_built'], 1)
+        self.assertEqual(result['candidates'], 2)  #Mixed Wall needs 4 bricks of the 3
+
+        result = solver.solve([{"id": "3001", "color": "Red", "quantity": 2},
+                               {"id": "3001", "color": "Green", "quantity": 2}], objective='sets')
+        self.assertEqual(set(result['set_ids']), {'red-1', 'any-1'})  #Green bricks go to the any-color set
+
+    def test_candidates_and_bad_objective(self):
+        """Test restricting candidates and rejecting unknown objectives"""
+        result = self.solver.solve(self.bricks, candidates=['big-1'], time_budget_ms=0)
+        self.assertEqual(result['set_ids'], ['big-1'])
+
+        with self.assertRaises(ValueError):
+            self.solver.solve(self.bricks, objective='fastest')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#test_upload_store.py
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO
+from unittest import mock
+from upload_store import UploadStore
+
+class TestUploadStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = UploadStore(self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_identical_content_stored_once(self):
+        """Test uploads are named by content hash and deduplicated"""
+        first = self.store.put(BytesIO(b'brick photo'), 'JPG')
+        second = self.store.put(b'brick photo', 'jpg')
+
+        self.assertEqual(first, second)
+        path = self.store.path(first)
+        self.assertEqual(path, os.path.join(self.temp_dir, first[:2], first[2:4], f"{first}.jpg"))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'brick photo')
+
+        stats = self.store.get_stats()
+        self.assertEqual(stats['blobs'], 1)
+        self.assertEqual(stats['dedup_hits'], 1)
+        self.assertEqual(os.listdir(self.store.tmp_dir), [])
+
+    def test_age_retention_skips_referenced_blobs(self):
+        """Test expired blobs are evicted unless something still references them"""
+        store = UploadStore(self.temp_dir, max_age_seconds=0)
+        kept = store.put(b'queued job image', 'jpg')
+        dropped = store.put(b'old upload', 'jpg')
+        store.acquire(kept)
+        time.sleep(0.01)
+
+        self.assertEqual(store.evict(), 1)
+        self.assertIsNone(store.path(dropped))
+        self.assertTrue(os.path.exists(store.path(kept)))
+
+        store.release(kept)
+        time.sleep(0.01)
+        self.assertEqual(store.evict(), 1)
+        self.assertEqual(store.get_stats()['evictions'], 2)
+
+    def test_size_retention_evicts_least_recently_used(self):
+        """Test the size budget evicts the least recently used blobs first"""
+        store = UploadStore(self.temp_dir, max_bytes=10)
+        oldest = store.put(b'a' * 6, 'png')
+        newest = store.put(b'b' * 6, 'png')
+
+        self.assertEqual(store.evict(), 1)
+        self.assertIsNone(store.path(oldest))
+        self.assertIsNotNone(store.path(newest))
+        self.assertEqual(store.get_stats()['disk_usage_bytes'], 6)
+
+    def test_size_budget_only_counts_unreferenced_blobs(self):
+        """Test referenced blobs over the budget do not force out unreferenced ones"""
+        store = UploadStore(self.temp_dir, max_bytes=10)
+        held = store.put(b'a' * 20, 'png')
+        store.acquire(held)
+        idle = store.put(b'b' * 6, 'png')
+
+        self.assertEqual(store.evict(), 0)
+        self.assertIsNotNone(store.path(idle))
+
+        store.put(b'c' * 6, 'png')
+        self.assertEqual(store.evict(), 1)
+        self.assertIsNone(store.path(idle))
+        self.assertIsNotNone(store.path(held))
+
+    def test_eviction_does_not_remove_concurrent_reupload(self):
+        """Test an upload of the same content during an eviction keeps its file"""
+        store = UploadStore(self.temp_dir, max_age_seconds=0)
+        digest = store.put(b'old upload', 'jpg')
+        path = store.path(digest)
+        time.sleep(0.01)
+        remove = os.remove
+        reuploads = []
+
+        def remove_after_reupload(target):
+            #Re-upload between the index delete and the file removal
+            if target == path and not reuploads:
+                reuploads.append(threading.Thread(target=store.put, args=(b'old upload', 'jpg')))
+                reuploads[0].start()
+                reuploads[0].join(0.5)
+            remove(target)
+
+        with mock.patch('upload_store.os.remove', remove_after_reupload):
+            self.assertEqual(store.evict(), 1)
+            reuploads[0].join()
+
+        self.assertEqual(store.path(digest), path)
+        self.assertTrue(os.path.exists(path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,283 @@
+# upload_store.py - Content-addressed storage for uploaded images
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadStore:
+    def __init__(self, root, max_bytes=5 * 1024 ** 3, max_age_seconds=30 * 24 * 60 * 60,
+                 eviction_interval=300):
+        """
+        Store uploads once per unique content, named by their SHA-256 hash
+
+        Blobs live in a sharded layout (root/ab/cd/abcd...jpg) and are written
+        to a temp file then renamed into place, so readers never see partial
+        files. An SQLite index tracks size, last use and reference counts.
+        Unreferenced blobs are evicted in the background once they are older
+        than max_age_seconds, or least recently used first while the store is
+        over max_bytes.
+
+        Args:
+            root: Directory holding the blobs and the index
+            max_bytes: Disk budget for unreferenced blobs
+            max_age_seconds: Unreferenced blobs unused for longer are deleted
+            eviction_interval: Seconds between background eviction passes
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.eviction_interval = eviction_interval
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.db_path = os.path.join(root, 'index.db')
+
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+        self._reset_after_fork()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+        self._create_schema()
+
+    def _reset_after_fork(self):
+        # Threads and SQLite connections must not be shared across fork
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._evictor = None
+        self._stored = 0
+        self._dedup_hits = 0
+        self._evictions = 0
+        self._bytes_evicted = 0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        self._connect().executescript('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                extension TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_blobs_evict ON blobs (refcount, last_used);
+        ''')
+
+    def _blob_path(self, digest, extension):
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.{extension}")
+
+    def put(self, fileobj, extension, hold=False):
+        """
+        Store the contents of a file-like object (or bytes)
+        Returns the blob digest; identical content is only stored once
+        With hold=True the blob is also acquire()d in the same step, so it
+        cannot be evicted before the caller is done with it.
+        """
+        self._ensure_evictor()
+        extension = extension.lower().lstrip('.')
+        if isinstance(fileobj, (bytes, bytearray)):
+            data, fileobj = fileobj, None
+
+        # Hash while copying to a temp file so large uploads are never held in memory
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                chunks = iter(lambda: fileobj.read(CHUNK_SIZE), b'') if fileobj else [data]
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+
+            digest = hasher.hexdigest()
+            now = time.time()
+
+            # Index row and file change in one write transaction, which an
+            # eviction deleting the same digest (in any process) waits for
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = conn.execute(
+                    '''INSERT INTO blobs (digest, extension, size, refcount, created_at, last_used)
+                       VALUES (?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(digest) DO UPDATE SET last_used = excluded.last_used,
+                           refcount = refcount + excluded.refcount
+                       RETURNING extension, created_at''',
+                    (digest, extension, size, int(hold), now, now)
+                )
+                row = cursor.fetchone()
+                cursor.close()
+                path = self._blob_path(digest, row['extension'])
+
+                stored = row['created_at'] == now or not os.path.exists(path)
+                if stored:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp_path, path)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+            if not stored:
+                os.remove(tmp_path)
+            with self._lock:
+                if stored:
+                    self._stored += 1
+                else:
+                    self._dedup_hits += 1
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return digest
+
+    def path(self, digest):
+        """Filesystem path of a stored blob, or None if unknown"""
+        row = self._connect().execute(
+            'SELECT extension FROM blobs WHERE digest = ?', (digest,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._blob_path(digest, row['extension'])
+
+    def digest(self, path):
+        """Digest of a blob from its path() (None for files outside the store)"""
+        if not isinstance(path, str):
+            return None
+        digest, extension = os.path.splitext(os.path.basename(path))
+        if path != self._blob_path(digest, extension.lstrip('.')):
+            return None
+        return digest
+
+    def filename(self, digest):
+        """File name of a stored blob (digest plus extension)"""
+        path = self.path(digest)
+        return os.path.basename(path) if path else None
+
+    def acquire(self, digest):
+        """Add a reference; referenced blobs are never evicted"""
+        self._connect().execute(
+            'UPDATE blobs SET refcount = refcount + 1, last_used = ? WHERE digest = ?',
+            (time.time(), digest)
+        )
+
+    def release(self, digest):
+        """Drop a reference taken with acquire()"""
+        self._connect().execute(
+            'UPDATE blobs SET refcount = MAX(refcount - 1, 0), last_used = ? WHERE digest = ?',
+            (time.time(), digest)
+        )
+
+    def _ensure_evictor(self):
+        with self._lock:
+            if self._evictor is None or not self._evictor.is_alive():
+                self._evictor = threading.Thread(
+                    target=self._run_evictor, name='upload-evictor', daemon=True
+                )
+                self._evictor.start()
+
+    def _run_evictor(self):
+        while True:
+            time.sleep(self.eviction_interval)
+            try:
+                self.evict()
+            except sqlite3.Error:
+                pass  # Retried on the next pass
+
+    def _delete(self, conn, digest, extension, size, last_used):
+        # Row and file go in one write transaction, so a put() of the same
+        # content cannot store a fresh file in between that is then removed
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Only delete if nobody acquired or re-uploaded the blob since it was selected
+            cursor = conn.execute(
+                'DELETE FROM blobs WHERE digest = ? AND refcount = 0 AND last_used = ?',
+                (digest, last_used)
+            )
+            deleted = cursor.rowcount == 1
+            if deleted:
+                try:
+                    os.remove(self._blob_path(digest, extension))
+                except FileNotFoundError:
+                    pass
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if not deleted:
+            return 0
+
+        with self._lock:
+            self._evictions += 1
+            self._bytes_evicted += size
+        return size
+
+    def evict(self):
+        """Apply the age and size retention policy; returns the number of blobs removed"""
+        conn = self._connect()
+        removed = 0
+
+        expired = conn.execute(
+            'SELECT digest, extension, size, last_used FROM blobs WHERE refcount = 0 AND last_used < ?',
+            (time.time() - self.max_age_seconds,)
+        ).fetchall()
+        for row in expired:
+            removed += bool(self._delete(conn, *row))
+
+        # Referenced blobs cannot be evicted, so they do not count against the budget
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs WHERE refcount = 0').fetchone()[0]
+        if total > self.max_bytes:
+            candidates = conn.execute(
+                'SELECT digest, extension, size, last_used FROM blobs WHERE refcount = 0 ORDER BY last_used'
+            ).fetchall()
+            for row in candidates:
+                if total <= self.max_bytes:
+                    break
+                freed = self._delete(conn, *row)
+                total -= freed
+                removed += bool(freed)
+
+        # Temp files left behind by a crash mid-upload
+        cutoff = time.time() - 3600
+        for name in os.listdir(self.tmp_dir):
+            tmp_path = os.path.join(self.tmp_dir, name)
+            if os.path.getmtime(tmp_path) < cutoff:
+                os.remove(tmp_path)
+
+        return removed
+
+    def get_stats(self):
+        """Disk usage, dedup and eviction counts"""
+        row = self._connect().execute(
+            '''SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refcount > 0), 0)
+               FROM blobs'''
+        ).fetchone()
+
+        with self._lock:
+            return {
+                "blobs": row[0],
+                "disk_usage_bytes": row[1],
+                "referenced_blobs": row[2],
+                "max_bytes": self.max_bytes,
+                "max_age_seconds": self.max_age_seconds,
+                "disk_free_bytes": shutil.disk_usage(self.root).free,
+                "stored": self._stored,
+                "dedup_hits": self._dedup_hits,
+                "evictions": self._evictions,
+                "bytes_evicted": self._bytes_evicted
+            }
@@ -152,11 +152,58 @@ class ApiService {
     }
   }
 
+  //Last inventory response and its ETag, reused when the server answers 304
+  static String? _inventoryEtag;
+  static Map<String, dynamic>? _inventoryCache;
+
   //Get user inventory from backend with timeout
-  static Future<Map<String, dynamic>> getInventory() async {
+  //Pass the previous page's next_cursor to fetch the following page
+  static Future<Map<String, dynamic>> getInventory({String? cursor}) async {
+    try {
+      final uri = Uri.parse('$baseUrl/inventory').replace(
+        queryParameters: cursor != null ? {'cursor': cursor} : null,
+      );
+      final headers = {'Accept': 'application/json'};
+      final revalidate = cursor == null && _inventoryEtag != null && _inventoryCache != null;
+      if (revalidate) {
+        headers['If-None-Match'] = _inventoryEtag!;
+      }
+
+      final response = await http.get(uri, headers: headers).timeout(timeout);
+      
+      if (response.statusCode == 304 && revalidate) {
+        return _inventoryCache!; //Unchanged since last refresh
+      } else if (response.statusCode == 200) {
+        final Map<String, dynamic> data = json.decode(response.body);
+        if (cursor == null) {
+          _inventoryEtag = response.headers['etag'];
+          _inventoryCache = data;
+        }
+        return data;
+      } else {
+        return {
+          'error': 'Server returned status ${response.statusCode}'
+        };
+      }
+    } on SocketException {
+      return {'error': 'Cannot connect to server'};
+    } on TimeoutException {
+      return {'error': 'Connection timed out'};
+    } catch (e) {
+      return {
+        'error': 'Failed to fetch inventory: $e'
+      };
+    }
+  }
+
+  //Get inventory changes since the last sync token
+  //If the response has full_resync == true, reload with getInventory() and keep the new sync_token
+  static Future<Map<String, dynamic>> syncInventory(String? syncToken) async {
     try {
       final response = await http.get(
-        Uri.parse('$baseUrl/inventory'),
+        Uri.parse('$baseUrl/inventory/sync').replace(
+          queryParameters: syncToken != null ? {'token': syncToken} : null,
+        ),
         headers: {'Accept': 'application/json'},
       ).timeout(timeout);
       
@@ -173,7 +220,7 @@ class ApiService {
       return {'error': 'Connection timed out'};
     } catch (e) {
       return {
-        'error': 'Failed to fetch inventory: $e'
+        'error': 'Failed to sync inventory: $e'
       };
     }
   }
@@ -314,6 +361,32 @@ class ApiService {
     }
   }
 
+  //Get information for many bricks in one request (e.g. a results screen)
+  static Future<Map<String, dynamic>> getBricksInfo(List<String> brickIds) async {
+    try {
+      final response = await http.get(
+        Uri.parse('$baseUrl/bricks').replace(queryParameters: {'ids': brickIds.join(',')}),
+        headers: {'Accept': 'application/json'},
+      ).timeout(timeout);
+      
+      if (response.statusCode == 200) {
+        return json.decode(response.body);
+      } else {
+        return {
+          'error': 'Failed to get brick info (${response.statusCode})'
+        };
+      }
+    } on SocketException {
+      return {'error': 'Cannot connect to server'};
+    } on TimeoutException {
+      return {'error': 'Connection timed out'};
+    } catch (e) {
+      return {
+        'error': 'Failed to get brick info: $e'
+      };
+    }
+  }
+
   //Get Lego set information by set ID
   static Future<Map<String, dynamic>> getSetInfo(String setId) async {
     try {